@@ -1,36 +1,41 @@
-import numpy as np
-import torch
-
-np.random.seed(42)
-torch.manual_seed(42)
-
-from transformers import GPT2LMHeadModel, GPT2Tokenizer
-
-def load_tokenizer_and_model(model_name_or_path):
-  return GPT2Tokenizer.from_pretrained(model_name_or_path), GPT2LMHeadModel.from_pretrained(model_name_or_path).cuda()
-
-
-def generate(
-    model, tok, text,
-    do_sample=True, max_length=50, repetition_penalty=5.0,
-    top_k=5, top_p=0.95, temperature=1,
-    num_beams=None,
-    no_repeat_ngram_size=3
-    ):
-  input_ids = tok.encode(text, return_tensors="pt").cuda()
-  out = model.generate(
-      input_ids.cuda(),
-      max_length=max_length,
-      repetition_penalty=repetition_penalty,
-      do_sample=do_sample,
-      top_k=top_k, top_p=top_p, temperature=temperature,
-      num_beams=num_beams, no_repeat_ngram_size=no_repeat_ngram_size
-      )
-  return list(map(tok.decode, out))
-
-tok, model = load_tokenizer_and_model("sberbank-ai/rugpt3small_based_on_gpt2")
-#tok, model = load_tokenizer_and_model("sberbank-ai/rugpt3large_based_on_gpt2")
-generated = generate(model, tok, "Александр Сергеевич Пушкин родился в ", num_beams=10)
-
-
-print(generated[0])
\ No newline at end of file
+import argparse
+import os
+import sys
+
+# Загрузка и генерация общие с системой чантинга (chant/local_backend.py)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "chant"))
+
+from local_backend import (load_tokenizer_and_model, generate, resolve_model, set_num_threads, set_quantization,
+                           QUANTIZE_MODES)
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Генерация ruGPT-3 на CPU")
+  parser.add_argument("--model", default="rugptsmall",
+                      help="rugptsmall, rugptlarge, имя модели Hugging Face или путь к обученной модели")
+  parser.add_argument("--device", default="cpu", help="Устройство torch (cpu или cuda)")
+  parser.add_argument("--threads", type=int, help="Потоков torch на CPU")
+  parser.add_argument("--quantize", choices=QUANTIZE_MODES, help="int8-квантизация на CPU")
+  parser.add_argument("--num-beams", type=int, default=10)
+  parser.add_argument("--max-length", type=int, default=50)
+  parser.add_argument("text", nargs="?", default="Александр Сергеевич Пушкин родился в ")
+  args = parser.parse_args()
+
+  # torch импортируется только при запуске, не при импорте модуля
+  import numpy as np
+  import torch
+
+  np.random.seed(42)
+  torch.manual_seed(42)
+
+  set_num_threads(args.threads)
+  set_quantization(args.quantize)
+  tok, model = load_tokenizer_and_model(resolve_model(args.model), args.device)
+  generated = generate(model, tok, args.text, max_length=args.max_length, device=args.device,
+                       num_beams=args.num_beams)
+
+  print(generated[0])
+
+
+if __name__ == "__main__":
+  main()
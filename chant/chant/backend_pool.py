@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+"""
+Backend Pool - пул серверов Ollama с проверкой здоровья и переключением при сбоях
+Запросы распределяются по весам между здоровыми серверами, число одновременных
+запросов к каждому ограничено, у каждого сервера свой автомат защиты (circuit_breaker.py):
+после сбоев подряд запросы к серверу не отправляются, пока не пройдет пробный
+"""
+
+import logging
+import random
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple, TypeVar, Union
+
+import requests
+
+from circuit_breaker import CircuitBreaker, CLOSED, OPEN, DEFAULT_BASE_DELAY, DEFAULT_MAX_DELAY
+from config_loader import config_path, load_json
+from dispatch import Ewma
+from local_backend import is_local, mount as mount_local
+from ollama_client import DEFAULT_CONNECT_TIMEOUT, get_session
+
+logger = logging.getLogger(__name__)
+
+# Период фоновой проверки /api/tags (с)
+DEFAULT_PROBE_INTERVAL = 10.0
+
+# Подряд неудачных запросов, после которых автомат защиты сервера размыкается
+DEFAULT_FAILURE_THRESHOLD = 3
+
+# Сколько ждать свободного места на серверах (с)
+DEFAULT_ACQUIRE_TIMEOUT = 60.0
+
+# Конфиг с адресом сервера (chant/config/global.json)
+GLOBAL_CONFIG = config_path("global.json")
+
+T = TypeVar("T")
+
+BackendSpec = Union[str, Dict]
+
+
+class NoBackendAvailable(requests.exceptions.ConnectionError):
+    """
+    Нет сервера, способного принять запрос
+
+    retry_after - через сколько секунд автомат защиты одного из серверов
+    пропустит запрос (0 - серверы заняты, а не отключены).
+    """
+
+    def __init__(self, message: str, retry_after: float = 0.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def is_backend_failure(error: BaseException) -> bool:
+    """Ошибка сервера (соединение, таймаут, HTTP 5xx), а не запроса - повод переключиться"""
+    if isinstance(error, requests.exceptions.HTTPError):
+        response = error.response
+        return response is None or response.status_code >= 500
+    return isinstance(error, requests.exceptions.RequestException)
+
+
+class Backend:
+    """Один сервер Ollama: вес, лимит одновременных запросов и состояние"""
+
+    def __init__(self, url: str, weight: float = 1.0, max_concurrency: int = 4):
+        if weight <= 0:
+            raise ValueError(f"Вес сервера должен быть больше 0: {url}={weight}")
+        self.url = url.rstrip('/')
+        self.weight = weight
+        self.max_concurrency = max(1, max_concurrency)
+        self.session = get_session(self.url, self.max_concurrency)
+        self.local = is_local(self.url)  # Модель в процессе: отвечает на любое имя модели
+        self.healthy = True  # Результат последней проверки /api/tags; до первой - здоров
+        self.breaker = CircuitBreaker(DEFAULT_FAILURE_THRESHOLD)
+        self.models: List[str] = []
+        self.in_flight = 0
+        self.requests = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+        self.latency = Ewma()
+
+    def load(self) -> float:
+        """Нагрузка с учетом веса: сервер с весом 2 получает вдвое больше запросов"""
+        return (self.in_flight + 1) / self.weight
+
+    def get_stats(self) -> Dict:
+        return {
+            "healthy": self.healthy,
+            "weight": self.weight,
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "requests": self.requests,
+            "failures": self.failures,
+            "latency_ewma": self.latency.value,
+            "last_error": self.last_error,
+            "breaker": self.breaker.get_stats()
+        }
+
+
+def split_backend_spec(spec: BackendSpec) -> Tuple[str, float, Optional[int]]:
+    """
+    (URL, вес, лимит) из строки "URL" или "URL=ВЕС" либо из словаря {"url", "weight", "max_concurrency"}
+    """
+    if isinstance(spec, dict):
+        limit = spec.get("max_concurrency")
+        return spec["url"], float(spec.get("weight", 1.0)), int(limit) if limit is not None else None
+    url, sep, weight = spec.rpartition("=")
+    if sep and "/" not in weight:
+        return url, float(weight), None
+    return spec, 1.0, None
+
+
+def parse_backend_spec(spec: BackendSpec, max_concurrency: int) -> Backend:
+    """Сервер по описанию; лимит из описания важнее max_concurrency"""
+    url, weight, limit = split_backend_spec(spec)
+    return Backend(url, weight, limit or max_concurrency)
+
+
+def backends_from_config(path: str = GLOBAL_CONFIG) -> List[BackendSpec]:
+    """
+    Серверы из конфига: список "backends" или адрес server.url
+
+    Конфиг пишется вручную, висячие запятые допускаются.
+    """
+    config = load_json(path)
+    specs = list(config.get("backends", []))
+    url = config.get("server", {}).get("url")
+    if url and url not in specs:
+        specs.append(url)
+    return specs
+
+
+class BackendPool:
+    """
+    Пул серверов Ollama
+
+    Args:
+        backends: Серверы
+        probe_interval: Период проверки здоровья (0 - только при запуске)
+        failure_threshold: Подряд неудачных запросов до размыкания автомата защиты сервера
+        acquire_timeout: Сколько ждать свободного места на серверах
+        breaker_base_delay: Пауза автомата после первого размыкания (с)
+        breaker_max_delay: Предел паузы автомата (с)
+    """
+
+    def __init__(self, backends: Sequence[Backend], probe_interval: float = DEFAULT_PROBE_INTERVAL,
+                 failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+                 acquire_timeout: float = DEFAULT_ACQUIRE_TIMEOUT,
+                 breaker_base_delay: float = DEFAULT_BASE_DELAY, breaker_max_delay: float = DEFAULT_MAX_DELAY):
+        if not backends:
+            raise ValueError("Пул серверов пуст")
+        self.backends = list(backends)
+        self.probe_interval = probe_interval
+        self.failure_threshold = failure_threshold
+        self.acquire_timeout = acquire_timeout
+        for backend in self.backends:
+            backend.breaker = CircuitBreaker(failure_threshold, breaker_base_delay, breaker_max_delay)
+        self.failovers = 0
+        self._condition = threading.Condition()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        # Отдельная сессия: проверка не ждет соединение, занятое генерацией
+        self._probe_session = mount_local(requests.Session())
+
+    @classmethod
+    def from_specs(cls, specs: Iterable[BackendSpec], max_concurrency: int,
+                   probe_interval: float = DEFAULT_PROBE_INTERVAL, **kwargs) -> "BackendPool":
+        """Пул из строк "URL=ВЕС" или словарей конфига; kwargs - параметры BackendPool"""
+        return cls([parse_backend_spec(spec, max_concurrency) for spec in specs], probe_interval, **kwargs)
+
+    def start(self) -> "BackendPool":
+        """Проверяет серверы и запускает фоновую проверку (повторный вызов только проверяет)"""
+        self.probe()
+        if self.probe_interval > 0 and self._thread is None:
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._probe_loop, name="BackendProbe", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """Остановка фоновой проверки"""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self._probe_session.close()
+
+    def probe(self):
+        """Запрашивает /api/tags у каждого сервера и обновляет здоровье и список моделей"""
+        for backend in self.backends:
+            try:
+                # Новое соединение на каждую проверку: живой keep-alive сокет не означает живой сервер
+                response = self._probe_session.get(f"{backend.url}/api/tags", timeout=(DEFAULT_CONNECT_TIMEOUT, 5),
+                                                   headers={"Connection": "close"})
+                response.raise_for_status()
+                models = [model.get('name', '') for model in response.json().get('models', [])]
+                error = None
+            except (requests.exceptions.RequestException, ValueError) as e:
+                models, error = [], str(e)
+            with self._condition:
+                if error is None:
+                    if not backend.healthy:
+                        logger.info(f"Сервер {backend.url} снова доступен")
+                        # Сервер вернулся после неудачной проверки: пробный запрос - не дожидаясь
+                        # конца паузы автомата. Живой /api/tags у перегруженного сервера паузу не сокращает
+                        backend.breaker.half_open()
+                    backend.healthy = True
+                    backend.models = models
+                else:
+                    if backend.healthy:
+                        logger.warning(f"Сервер {backend.url} не прошел проверку: {error}")
+                    backend.healthy = False
+                    backend.last_error = error
+                self._condition.notify_all()
+
+    def _probe_loop(self):
+        while not self._stop_event.wait(self.probe_interval):
+            self.probe()
+
+    def healthy_backends(self) -> List[Backend]:
+        with self._condition:
+            return [backend for backend in self.backends if backend.healthy]
+
+    def has_model(self, model: str) -> bool:
+        """Модель есть хотя бы на одном здоровом сервере"""
+        return any(backend.local or any(model in name for name in backend.models)
+                   for backend in self.healthy_backends())
+
+    def _candidates(self, exclude: Sequence[Backend]) -> List[Backend]:
+        """Серверы, чей автомат защиты пропускает запрос; здоровые по проверке - в первую очередь"""
+        candidates = [backend for backend in self.backends
+                      if backend not in exclude and backend.breaker.available()]
+        # Если проверка не прошла у всех, пробуем и их: она могла отстать от восстановления
+        return [backend for backend in candidates if backend.healthy] or candidates
+
+    def _choose(self, candidates: Sequence[Backend]) -> Optional[Backend]:
+        free = [backend for backend in candidates if backend.in_flight < backend.max_concurrency]
+        if not free:
+            return None
+        return min(free, key=lambda backend: (backend.load(), random.random()))
+
+    def retry_after(self, exclude: Sequence[Backend] = ()) -> float:
+        """Через сколько секунд какой-нибудь сервер снова примет запрос"""
+        return min((backend.breaker.retry_after() for backend in self.backends if backend not in exclude),
+                   default=0.0)
+
+    def acquire(self, exclude: Sequence[Backend] = ()) -> Backend:
+        """
+        Занимает место на наименее загруженном (с учетом веса) здоровом сервере
+
+        Ждет, пока на каком-нибудь сервере освободится место; если автоматы
+        защиты всех серверов разомкнуты, не ждет и не отправляет запрос.
+
+        Raises:
+            NoBackendAvailable: Все серверы исключены или отключены автоматом, либо ожидание истекло
+        """
+        if all(backend in exclude for backend in self.backends):
+            raise NoBackendAvailable("Все серверы Ollama уже опробованы")
+        deadline = time.monotonic() + self.acquire_timeout
+        with self._condition:
+            while True:
+                candidates = self._candidates(exclude)
+                if not candidates:
+                    retry_after = self.retry_after(exclude)
+                    raise NoBackendAvailable(f"Серверы Ollama отключены автоматом защиты, "
+                                             f"повтор через {retry_after:.1f}s", retry_after)
+                backend = self._choose(candidates)
+                if backend is not None and backend.breaker.allow():
+                    backend.in_flight += 1
+                    return backend
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise NoBackendAvailable("Нет свободного места на серверах Ollama")
+                self._condition.wait(remaining)
+
+    def release(self, backend: Backend, ok: Optional[bool], elapsed: Optional[float] = None,
+                error: Optional[BaseException] = None):
+        """
+        Освобождает место; подряд идущие сбои размыкают автомат защиты сервера
+
+        ok=None - исход не говорит о здоровье сервера (HTTP 4xx, прерывание генерации):
+        автомат не замыкается и не размыкается, только освобождает пробное место.
+        """
+        with self._condition:
+            backend.in_flight -= 1
+            backend.requests += 1
+            if ok is None:
+                backend.breaker.release_trial()
+            elif ok:
+                if backend.breaker.state != CLOSED:
+                    logger.info(f"Сервер {backend.url} снова принимает запросы")
+                backend.breaker.record_success()
+                if elapsed is not None:
+                    backend.latency.update(elapsed)
+            else:
+                backend.failures += 1
+                backend.last_error = str(error) if error else None
+                failures = backend.breaker.consecutive_failures + 1
+                delay = backend.breaker.record_failure()
+                if delay is not None:
+                    logger.warning(f"Сервер {backend.url} отключен на {delay:.1f}s после "
+                                   f"{failures} сбоев подряд: {error}")
+            self._condition.notify_all()
+
+    def call(self, fn: Callable[[Backend], T]) -> T:
+        """
+        Выполняет fn(backend), при сбое сервера повторяет на следующем
+
+        Ошибки запроса (HTTP 4xx, прерывание генерации и т.п.) не вызывают
+        переключения и пробрасываются сразу.
+        """
+        tried: List[Backend] = []
+        last_error: Optional[BaseException] = None
+        while True:
+            try:
+                backend = self.acquire(tried)
+            except NoBackendAvailable:
+                if last_error is not None:
+                    raise last_error
+                raise
+            started = time.perf_counter()
+            try:
+                result = fn(backend)
+            except Exception as e:
+                failed = is_backend_failure(e)
+                self.release(backend, False if failed else None, error=e)
+                if not failed:
+                    raise
+                tried.append(backend)
+                last_error = e
+                if len(tried) < len(self.backends):
+                    with self._condition:
+                        self.failovers += 1
+                    logger.warning(f"Сервер {backend.url} не ответил ({e}), повтор на другом сервере")
+                continue
+            self.release(backend, True, time.perf_counter() - started)
+            return result
+
+    def get_stats(self) -> Dict:
+        with self._condition:
+            return {
+                "healthy": sum(1 for backend in self.backends if backend.healthy),
+                "open": sum(1 for backend in self.backends if backend.breaker.state == OPEN),
+                "total": len(self.backends),
+                "failovers": self.failovers,
+                "servers": {backend.url: backend.get_stats() for backend in self.backends}
+            }
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Benchmark Batch - подбор размера пакета чантинга: повторений мантры в секунду
+для разных размеров пакета и числа одновременных запросов
+"""
+
+import logging
+from typing import Dict, List
+
+from chant_batch import MALA_SIZE
+from chant_mantra import ChantMantra
+
+DEFAULT_BATCH_SIZES = [1, 4, 9, 27, 54, 108]
+
+
+def run_sweep(chanter: ChantMantra, batch_sizes: List[int], concurrency_levels: List[int],
+              rounds: int) -> List[Dict]:
+    """
+    Отправляет rounds кругов четок для каждого сочетания пакета и параллельности
+
+    Returns:
+        Список результатов chant_round с параметрами замера
+    """
+    results = []
+    for concurrency in concurrency_levels:
+        for batch_size in batch_sizes:
+            result = chanter.chant_round(MALA_SIZE * rounds, batch_size, concurrency)
+            result.update(batch_size=batch_size, concurrency=concurrency)
+            results.append(result)
+            print(f"📊 пакет {batch_size:>3}, параллельно {concurrency}: "
+                  f"{result['repetitions_per_second']:.1f} повторений/с "
+                  f"({result['calls']} вызовов за {result['elapsed']:.1f}s, неудачных {result['failed_calls']})")
+    return results
+
+
+def main():
+    """Основная функция"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Бенчмарк пакетного чантинга")
+    parser.add_argument("--url", default="http://localhost:11434", help="URL Ollama сервера")
+    parser.add_argument("--model", default="mozgach:latest", help="Название модели")
+    parser.add_argument("--language", default="russianscsm", help="Язык махамантры")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=DEFAULT_BATCH_SIZES,
+                        help=f"Размеры пакета для замера (1-{MALA_SIZE})")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2],
+                        help="Число одновременных запросов для замера")
+    parser.add_argument("--rounds", type=int, default=1, help="Кругов четок на каждый замер")
+
+    args = parser.parse_args()
+
+    # Логи каждого запроса мешают читать таблицу результатов
+    logging.getLogger().setLevel(logging.WARNING)
+
+    chanter = ChantMantra(args.url, args.model, args.language)
+    if not chanter.check_model_availability():
+        raise SystemExit("❌ Модель недоступна. Проверьте настройки Ollama.")
+
+    # Прогрев: первая генерация загружает модель в память
+    chanter.send_mantra()
+
+    print(f"🚀 Замер: {args.rounds} круг(ов) по {MALA_SIZE} повторений на сочетание параметров")
+    results = run_sweep(chanter, args.batch_sizes, args.concurrency, args.rounds)
+
+    best = max(results, key=lambda r: r["repetitions_per_second"] or 0)
+    baseline = next((r for r in results if r["batch_size"] == 1 and r["concurrency"] == 1), None)
+    print(f"🏆 Лучший вариант: пакет {best['batch_size']}, параллельно {best['concurrency']} - "
+          f"{best['repetitions_per_second']:.1f} повторений/с")
+    if baseline and baseline["repetitions_per_second"]:
+        print(f"⚡ Ускорение относительно поштучного чантинга: "
+              f"{best['repetitions_per_second'] / baseline['repetitions_per_second']:.1f}x")
+    print(f"💡 Запуск: python3 chant_multithread.py --chant-batch {best['batch_size']}")
+
+
+if __name__ == "__main__":
+    main()
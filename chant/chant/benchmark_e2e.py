@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+Benchmark E2E - сквозной бенчмарк системы чантинга на локальной заглушке Ollama
+ChantManager, ChantMantra.continuous_chant и CursorRequestTester против fake_ollama.py;
+результат (чантов/с, p50/p95/p99 курсора, загрузка CPU) - JSON для сравнения версий
+"""
+
+import contextlib
+import io
+import json
+import logging
+import os
+import platform
+import resource
+import socket
+import subprocess
+import sys
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+import requests
+
+from chant_mantra import ChantMantra
+from chant_multithread import ChantManager
+from test_cursor_requests import CursorRequestTester
+
+FAKE_OLLAMA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_ollama.py")
+MODEL = "mozgach:latest"
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Перцентиль по ближайшему рангу (q от 0 до 100)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, int(round(q / 100 * len(ordered) + 0.5)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def summarize_latencies(values: List[float]) -> Dict:
+    """Сводка задержек в секундах"""
+    return {
+        "count": len(values),
+        "mean": sum(values) / len(values) if values else None,
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": max(values) if values else None
+    }
+
+
+@contextlib.contextmanager
+def measure_cpu(result: Dict):
+    """Процессорное время клиента (user + sys) и его доля от настенного времени"""
+    before = resource.getrusage(resource.RUSAGE_SELF)
+    started = time.perf_counter()
+    yield
+    elapsed = time.perf_counter() - started
+    after = resource.getrusage(resource.RUSAGE_SELF)
+    cpu = (after.ru_utime - before.ru_utime) + (after.ru_stime - before.ru_stime)
+    result.update(elapsed=elapsed, cpu_seconds=cpu, cpu_percent=100 * cpu / elapsed if elapsed else None)
+
+
+class FakeOllamaProcess:
+    """Заглушка Ollama в отдельном процессе, чтобы её CPU не смешивался с клиентским"""
+
+    def __init__(self, latency: float, token_rate: float, failure_rate: float, seed: int = 1):
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            self.port = sock.getsockname()[1]
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.args = [sys.executable, FAKE_OLLAMA, "--port", str(self.port), "--latency", str(latency),
+                     "--token-rate", str(token_rate), "--failure-rate", str(failure_rate), "--seed", str(seed)]
+        self.process: Optional[subprocess.Popen] = None
+
+    def __enter__(self):
+        self.process = subprocess.Popen(self.args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        deadline = time.time() + 10
+        while time.time() < deadline:
+            try:
+                requests.get(f"{self.url}/api/tags", timeout=1)
+                return self
+            except requests.exceptions.ConnectionError:
+                time.sleep(0.05)
+        self.process.kill()
+        raise RuntimeError("Заглушка Ollama не запустилась")
+
+    def __exit__(self, *exc):
+        self.process.terminate()
+        self.process.wait(timeout=5)
+
+
+def bench_manager(url: str, duration: float, cursor_rate: float, languages: List[str]) -> Dict:
+    """ChantManager: чантинг в потоках и запросы курсора с фиксированной частотой"""
+    manager = ChantManager(url, languages=languages, cache_size=0)
+    if not manager.start():
+        raise RuntimeError("Не удалось запустить ChantManager")
+
+    latencies: List[float] = []
+    errors = []
+    lock = threading.Lock()
+
+    def on_done(sent: float) -> Callable:
+        def callback(future):
+            with lock:
+                if future.exception() is None:
+                    latencies.append(time.perf_counter() - sent)
+                else:
+                    errors.append(str(future.exception()))
+        return callback
+
+    result: Dict = {}
+    try:
+        before = {w.thread_id: w.chant_counter.get_stats() for w in manager.workers.values()}
+        with measure_cpu(result):
+            futures = []
+            deadline = time.perf_counter() + duration
+            index = 0
+            while time.perf_counter() < deadline:
+                sent = time.perf_counter()
+                future = manager.send_request(f"Запрос курсора номер {index}")
+                future.add_done_callback(on_done(sent))
+                futures.append(future)
+                index += 1
+                time.sleep(1.0 / cursor_rate)
+            for future in futures:
+                with contextlib.suppress(Exception):
+                    future.result(timeout=60)
+        after = {w.thread_id: w.chant_counter.get_stats() for w in manager.workers.values()}
+    finally:
+        manager.stop()
+
+    chants = sum(after[i]["calls"] - before[i]["calls"] for i in after)
+    repetitions = sum(after[i]["repetitions"] - before[i]["repetitions"] for i in after)
+    result.update(
+        workers=len(languages),
+        chants=chants,
+        chants_per_second=chants / result["elapsed"],
+        repetitions_per_second=repetitions / result["elapsed"],
+        cursor_requests=len(futures),
+        cursor_errors=len(errors),
+        cursor_latency=summarize_latencies(latencies)
+    )
+    return result
+
+
+def bench_chant_mantra(url: str, chants: int) -> Dict:
+    """ChantMantra.continuous_chant без пауз между запросами"""
+    chanter = ChantMantra(url, MODEL)
+    result: Dict = {}
+    with measure_cpu(result):
+        chanter.continuous_chant(interval=0, max_requests=chants)
+    stats = chanter.counter.get_stats()
+    result.update(
+        chants=stats["calls"],
+        errors=stats["lost_calls"],
+        chants_per_second=stats["calls"] / result["elapsed"]
+    )
+    return result
+
+
+def bench_cursor_tester(url: str, count: int) -> Dict:
+    """CursorRequestTester: последовательные запросы с ротацией языков"""
+    tester = CursorRequestTester(url)
+    latencies = []
+    errors = 0
+    result: Dict = {}
+    # Тестер печатает каждый запрос и ответ - в JSON-отчете это не нужно
+    with measure_cpu(result), contextlib.redirect_stdout(io.StringIO()):
+        for i in range(count):
+            language = tester.languages[i % len(tester.languages)]
+            prompts = tester.test_requests[language]
+            started = time.perf_counter()
+            if tester.send_test_request(prompts[(i // len(tester.languages)) % len(prompts)]):
+                latencies.append(time.perf_counter() - started)
+            else:
+                errors += 1
+    result.update(requests=count, errors=errors, latency=summarize_latencies(latencies))
+    return result
+
+
+def git_revision() -> Optional[str]:
+    """Текущий коммит, чтобы сравнивать отчеты разных версий"""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(FAKE_OLLAMA), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    """Основная функция"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Сквозной бенчмарк системы чантинга на заглушке Ollama")
+    parser.add_argument("--latency", type=float, default=0.05, help="Задержка заглушки до первого токена (с)")
+    parser.add_argument("--token-rate", type=float, default=200.0, help="Скорость генерации заглушки (токенов/с)")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Доля запросов с ошибкой HTTP 500")
+    parser.add_argument("--duration", type=float, default=10.0, help="Длительность сценария ChantManager (с)")
+    parser.add_argument("--cursor-rate", type=float, default=5.0, help="Запросов курсора в секунду")
+    parser.add_argument("--languages", nargs="+", default=["russianscsm", "thai", "harkonnen"],
+                        help="Языки потоков ChantManager")
+    parser.add_argument("--chants", type=int, default=100, help="Чантов в сценарии ChantMantra")
+    parser.add_argument("--cursor-requests", type=int, default=50, help="Запросов в сценарии CursorRequestTester")
+    parser.add_argument("--scenarios", nargs="+", default=["manager", "chant_mantra", "cursor_tester"],
+                        choices=["manager", "chant_mantra", "cursor_tester"], help="Сценарии для запуска")
+    parser.add_argument("--output", help="Файл для JSON-отчета (по умолчанию - stdout)")
+
+    args = parser.parse_args()
+
+    # Ошибки, вызванные инъекцией сбоев, учитываются в отчете - в логе они только мешают
+    logging.getLogger().setLevel(logging.CRITICAL)
+
+    report = {
+        "revision": git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "config": {
+            "latency": args.latency,
+            "token_rate": args.token_rate,
+            "failure_rate": args.failure_rate,
+            "duration": args.duration,
+            "cursor_rate": args.cursor_rate,
+            "languages": args.languages
+        },
+        "results": {}
+    }
+
+    with FakeOllamaProcess(args.latency, args.token_rate, args.failure_rate) as fake:
+        if "manager" in args.scenarios:
+            report["results"]["manager"] = bench_manager(fake.url, args.duration, args.cursor_rate, args.languages)
+        if "chant_mantra" in args.scenarios:
+            report["results"]["chant_mantra"] = bench_chant_mantra(fake.url, args.chants)
+        if "cursor_tester" in args.scenarios:
+            report["results"]["cursor_tester"] = bench_cursor_tester(fake.url, args.cursor_requests)
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + "\n")
+        print(f"📄 Отчет сохранен: {args.output}", file=sys.stderr)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
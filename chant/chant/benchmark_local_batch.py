@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Benchmark Local Batch - токены в секунду генерации ruGPT-3 на CPU
+для разных размеров пакета динамического батчинга (local_backend.BatchGenerator)
+"""
+
+import json
+import logging
+import time
+from typing import Dict, List
+
+from chant_batch import build_chant_prompt
+from local_backend import (BatchGenerator, load_tokenizer_and_model, resolve_model, set_num_threads,
+                           DEFAULT_BATCH_WAIT)
+from mantras import MANTRAS
+
+DEFAULT_BATCH_SIZES = [1, 2, 4, 8, 16]
+
+
+def run_sweep(model, tok, prompts: List[List[int]], batch_sizes: List[int], max_new_tokens: int,
+              max_wait: float, device: str = "cpu") -> List[Dict]:
+    """
+    Отправляет все промпты сразу для каждого размера пакета
+
+    Returns:
+        Список замеров: токенов в секунду, средний пакет и задержка запроса
+    """
+    results = []
+    for batch_size in batch_sizes:
+        batcher = BatchGenerator(model, tok, device, batch_size, max_wait)
+        started = time.perf_counter()
+        futures = [batcher.submit(ids, max_new_tokens) for ids in prompts]
+        latencies = []
+        for future in futures:
+            future.result()
+            latencies.append(time.perf_counter() - started)
+        elapsed = time.perf_counter() - started
+        batcher.close()
+
+        stats = batcher.get_stats()
+        result = {
+            "batch_size": batch_size,
+            "requests": len(prompts),
+            "batches": stats["batches"],
+            "avg_batch_size": stats["avg_batch_size"],
+            "tokens": stats["tokens"],
+            "elapsed": elapsed,
+            "tokens_per_second": stats["tokens"] / elapsed if elapsed else None,
+            "latency_avg": sum(latencies) / len(latencies),
+            "latency_max": max(latencies)
+        }
+        results.append(result)
+        print(f"📊 пакет {batch_size:>2}: {result['tokens_per_second']:.1f} токенов/с "
+              f"({stats['batches']} вызовов model.generate, средний пакет {stats['avg_batch_size']:.1f}, "
+              f"задержка {result['latency_avg']:.2f}s в среднем, {result['latency_max']:.2f}s макс.)")
+    return results
+
+
+def main():
+    """Основная функция"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Бенчмарк динамического батчинга локальной генерации")
+    parser.add_argument("--model", default="rugptsmall",
+                        help="rugptsmall, rugptlarge, имя модели Hugging Face или путь к обученной модели")
+    parser.add_argument("--device", default="cpu", help="Устройство torch")
+    parser.add_argument("--threads", type=int, help="Потоков torch")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=DEFAULT_BATCH_SIZES,
+                        help="Размеры пакета для замера")
+    parser.add_argument("--requests", type=int, default=32, help="Одновременных запросов на замер")
+    parser.add_argument("--max-new-tokens", type=int, default=32, help="Токенов ответа на запрос")
+    parser.add_argument("--wait", type=float, default=DEFAULT_BATCH_WAIT, help="Ожидание запросов в пакет (с)")
+    parser.add_argument("--json", help="Файл для результатов в JSON")
+
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    set_num_threads(args.threads)
+    tok, model = load_tokenizer_and_model(resolve_model(args.model), args.device)
+
+    # Промпты разной длины: мантры всех языков с разным числом повторений
+    mantras = list(MANTRAS.values())
+    texts = [build_chant_prompt(mantras[i % len(mantras)], 1 + i % 3) for i in range(args.requests)]
+    prompts = [tok.encode(text) for text in texts]
+
+    # Прогрев: первый вызов generate инициализирует ядра torch
+    warmup = BatchGenerator(model, tok, args.device, 1, 0)
+    warmup.generate(prompts[0], 4)
+    warmup.close()
+
+    print(f"🚀 Замер: {args.requests} запросов по {args.max_new_tokens} токенов, модель {args.model}")
+    results = run_sweep(model, tok, prompts, args.batch_sizes, args.max_new_tokens, args.wait, args.device)
+
+    best = max(results, key=lambda r: r["tokens_per_second"] or 0)
+    baseline = next((r for r in results if r["batch_size"] == 1), None)
+    print(f"🏆 Лучший пакет: {best['batch_size']} - {best['tokens_per_second']:.1f} токенов/с")
+    if baseline and baseline["tokens_per_second"]:
+        print(f"⚡ Ускорение относительно поштучной генерации: "
+              f"{best['tokens_per_second'] / baseline['tokens_per_second']:.1f}x")
+    print(f"💡 Запуск: python3 chant_multithread.py --backend local://{args.model} --local-batch {best['batch_size']}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({"model": args.model, "threads": args.threads, "results": results}, f,
+                      ensure_ascii=False, indent=2)
+        print(f"📄 Результаты сохранены: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
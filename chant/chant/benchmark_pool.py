@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Benchmark Pool - сравнение пропускной способности чантинга (чантов в секунду)
+без пула соединений (requests.post на каждый вызов) и с общим keep-alive пулом
+"""
+
+import time
+import threading
+from typing import Callable
+
+import requests
+
+from ollama_client import get_session, close_all_sessions, DEFAULT_POOL_SIZE
+
+MANTRA = "Харей Кришна Харей Кришна Кришна Кришна Харей Харе Харей Рама Харей Рама Рама Рама Харей Харе"
+
+
+def run_benchmark(post: Callable, url: str, model: str, threads: int, requests_per_thread: int) -> float:
+    """
+    Запускает чантинг в нескольких потоках и возвращает чантов в секунду
+
+    Args:
+        post: Функция отправки POST-запроса (requests.post или session.post)
+        url: URL Ollama сервера
+        model: Название модели
+        threads: Количество потоков
+        requests_per_thread: Количество чантов в каждом потоке
+    """
+    payload = {
+        "model": model,
+        "prompt": MANTRA,
+        "stream": False,
+        "options": {"num_predict": 1}
+    }
+    errors = []
+
+    def chant_loop():
+        for _ in range(requests_per_thread):
+            try:
+                response = post(f"{url}/api/generate", json=payload, timeout=30)
+                response.raise_for_status()
+            except requests.exceptions.RequestException as e:
+                errors.append(e)
+
+    workers = [threading.Thread(target=chant_loop) for _ in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+
+    if errors:
+        print(f"⚠️  Ошибок: {len(errors)} (первая: {errors[0]})")
+    return (threads * requests_per_thread - len(errors)) / elapsed
+
+
+def main():
+    """Основная функция"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Бенчмарк пула соединений к Ollama (чантов в секунду)")
+    parser.add_argument("--url", default="http://localhost:11434", help="URL Ollama сервера")
+    parser.add_argument("--model", default="mozgach:latest", help="Название модели")
+    parser.add_argument("--threads", type=int, default=3, help="Количество потоков чантинга")
+    parser.add_argument("--requests", type=int, default=50, help="Количество чантов на поток")
+    parser.add_argument("--pool-size", type=int, default=DEFAULT_POOL_SIZE, help="Размер пула соединений")
+
+    args = parser.parse_args()
+
+    print(f"🚀 Бенчмарк: {args.threads} потоков × {args.requests} чантов, {args.url}")
+
+    before = run_benchmark(requests.post, args.url, args.model, args.threads, args.requests)
+    print(f"📉 До (requests.post без пула): {before:.2f} чантов/с")
+
+    session = get_session(args.url, args.pool_size)
+    after = run_benchmark(session.post, args.url, args.model, args.threads, args.requests)
+    print(f"📈 После (keep-alive пул, размер {args.pool_size}): {after:.2f} чантов/с")
+    close_all_sessions()
+
+    if before > 0:
+        print(f"⚡ Ускорение: {after / before:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
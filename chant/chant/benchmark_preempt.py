@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Benchmark Preempt - замер времени ожидания запросов курсора в очереди
+с вытеснением выполняющегося чанта и без него
+"""
+
+import random
+import time
+from concurrent.futures import wait
+from typing import Dict
+
+from chant_multithread import ChantManager
+
+CURSOR_PROMPTS = [
+    "Привет, как дела?",
+    "Расскажи о квантовой физике",
+    "Что такое искусственный интеллект?"
+]
+
+
+def run_scenario(url: str, preempt: bool, requests_count: int, max_gap: float) -> Dict:
+    """
+    Запускает систему чантинга и отправляет запросы курсора в случайные моменты
+
+    Returns:
+        Сводная статистика ожидания в очереди по всем потокам
+    """
+    # Без кэша ответов: повторяющиеся промпты иначе обслуживаются из кэша, и сценарии нельзя сравнить
+    manager = ChantManager(url, languages=["russianscsm"], preempt=preempt, cache_size=0)
+    if not manager.start():
+        raise SystemExit("❌ Не удалось запустить систему чантинга")
+
+    try:
+        # Даем чантингу разогнаться, чтобы запросы попадали на выполняющийся чант
+        time.sleep(2)
+        futures = []
+        for i in range(requests_count):
+            futures.append(manager.send_request(CURSOR_PROMPTS[i % len(CURSOR_PROMPTS)]))
+            time.sleep(random.uniform(0, max_gap))
+
+        # Ждем ответов на все запросы, включая выполняющиеся, а не только опустевших очередей
+        done, pending = wait(futures, timeout=120)
+        failed = sum(1 for future in done if future.exception() is not None)
+        from_cache = sum(1 for future in done if future.exception() is None and future.result().cached)
+
+        cursor = [w["cursor"] for w in manager.get_status()["workers"].values()]
+    finally:
+        manager.stop()
+
+    served = sum(c["requests"] for c in cursor)
+    wait_sum = sum((c["queue_wait_avg"] or 0) * c["requests"] for c in cursor)
+    return {
+        "served": served,
+        "queue_wait_avg": wait_sum / served if served else None,
+        "queue_wait_max": max(c["queue_wait_max"] for c in cursor),
+        "preempted_chants": sum(c["preempted_chants"] for c in cursor),
+        "from_model": len(done) - failed - from_cache,
+        "from_cache": from_cache,
+        "failed": failed,
+        "unfinished": len(pending)
+    }
+
+
+def main():
+    """Основная функция"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Бенчмарк вытеснения чантинга запросами курсора")
+    parser.add_argument("--url", default="http://localhost:11434", help="URL Ollama сервера")
+    parser.add_argument("--requests", type=int, default=20, help="Количество запросов курсора")
+    parser.add_argument("--max-gap", type=float, default=3.0, help="Максимальная пауза между запросами (с)")
+
+    args = parser.parse_args()
+
+    results = {}
+    for preempt in (False, True):
+        label = "с вытеснением" if preempt else "без вытеснения"
+        print(f"🚀 Сценарий {label}...")
+        results[preempt] = run_scenario(args.url, preempt, args.requests, args.max_gap)
+
+    for preempt, stats in results.items():
+        label = "С вытеснением " if preempt else "Без вытеснения"
+        avg = f"{stats['queue_wait_avg'] * 1000:.0f}ms" if stats['queue_wait_avg'] is not None else "n/a"
+        print(f"📊 {label}: обработано {stats['served']} (моделью {stats['from_model']}, "
+              f"из кэша {stats['from_cache']}), ожидание в очереди среднее {avg}, "
+              f"максимум {stats['queue_wait_max'] * 1000:.0f}ms, прервано чантов {stats['preempted_chants']}")
+        if stats["failed"] or stats["unfinished"]:
+            print(f"⚠️  {label}: с ошибкой {stats['failed']}, без ответа за 120s {stats['unfinished']}")
+
+    before, after = results[False]["queue_wait_avg"], results[True]["queue_wait_avg"]
+    if before and after:
+        print(f"⚡ Среднее ожидание курсора снизилось в {before / after:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
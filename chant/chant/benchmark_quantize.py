@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Benchmark Quantize - скорость, память и расхождение ответов ruGPT-3 на CPU
+в полной точности и с int8-квантизацией (local_backend.set_quantization)
+
+Каждый режим замеряется в отдельном процессе на фиксированном наборе промптов
+(мантры и запросы курсора) с жадной генерацией; расхождение считается
+относительно полной точности.
+"""
+
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+
+from benchmark_startup import read_rss
+
+FULL_PRECISION = "fp32"
+DEFAULT_MODES = [FULL_PRECISION, "int8", "int8-head"]
+
+# Минимальная доля совпавших токенов, чтобы режим считался пригодным
+DEFAULT_MIN_MATCH = 0.9
+
+
+def default_prompts() -> List[str]:
+    """Мантры всех языков (1 и 3 повторения) и запросы курсора из test_cursor_requests.py"""
+    from chant_batch import build_chant_prompt
+    from mantras import MANTRAS
+    from test_cursor_requests import CursorRequestTester
+
+    prompts = [build_chant_prompt(mantra, repetitions) for mantra in MANTRAS.values() for repetitions in (1, 3)]
+    for requests in CursorRequestTester().test_requests.values():
+        prompts.extend(requests)
+    return prompts
+
+
+def run_child(model_ref: str, mode: str, threads: Optional[int], prompts: List[str],
+              max_new_tokens: int) -> Dict:
+    """Замер одного режима внутри процесса"""
+    import local_backend
+
+    local_backend.set_num_threads(threads)
+    local_backend.set_quantization(None if mode == FULL_PRECISION else mode)
+    tok, model = local_backend.load_tokenizer_and_model(local_backend.resolve_model(model_ref))
+    loaded_rss = read_rss()
+
+    encoded = [tok.encode(prompt) for prompt in prompts]
+    # Прогрев ядер: первый вызов generate заметно медленнее
+    local_backend.generate_ids(model, tok, encoded[0], 2, do_sample=False)
+
+    outputs = []
+    started = time.perf_counter()
+    for ids in encoded:
+        outputs.append(local_backend.generate_ids(model, tok, ids, max_new_tokens, do_sample=False))
+    elapsed = time.perf_counter() - started
+    tokens = sum(len(output) for output in outputs)
+
+    return {
+        "mode": mode,
+        "load": local_backend.get_load_stats()[0],
+        "tokens": tokens,
+        "elapsed": elapsed,
+        "tokens_per_second": tokens / elapsed if elapsed else None,
+        "rss_loaded": loaded_rss,
+        "rss": read_rss(),
+        "outputs": outputs
+    }
+
+
+def compare_outputs(reference: List[List[int]], outputs: List[List[int]]) -> Dict:
+    """
+    Расхождение с полной точностью
+
+    Returns:
+        token_match - доля позиций с тем же токеном, exact_match - доля
+        полностью совпавших ответов, first_divergence - средняя позиция
+        первого расхождения (длина ответа, если его нет)
+    """
+    matched = total = exact = 0
+    divergence = []
+    for ref, out in zip(reference, outputs):
+        length = max(len(ref), len(out))
+        same = [a == b for a, b in zip(ref, out)]
+        matched += sum(same)
+        total += length
+        exact += ref == out
+        divergence.append(same.index(False) if False in same else min(len(ref), len(out)))
+    return {
+        "token_match": matched / total if total else 1.0,
+        "exact_match": exact / len(reference) if reference else 1.0,
+        "first_divergence": sum(divergence) / len(divergence) if divergence else 0.0
+    }
+
+
+def spawn(model_ref: str, mode: str, threads: Optional[int], prompts_file: str, max_new_tokens: int) -> Dict:
+    """Замер режима в отдельном процессе: память не смешивается с другими режимами"""
+    command = [sys.executable, os.path.abspath(__file__), "--child", mode, "--model", model_ref,
+               "--prompts", prompts_file, "--max-new-tokens", str(max_new_tokens)]
+    if threads:
+        command.extend(["--threads", str(threads)])
+    output = subprocess.run(command, stdout=subprocess.PIPE, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    """Основная функция"""
+    import argparse
+    import tempfile
+
+    parser = argparse.ArgumentParser(description="Бенчмарк квантизации локальной генерации на CPU")
+    parser.add_argument("--model", default="rugptsmall",
+                        help="rugptsmall, rugptlarge, имя модели Hugging Face или путь к обученной модели")
+    parser.add_argument("--modes", nargs="+", default=DEFAULT_MODES,
+                        help=f"Режимы для замера ({FULL_PRECISION} - полная точность, с ней сравниваются остальные)")
+    parser.add_argument("--threads", type=int, help="Потоков torch")
+    parser.add_argument("--max-new-tokens", type=int, default=32, help="Токенов ответа на промпт")
+    parser.add_argument("--prompts", help="JSON-файл со списком промптов (по умолчанию мантры и запросы курсора)")
+    parser.add_argument("--min-match", type=float, default=DEFAULT_MIN_MATCH,
+                        help="Минимальная доля совпавших токенов для рекомендации режима")
+    parser.add_argument("--child", metavar="РЕЖИМ", help=argparse.SUPPRESS)
+    parser.add_argument("--json", help="Файл для результатов в JSON")
+
+    args = parser.parse_args()
+
+    if args.child:
+        with open(args.prompts, encoding='utf-8') as f:
+            prompts = json.load(f)
+        print(json.dumps(run_child(args.model, args.child, args.threads, prompts, args.max_new_tokens)))
+        return
+
+    modes = list(dict.fromkeys([FULL_PRECISION] + args.modes))
+    if args.prompts:
+        prompts_file = args.prompts
+        with open(prompts_file, encoding='utf-8') as f:
+            count = len(json.load(f))
+    else:
+        prompts = default_prompts()
+        count = len(prompts)
+        with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False, encoding='utf-8') as f:
+            json.dump(prompts, f, ensure_ascii=False)
+            prompts_file = f.name
+
+    print(f"🚀 Замер квантизации: модель {args.model}, {count} промптов по {args.max_new_tokens} токенов")
+    results = []
+    try:
+        for mode in modes:
+            results.append(spawn(args.model, mode, args.threads, prompts_file, args.max_new_tokens))
+    finally:
+        if not args.prompts:
+            os.unlink(prompts_file)
+
+    reference = results[0]
+    for result in results:
+        result["drift"] = compare_outputs(reference["outputs"], result["outputs"])
+        rss = result["rss"].get("VmRSS")
+        memory = f", память {rss / 1024:.0f} МБ" if rss else ""
+        speedup = (result["tokens_per_second"] / reference["tokens_per_second"]
+                   if reference["tokens_per_second"] else 0)
+        print(f"📊 {result['mode']:>9}: {result['tokens_per_second']:.1f} токенов/с ({speedup:.2f}x){memory}, "
+              f"совпадение токенов {result['drift']['token_match']:.1%}, ответов {result['drift']['exact_match']:.1%}, "
+              f"расхождение с {result['drift']['first_divergence']:.1f} токена")
+
+    good = [result for result in results if result["drift"]["token_match"] >= args.min_match]
+    best = max(good, key=lambda r: r["tokens_per_second"] or 0)
+    print(f"🏆 Самый быстрый режим с совпадением не ниже {args.min_match:.0%}: {best['mode']}")
+    if best["mode"] != FULL_PRECISION:
+        print(f"💡 Запуск: python3 chant_multithread.py --backend local://{args.model} --local-quantize {best['mode']}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({"model": args.model, "threads": args.threads, "max_new_tokens": args.max_new_tokens,
+                       "results": results}, f, ensure_ascii=False, indent=2)
+        print(f"📄 Результаты сохранены: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Benchmark Startup - время холодного и теплого запуска локальной модели ruGPT-3
+Каждый замер - отдельный процесс: импорт, загрузка весов и первый ответ.
+Холодный запуск сохраняет модель в кэш safetensors, теплые читают её через mmap;
+одновременные процессы показывают, сколько памяти весов у них общей (RssFile).
+"""
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+
+
+def read_rss() -> Dict[str, int]:
+    """Резидентная память процесса в КБ: своя (RssAnon) и из файлов (RssFile); только Linux"""
+    result = {}
+    try:
+        with open("/proc/self/status", encoding="utf-8") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in ("VmRSS", "RssAnon", "RssFile"):
+                    result[key] = int(value.split()[0])
+    except OSError:
+        pass
+    return result
+
+
+def run_child(model_ref: str, device: str, use_cache: bool) -> Dict:
+    """Замер внутри процесса: от импорта local_backend до первого сгенерированного токена"""
+    started = time.perf_counter()
+    import local_backend
+    imported = time.perf_counter()
+
+    if not use_cache:
+        local_backend.set_model_cache(None)
+    tok, model = local_backend.load_tokenizer_and_model(local_backend.resolve_model(model_ref), device)
+    loaded = time.perf_counter()
+    local_backend.generate_ids(model, tok, tok.encode("Ом"), 1, device)
+    generated = time.perf_counter()
+
+    stats = local_backend.get_load_stats()[0]
+    return dict(stats, module_import=imported - started, first_token=generated - loaded,
+                ready=generated - started, rss=read_rss())
+
+
+def spawn(model_ref: str, device: str, use_cache: bool, count: int = 1) -> List[Dict]:
+    """Запускает count процессов одновременно и собирает их замеры"""
+    command = [sys.executable, os.path.abspath(__file__), "--child", "--model", model_ref, "--device", device]
+    if not use_cache:
+        command.append("--no-cache")
+    started = time.perf_counter()
+    processes = [subprocess.Popen(command, stdout=subprocess.PIPE, text=True) for _ in range(count)]
+    results = []
+    for process in processes:
+        output, _ = process.communicate()
+        if process.returncode != 0:
+            raise RuntimeError(f"Процесс замера завершился с кодом {process.returncode}")
+        result = json.loads(output.strip().splitlines()[-1])
+        result["process"] = time.perf_counter() - started
+        results.append(result)
+    return results
+
+
+def describe(label: str, result: Dict):
+    rss = result.get("rss", {})
+    memory = (f", память {rss['RssAnon'] / 1024:.0f} МБ своя + {rss['RssFile'] / 1024:.0f} МБ из файлов"
+              if "RssAnon" in rss else "")
+    print(f"📊 {label}: готов за {result['ready']:.2f}s (процесс {result['process']:.2f}s) - "
+          f"импорт {result['import']:.2f}s, кэш {result['export']:.2f}s, веса {result['load']:.2f}s "
+          f"из {result['source']}, первый токен {result['first_token']:.2f}s{memory}")
+
+
+def main():
+    """Основная функция"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Бенчмарк запуска локальной модели")
+    parser.add_argument("--model", default="rugptsmall",
+                        help="rugptsmall, rugptlarge, имя модели Hugging Face или путь к обученной модели")
+    parser.add_argument("--device", default="cpu", help="Устройство torch")
+    parser.add_argument("--runs", type=int, default=3, help="Теплых запусков подряд")
+    parser.add_argument("--parallel", type=int, default=4, help="Одновременных теплых процессов (0 - не замерять)")
+    parser.add_argument("--cold", action="store_true", help="Удалить кэш модели перед замером")
+    parser.add_argument("--no-cache", action="store_true", help="Загрузка через from_pretrained без кэша")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--json", help="Файл для результатов в JSON")
+
+    args = parser.parse_args()
+    use_cache = not args.no_cache
+
+    if args.child:
+        print(json.dumps(run_child(args.model, args.device, use_cache)))
+        return
+
+    from local_backend import cached_model_path, resolve_model
+
+    path: Optional[str] = cached_model_path(resolve_model(args.model)) if use_cache else None
+    if use_cache and path is None:
+        print("⚠️  Кэш недоступен (нет пакета safetensors или CHANT_MODEL_CACHE пуст), замер без кэша")
+    if args.cold and path and os.path.isdir(path) and path != resolve_model(args.model):
+        shutil.rmtree(path)
+        print(f"🧹 Кэш удален: {path}")
+
+    print(f"🚀 Замер запуска: модель {args.model}, кэш {path or 'выключен'}")
+    report: Dict = {"model": args.model, "cache": path}
+
+    first = spawn(args.model, args.device, use_cache)[0]
+    describe("первый запуск" if first["source"] == "cache" else "холодный запуск", first)
+    report["first"] = first
+
+    report["warm"] = []
+    for i in range(args.runs):
+        result = spawn(args.model, args.device, use_cache)[0]
+        describe(f"теплый запуск {i + 1}", result)
+        report["warm"].append(result)
+
+    if args.parallel > 0:
+        report["parallel"] = spawn(args.model, args.device, use_cache, args.parallel)
+        slowest = max(report["parallel"], key=lambda r: r["ready"])
+        describe(f"{args.parallel} процессов одновременно, самый медленный", slowest)
+
+    if report["warm"]:
+        warm = sum(r["ready"] for r in report["warm"]) / len(report["warm"])
+        print(f"⚡ Холодный запуск {first['ready']:.2f}s, теплый {warm:.2f}s в среднем")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"📄 Результаты сохранены: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
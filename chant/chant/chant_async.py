@@ -0,0 +1,575 @@
+#!/usr/bin/env python3
+"""
+Chant Async - asyncio режим системы чантинга
+Сотни потоков чантинга и очередей курсора на одном event loop с неблокирующим HTTP
+"""
+
+import asyncio
+import threading
+import time
+import logging
+from concurrent.futures import Future
+from typing import Dict, List, Optional
+
+import aiohttp
+
+from ollama_client import DEFAULT_POOL_SIZE, GENERATION_OPTIONS
+from mantras import MANTRAS, DEFAULT_LANGUAGES, FALLBACK_LANGUAGE
+from chant_batch import ChantCounter, build_chant_prompt, validate_batch_size
+from response_cache import ResponseCache, make_key, DEFAULT_CACHE_TTL
+from chant_session import ChantSession, DEFAULT_CONTEXT_RESET
+from metrics import ChantMetrics
+from logging_setup import CHANT_LINE
+from warmup import (load_payload, prime_payload, unload_payload, summarize,
+                    DEFAULT_KEEP_ALIVE, WARMUP_TIMEOUT, KeepAlive)
+from scheduler import WeightedScheduler, CHANT, CURSOR, failure_pause
+from cursor_request import CursorRequest, CursorResult, CursorRequestError, QueueFullError
+from dispatch import Dispatcher, Ewma, LeastLoadedPolicy, expected_wait
+from work_queue import AsyncStealableQueue, find_victims, steal_request
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncChantWorker:
+    """Корутина чантинга для одного потока с очередью запросов курсора"""
+
+    def __init__(self, stream_id: int, language: str, ollama_url: str = "http://localhost:11434",
+                 chant_ratio: float = 0.8, cursor_ratio: float = 0.2, preempt: bool = True,
+                 work_stealing: bool = True, max_queue_size: int = 0, chant_batch: int = 1,
+                 response_cache: Optional[ResponseCache] = None, chant_context: bool = False,
+                 context_reset: int = DEFAULT_CONTEXT_RESET, keep_alive: KeepAlive = DEFAULT_KEEP_ALIVE,
+                 metrics: Optional[ChantMetrics] = None):
+        self.thread_id = stream_id  # Совместимость с ChantWorker и get_status
+        self.language = language
+        self.ollama_url = ollama_url
+        self.model_name = "mozgach:latest"
+        self.keep_alive = keep_alive
+        self.running = False
+        self.request_queue: Optional[AsyncStealableQueue] = None  # Создается внутри event loop
+        self.max_queue_size = max_queue_size
+        self._wakeup: Optional[asyncio.Event] = None
+        self.last_request_time = time.time()
+        self.chanting_active = True
+        self.task: Optional[asyncio.Task] = None
+
+        # Коэффициенты разбавки: чантинг vs запросы курсора
+        self.chant_ratio = chant_ratio
+        self.cursor_ratio = cursor_ratio
+        self.scheduler = WeightedScheduler({CHANT: chant_ratio, CURSOR: cursor_ratio})
+        self.chant_failures = 0  # Неудачных чантов подряд: пауза растет экспоненциально
+
+        # Вытеснение чантинга: запрос курсора отменяет задачу выполняющегося чанта
+        self.preempt = preempt
+        self._chant_task: Optional[asyncio.Task] = None
+        self.cursor_in_flight = False
+        self.latency = Ewma()  # EWMA задержки backend'а для диспетчера
+        self.preempted_chants = 0
+        self.cursor_wait_stats = {"requests": 0, "wait_sum": 0.0, "wait_max": 0.0}
+        self.last_result: Optional[Dict] = None
+        self.last_error: Optional[str] = None
+
+        # Work stealing между корутинами одного event loop
+        self.work_stealing = work_stealing
+        self.peers: List["AsyncChantWorker"] = []
+        self.stolen_requests = 0
+
+        self.current_mantra = MANTRAS.get(language, MANTRAS[FALLBACK_LANGUAGE])
+
+        # Пакетный чантинг: повторений мантры за один вызов модели
+        self.chant_batch = validate_batch_size(chant_batch)
+        self.chant_counter = ChantCounter()
+        self.chant_session = ChantSession(context_reset) if chant_context else None
+
+        # Общий кэш ответов курсора (заполняется корутинами, читается менеджером)
+        self.response_cache = response_cache
+        self.metrics = metrics or ChantMetrics()
+
+    def start(self, session: aiohttp.ClientSession):
+        """Запуск корутины чантинга (вызывается внутри event loop)"""
+        self.running = True
+        self.request_queue = AsyncStealableQueue(self.max_queue_size)
+        self._wakeup = asyncio.Event()
+        self.task = asyncio.get_running_loop().create_task(self._work_loop(session),
+                                                           name=f"Stream-{self.thread_id}")
+        logger.info(f"Запущен asyncio поток {self.thread_id} с языком {self.language}")
+
+    @property
+    def chant_in_flight(self) -> bool:
+        """Выполняется ли сейчас чант"""
+        return self._chant_task is not None and not self._chant_task.done()
+
+    def stop(self):
+        """Остановка корутины чантинга"""
+        self.running = False
+        self.chanting_active = False
+        if self.task:
+            self.task.cancel()
+        if self._chant_task:
+            self._chant_task.cancel()
+
+    def add_request(self, request: str, language: Optional[str] = None, thread_id: Optional[int] = None,
+                    future: Optional[Future] = None) -> Future:
+        """Добавление запроса от курсора (вызывается внутри event loop)"""
+        cursor_request = CursorRequest(request, language=language, thread_id=thread_id, future=future or Future())
+        self.request_queue.put_nowait(cursor_request)
+        self._wakeup.set()
+        if self.work_stealing and (self.request_queue.qsize() >= 2 or self.cursor_in_flight):
+            for peer in self.peers:
+                if peer is not self:
+                    peer._wakeup.set()
+        self.last_request_time = time.time()
+        self.chanting_active = False
+        if (self.preempt and self._chant_task and not self._chant_task.done()
+                and self.scheduler.should_preempt(CHANT, CURSOR)):
+            self._chant_task.cancel()  # aiohttp закрывает соединение, Ollama прекращает генерацию
+        logger.info(f"Получен запрос в asyncio потоке {self.thread_id}: {request[:50]}...")
+        return cursor_request.future
+
+    def fail_pending(self, reason: str):
+        """Завершает ошибкой все запросы, оставшиеся в очереди"""
+        while self.request_queue and not self.request_queue.empty():
+            request = self.request_queue.get_nowait()
+            if request.future.set_running_or_notify_cancel():
+                request.future.set_exception(CursorRequestError(reason))
+
+    async def _work_loop(self, session: aiohttp.ClientSession):
+        """Основной цикл: доли времени модели делит взвешенный планировщик"""
+        while self.running:
+            try:
+                ready = [CHANT]
+                if not self.request_queue.empty():
+                    ready.append(CURSOR)
+                elif self.work_stealing and find_victims(self, self.peers):
+                    ready.append(CURSOR)
+                else:
+                    self.chanting_active = True
+
+                kind = self.scheduler.choose(ready)
+                started = time.perf_counter()
+
+                if kind == CURSOR:
+                    try:
+                        request = self.request_queue.get_nowait()
+                    except asyncio.QueueEmpty:
+                        request = steal_request(self, self.peers) if self.work_stealing else None
+                        if request is None:
+                            continue
+                        self.stolen_requests += 1
+                        logger.info(f"Asyncio поток {self.thread_id} забрал запрос курсора у соседнего потока")
+                    await self._process_cursor_request(session, request)
+                    self.last_request_time = time.time()
+                    self.scheduler.charge(CURSOR, time.perf_counter() - started)
+                    continue
+
+                # Чант выполняется отдельной задачей, чтобы запрос курсора мог её отменить
+                self._chant_task = asyncio.ensure_future(self._chant_mantra(session))
+                await asyncio.wait({self._chant_task})
+                elapsed = time.perf_counter() - started
+                if self._chant_task.cancelled():
+                    self.preempted_chants += 1
+                    self.chant_counter.record_lost(self.chant_batch, elapsed)
+                    self.metrics.observe_preempted(self)
+                    logger.debug(f"Чант в asyncio потоке {self.thread_id} прерван ради запроса курсора")
+                self.scheduler.charge(CHANT, elapsed)
+                pause = self.scheduler.pause_after(CHANT, elapsed)
+                # Неудачный чант (не прерванный) - пауза не короче CHANT_INTERVAL, растет при сбоях подряд
+                error = None if self._chant_task.cancelled() else self._chant_task.exception()
+                if error is not None:
+                    logger.error(f"Ошибка чантинга в asyncio потоке {self.thread_id}: {error}")
+                if error is not None or (not self._chant_task.cancelled() and self.last_error):
+                    self.chant_failures += 1
+                    pause = max(pause, failure_pause(self.chant_failures))
+                else:
+                    self.chant_failures = 0
+
+                # Пауза до следующего чанта, но просыпаемся сразу при запросе курсора
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), pause)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка в asyncio потоке {self.thread_id}: {e}")
+                await asyncio.sleep(1)
+
+    async def _process_cursor_request(self, session: aiohttp.ClientSession, request: CursorRequest):
+        """Обработка запроса от курсора"""
+        if not request.future.set_running_or_notify_cancel():
+            return
+        wait = request.queue_wait()
+        stats = self.cursor_wait_stats
+        stats["requests"] += 1
+        stats["wait_sum"] += wait
+        stats["wait_max"] = max(stats["wait_max"], wait)
+        logger.info(f"Обрабатываю запрос курсора в asyncio потоке {self.thread_id} (ожидание в очереди {wait * 1000:.0f}ms)")
+        self.cursor_in_flight = True
+        started = time.perf_counter()
+        try:
+            response = await self._send_to_model(session, request.prompt)
+        except asyncio.CancelledError:
+            request.future.set_exception(CursorRequestError("Система чантинга остановлена"))
+            raise
+        except Exception as e:
+            logger.error(f"Ошибка обработки запроса курсора в asyncio потоке {self.thread_id}: {e}")
+            self.metrics.observe_error(self, CURSOR)
+            request.future.set_exception(e)
+            return
+        finally:
+            self.cursor_in_flight = False
+        backend_time = time.perf_counter() - started
+
+        if response is None:
+            self.metrics.observe_error(self, CURSOR)
+            request.future.set_exception(CursorRequestError(self.last_error or "Нет ответа от модели"))
+            return
+        if response:
+            logger.info(f"Получен ответ от модели в asyncio потоке {self.thread_id}: {response[:100]}...")
+        else:
+            logger.warning(f"Пустой ответ от модели в asyncio потоке {self.thread_id}")
+
+        result = self.last_result or {}
+        if self.response_cache is not None:
+            self.response_cache.put(make_key(self.model_name, request.prompt, GENERATION_OPTIONS), {
+                "response": response,
+                "eval_count": result.get('eval_count'),
+                "prompt_eval_count": result.get('prompt_eval_count')
+            })
+        total_time = request.queue_wait()
+        self.metrics.observe_cursor(self, wait, backend_time, total_time, result)
+        request.future.set_result(CursorResult(
+            response=response,
+            thread_id=self.thread_id,
+            queue_wait=wait,
+            backend_time=backend_time,
+            total_time=total_time,
+            eval_count=result.get('eval_count'),
+            prompt_eval_count=result.get('prompt_eval_count')
+        ))
+
+    def get_cursor_wait_stats(self) -> Dict:
+        """Время ожидания запросов курсора и число вытесненных чантов"""
+        stats = self.cursor_wait_stats
+        return {
+            "requests": stats["requests"],
+            "queue_wait_avg": stats["wait_sum"] / stats["requests"] if stats["requests"] else None,
+            "queue_wait_max": stats["wait_max"],
+            "preempted_chants": self.preempted_chants,
+            "stolen_requests": self.stolen_requests
+        }
+
+    async def _chant_mantra(self, session: aiohttp.ClientSession):
+        """Отправка махамантры к модели"""
+        logger.info(f"Поток {self.thread_id}: Чантинг на языке {self.language}: {self.current_mantra}"
+                    + (f" (x{self.chant_batch})" if self.chant_batch > 1 else ""), extra=CHANT_LINE)
+        started = time.perf_counter()
+        prompt = build_chant_prompt(self.current_mantra, self.chant_batch)
+        context = self.chant_session.current(prompt, GENERATION_OPTIONS["max_tokens"]) if self.chant_session else None
+        response = await self._send_to_model(session, prompt, context)
+        # Неудачный пакет не засчитывается; прерванный учитывается в _work_loop
+        elapsed = time.perf_counter() - started
+        if response is None:
+            self.chant_counter.record_lost(self.chant_batch, elapsed)
+            self.metrics.observe_error(self, CHANT)
+        else:
+            self.chant_counter.record(self.chant_batch, elapsed)
+            self.metrics.observe_chant(self, elapsed, self.chant_batch, self.last_result)
+            if self.chant_session:
+                self.chant_session.update(self.last_result or {}, context is not None, prompt)
+        if response:
+            logger.debug(f"Модель в asyncio потоке {self.thread_id} ответила на мантру")
+        else:
+            logger.debug(f"Модель в asyncio потоке {self.thread_id} не ответила на мантру")
+
+    async def _send_to_model(self, session: aiohttp.ClientSession, prompt: str,
+                             context: Optional[List[int]] = None) -> Optional[str]:
+        """Неблокирующая отправка запроса к модели через Ollama API"""
+        payload = {
+            "model": self.model_name,
+            "prompt": prompt,
+            "stream": False,
+            "options": GENERATION_OPTIONS,
+            "keep_alive": self.keep_alive
+        }
+        if context:
+            payload["context"] = context
+        started = time.perf_counter()
+        self.last_result = None
+        self.last_error = None
+        try:
+            async with session.post(f"{self.ollama_url}/api/generate", json=payload,
+                                    timeout=aiohttp.ClientTimeout(total=30)) as response:
+                response.raise_for_status()
+                result = await response.json()
+                self.last_result = result
+                self.latency.update(time.perf_counter() - started)
+                return result.get('response', '')
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.error(f"Ошибка API в asyncio потоке {self.thread_id}: {e}")
+            self.last_error = f"Ошибка API: {e}"
+            return None
+
+
+class AsyncChantManager:
+    """
+    Менеджер asyncio режима с тем же публичным интерфейсом, что и ChantManager
+
+    Event loop работает в отдельном фоновом потоке, поэтому start, stop,
+    send_request и get_status остаются синхронными и вызываются из main как раньше.
+    """
+
+    def __init__(self, ollama_url: str = "http://localhost:11434",
+                 chant_ratio: float = 0.8, cursor_ratio: float = 0.2, pool_size: int = DEFAULT_POOL_SIZE,
+                 languages: Optional[List[str]] = None, streams_per_language: int = 1, preempt: bool = True,
+                 dispatch_policy: str = LeastLoadedPolicy.name, work_stealing: bool = True,
+                 max_queue_size: int = 0, chant_batch: int = 1, cache_size: int = 0,
+                 cache_ttl: float = DEFAULT_CACHE_TTL, cache_path: Optional[str] = None,
+                 chant_context: bool = False, context_reset: int = DEFAULT_CONTEXT_RESET,
+                 keep_alive: KeepAlive = DEFAULT_KEEP_ALIVE, warmup: bool = True, unload_on_stop: bool = False):
+        self.ollama_url = ollama_url
+        self.model_name = "mozgach:latest"
+        self.workers: Dict[int, AsyncChantWorker] = {}
+        self.running = False
+        self.pool_size = pool_size
+
+        self.chant_ratio = chant_ratio
+        self.cursor_ratio = cursor_ratio
+
+        self.languages = languages or list(DEFAULT_LANGUAGES)
+        self.streams_per_language = streams_per_language
+        self.preempt = preempt
+
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.loop_thread: Optional[threading.Thread] = None
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.dispatcher = Dispatcher(dispatch_policy)
+        self.work_stealing = work_stealing
+        self.max_queue_size = max_queue_size
+        self.chant_batch = validate_batch_size(chant_batch)
+        self.response_cache = ResponseCache(cache_size, cache_ttl, cache_path) if cache_size > 0 else None
+        self.chant_context = chant_context
+        self.context_reset = context_reset
+        self.keep_alive = keep_alive
+        self.warmup = warmup
+        self.unload_on_stop = unload_on_stop
+        self.warmup_stats: Optional[Dict] = None
+        self.metrics = ChantMetrics()
+
+    def start(self) -> bool:
+        """Запуск event loop и всех корутин чантинга"""
+        total = len(self.languages) * self.streams_per_language
+        logger.info(f"Запуск asyncio системы чантинга с {total} потоками на одном event loop...")
+
+        self.loop = asyncio.new_event_loop()
+        self.loop_thread = threading.Thread(target=self.loop.run_forever, name="AsyncChantLoop", daemon=True)
+        self.loop_thread.start()
+
+        started = asyncio.run_coroutine_threadsafe(self._start(), self.loop).result()
+        if not started:
+            self._shutdown_loop()
+            return False
+
+        self.running = True
+        logger.info("Все asyncio потоки чантинга запущены успешно!")
+        return True
+
+    async def _start(self) -> bool:
+        # Один пул соединений на все потоки: limit ограничивает число сокетов к Ollama
+        connector = aiohttp.TCPConnector(limit=self.pool_size)
+        self.session = aiohttp.ClientSession(connector=connector)
+
+        if not await self._check_ollama():
+            logger.error("Ollama недоступен. Убедитесь, что сервер запущен.")
+            await self.session.close()
+            return False
+
+        if not await self._check_model():
+            logger.error("Модель mozgach:latest не найдена. Загрузите её командой: ollama pull mozgach:latest")
+            await self.session.close()
+            return False
+
+        stream_id = 1
+        for language in self.languages:
+            for _ in range(self.streams_per_language):
+                worker = AsyncChantWorker(stream_id, language, self.ollama_url,
+                                          self.chant_ratio, self.cursor_ratio, self.preempt,
+                                          self.work_stealing, self.max_queue_size, self.chant_batch,
+                                          self.response_cache, self.chant_context, self.context_reset,
+                                          self.keep_alive, self.metrics)
+                self.workers[stream_id] = worker
+                stream_id += 1
+
+        if self.warmup and not await self._warm_up():
+            logger.error("Не удалось загрузить модель при прогреве")
+            await self.session.close()
+            return False
+
+        for worker in self.workers.values():
+            worker.peers = list(self.workers.values())
+            worker.start(self.session)
+        return True
+
+    def stop(self):
+        """Остановка всех корутин и event loop"""
+        logger.info("Остановка asyncio системы чантинга...")
+        if self.loop and self.loop.is_running():
+            asyncio.run_coroutine_threadsafe(self._stop(), self.loop).result(timeout=10)
+        self._shutdown_loop()
+        if self.response_cache:
+            self.response_cache.close()
+        self.running = False
+        logger.info("Asyncio система чантинга остановлена.")
+
+    async def _stop(self):
+        tasks = [worker.task for worker in self.workers.values() if worker.task]
+        for worker in self.workers.values():
+            worker.stop()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for worker in self.workers.values():
+            worker.fail_pending("Система чантинга остановлена")
+        if self.session:
+            if self.unload_on_stop:
+                await self._post(unload_payload(self.model_name), 10)
+            await self.session.close()
+
+    async def _post(self, payload: Dict, timeout: float) -> bool:
+        """Служебный запрос к /api/generate (прогрев, выгрузка); True при успехе"""
+        try:
+            async with self.session.post(f"{self.ollama_url}/api/generate", json=payload,
+                                         timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+                response.raise_for_status()
+                await response.read()
+                return True
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.warning(f"Служебный запрос к модели {self.model_name} не удался: {e}")
+            return False
+
+    async def _warm_up(self) -> bool:
+        """Загрузка модели и прогрев мантрами всех потоков"""
+        logger.info(f"Прогрев модели {self.model_name} (keep_alive={self.keep_alive})...")
+        started = time.perf_counter()
+        if not await self._post(load_payload(self.model_name, self.keep_alive), WARMUP_TIMEOUT):
+            self.warmup_stats = summarize(None, 0, 1, started)
+            return False
+        load_time = time.perf_counter() - started
+
+        prompts = dict.fromkeys(build_chant_prompt(w.current_mantra, w.chant_batch) for w in self.workers.values())
+        results = await asyncio.gather(*(self._post(prime_payload(self.model_name, prompt, self.keep_alive),
+                                                    WARMUP_TIMEOUT) for prompt in prompts))
+        self.warmup_stats = summarize(load_time, sum(results), len(results) - sum(results), started)
+        logger.info(f"Модель прогрета за {self.warmup_stats['elapsed']:.1f}s (загрузка {load_time:.1f}s)")
+        return True
+
+    def _shutdown_loop(self):
+        if self.loop:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            if self.loop_thread:
+                self.loop_thread.join(timeout=5)
+            self.loop.close()
+            self.loop = None
+
+    def send_request(self, request: str, thread_id: Optional[int] = None, language: Optional[str] = None) -> Future:
+        """
+        Отправка запроса от курсора (потокобезопасно)
+
+        Returns:
+            concurrent.futures.Future с CursorResult; внутри другого event loop
+            его можно ожидать через asyncio.wrap_future
+        """
+        future = Future()
+        if not self.running:
+            logger.warning("Система не запущена")
+            future.set_exception(CursorRequestError("Система не запущена"))
+            return future
+
+        # Попадание в кэш обслуживается в вызывающем потоке, без event loop и модели
+        value = self.response_cache.get(make_key(self.model_name, request, GENERATION_OPTIONS)) \
+            if self.response_cache else None
+        if value is not None:
+            future.set_result(CursorResult(response=value["response"], thread_id=None, queue_wait=0.0,
+                                           backend_time=0.0, total_time=0.0,
+                                           eval_count=value.get("eval_count"),
+                                           prompt_eval_count=value.get("prompt_eval_count"), cached=True))
+            return future
+
+        # Выбор потока и постановка в очередь выполняются внутри event loop,
+        # чтобы диспетчер видел актуальные размеры очередей
+        self.loop.call_soon_threadsafe(self._dispatch, request, thread_id, language, future)
+        return future
+
+    def _dispatch(self, request: str, thread_id: Optional[int], language: Optional[str], future: Future):
+        if thread_id and thread_id in self.workers:
+            order = [self.workers[thread_id]]
+            kwargs = {"thread_id": thread_id}
+        else:
+            workers = list(self.workers.values())
+            candidates = [w for w in workers if w.language == language] if language else []
+            order = self.dispatcher.order(candidates or workers)
+            kwargs = {"language": language if candidates else None}
+
+        for worker in order:
+            try:
+                worker.add_request(request, future=future, **kwargs)
+            except asyncio.QueueFull:
+                logger.debug(f"Очередь asyncio потока {worker.thread_id} заполнена, пробуем следующий поток")
+                continue
+            self.dispatcher.record(worker)
+            logger.info(f"Запрос отправлен в asyncio поток {worker.thread_id} (политика {self.dispatcher.policy.name})")
+            return
+
+        names = ", ".join(str(worker.thread_id) for worker in order)
+        logger.warning(f"Очереди asyncio потоков {names} заполнены, запрос отклонен")
+        future.set_exception(QueueFullError(f"Очереди потоков {names} заполнены",
+                                            max(1.0, min(expected_wait(worker) for worker in order))))
+
+    async def _check_ollama(self) -> bool:
+        """Проверка доступности Ollama сервера"""
+        try:
+            async with self.session.get(f"{self.ollama_url}/api/tags",
+                                        timeout=aiohttp.ClientTimeout(total=5)) as response:
+                return response.status == 200
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return False
+
+    async def _check_model(self) -> bool:
+        """Проверка наличия модели mozgach:latest"""
+        try:
+            async with self.session.get(f"{self.ollama_url}/api/tags",
+                                        timeout=aiohttp.ClientTimeout(total=5)) as response:
+                if response.status == 200:
+                    models = (await response.json()).get('models', [])
+                    return any('mozgach:latest' in model.get('name', '') for model in models)
+                return False
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return False
+
+    def get_status(self) -> Dict:
+        """Получение статуса всех потоков"""
+        status = {
+            "running": self.running,
+            "mode": "async",
+            "dispatch": self.dispatcher.get_stats(),
+            "workers": {}
+        }
+        if self.response_cache:
+            status["cache"] = self.response_cache.get_stats()
+        if self.warmup_stats:
+            status["warmup"] = self.warmup_stats
+
+        for stream_id, worker in self.workers.items():
+            status["workers"][stream_id] = {
+                "language": worker.language,
+                "chanting_active": worker.chanting_active,
+                "last_request_time": worker.last_request_time,
+                "queue_size": worker.request_queue.qsize() if worker.request_queue else 0,
+                "latency_ewma": worker.latency.value,
+                "schedule": worker.scheduler.get_stats(),
+                "cursor": worker.get_cursor_wait_stats(),
+                "chanting": worker.chant_counter.get_stats()
+            }
+            if worker.chant_session:
+                status["workers"][stream_id]["chanting"]["context"] = worker.chant_session.get_stats()
+
+        return status
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Chant Batch - пакетный чантинг: много повторений мантры за один вызов модели
+Промпт, разбиение круга четок на пакеты и точный учет повторений
+"""
+
+import threading
+from typing import Dict, List
+
+# Полный круг четок (джапа-мала)
+MALA_SIZE = 108
+
+
+def validate_batch_size(batch_size: int) -> int:
+    """Проверяет размер пакета: от 1 до полного круга четок"""
+    if not 1 <= batch_size <= MALA_SIZE:
+        raise ValueError(f"Размер пакета должен быть от 1 до {MALA_SIZE}, получено {batch_size}")
+    return batch_size
+
+
+def build_chant_prompt(mantra: str, repetitions: int = 1) -> str:
+    """
+    Промпт с repetitions повторениями мантры, по одному на строке
+
+    Одно повторение отправляется как есть, чтобы промпт совпадал с прежним
+    поштучным режимом.
+    """
+    if repetitions == 1:
+        return mantra
+    return "\n".join(mantra for _ in range(repetitions))
+
+
+def split_round(repetitions: int, batch_size: int) -> List[int]:
+    """Разбивает repetitions повторений на пакеты не больше batch_size"""
+    full, rest = divmod(repetitions, batch_size)
+    return [batch_size] * full + ([rest] if rest else [])
+
+
+class ChantCounter:
+    """
+    Потокобезопасный счетчик повторений мантры
+
+    Повторения засчитываются только по вызовам, на которые модель ответила.
+    Прерванный или неудачный пакет учитывается отдельно и в repetitions не входит.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.repetitions = 0
+        self.lost_calls = 0
+        self.lost_repetitions = 0
+        self.backend_time = 0.0
+
+    def record(self, repetitions: int, elapsed: float):
+        """Учитывает успешный вызов модели с repetitions повторениями"""
+        with self._lock:
+            self.calls += 1
+            self.repetitions += repetitions
+            self.backend_time += elapsed
+
+    def record_lost(self, repetitions: int, elapsed: float):
+        """Учитывает прерванный или неудачный вызов"""
+        with self._lock:
+            self.lost_calls += 1
+            self.lost_repetitions += repetitions
+            self.backend_time += elapsed
+
+    def get_stats(self) -> Dict:
+        """Повторения, вызовы и повторений в секунду времени backend'а"""
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "repetitions": self.repetitions,
+                "rounds": self.repetitions // MALA_SIZE,
+                "lost_calls": self.lost_calls,
+                "lost_repetitions": self.lost_repetitions,
+                "repetitions_per_call": self.repetitions / self.calls if self.calls else None,
+                "repetitions_per_second": (self.repetitions / self.backend_time
+                                           if self.backend_time else None)
+            }
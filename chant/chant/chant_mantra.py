@@ -7,22 +7,31 @@ import requests
 import json
 import time
 import logging
-from typing import Dict, Any
+from typing import Dict, Any, Iterable, List, Optional
 import sys
 import os
+from concurrent.futures import ThreadPoolExecutor
 
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('chant.log'),
-        logging.StreamHandler(sys.stdout)
-    ]
-)
+from ollama_client import DEFAULT_CONNECT_TIMEOUT, DEFAULT_POOL_SIZE, DEFAULT_READ_TIMEOUT
+from local_backend import (context_limit, preload_prompts, set_batching, set_num_threads, set_quantization,
+                           DEFAULT_MAX_BATCH_SIZE, DEFAULT_BATCH_WAIT, QUANTIZE_MODES)
+from backend_pool import (Backend, BackendPool, NoBackendAvailable, backends_from_config, DEFAULT_PROBE_INTERVAL,
+                          GLOBAL_CONFIG)
+from chant_batch import ChantCounter, build_chant_prompt, split_round, validate_batch_size, MALA_SIZE
+from chant_session import ChantSession, DEFAULT_CONTEXT_RESET, session_max_tokens
+from logging_setup import CHANT_LINE, add_logging_arguments, setup_logging_from_args
+
+# Логирование настраивается в main: запись в файл идет в фоновом потоке
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+# Промпт запроса: мантра с повторениями
+MANTRA_PROMPT = "Повтори махамантру: {}"
 
 class ChantMantra:
-    def __init__(self, ollama_url: str = "http://localhost:11434", model_name: str = "mozgach", language: str = "russian"):
+    def __init__(self, ollama_url: str = "http://localhost:11434", model_name: str = "mozgach", language: str = "russian",
+                 pool_size: int = DEFAULT_POOL_SIZE, chant_context: bool = False,
+                 context_reset: int = DEFAULT_CONTEXT_RESET, backends: Optional[List] = None,
+                 probe_interval: float = DEFAULT_PROBE_INTERVAL):
         """
         Инициализация класса для отправки махамантры
         
@@ -30,8 +39,14 @@ class ChantMantra:
             ollama_url: URL Ollama сервера
             model_name: Название модели для использования
             language: Язык махамантры ("russian" или "thai")
+            pool_size: Размер пула keep-alive соединений к Ollama
+            chant_context: Передавать context ответа в следующий запрос
+            context_reset: Сбрасывать context после стольких запросов
+            backends: Серверы Ollama ("URL" или "URL=ВЕС"), вместо ollama_url
+            probe_interval: Период проверки здоровья серверов (с)
         """
         self.ollama_url = ollama_url
+        self.backend_pool = BackendPool.from_specs(backends or [ollama_url], pool_size, probe_interval)
         self.model_name = model_name
         self.language = language
         
@@ -46,53 +61,58 @@ class ChantMantra:
         }
         
         self.mantra = self.mantras.get(language, self.mantras["russian"])
+        self.counter = ChantCounter()  # Засчитанные повторения мантры
+        self.session_context = ChantSession(context_reset, session_max_tokens(
+            context_limit(backend.url) for backend in self.backend_pool.backends)) if chant_context else None
         
         # Проверяем доступность Ollama
         self.check_ollama_connection()
     
     def check_ollama_connection(self) -> bool:
-        """Проверяет соединение с Ollama сервером"""
-        try:
-            response = requests.get(f"{self.ollama_url}/api/tags", timeout=5)
-            if response.status_code == 200:
-                logging.info(f"✅ Соединение с Ollama установлено: {self.ollama_url}")
-                return True
+        """Проверяет соединение с серверами Ollama и запускает их периодическую проверку"""
+        self.backend_pool.start()
+        for backend in self.backend_pool.backends:
+            if backend.healthy:
+                logging.info(f"✅ Соединение с Ollama установлено: {backend.url}")
             else:
-                logging.error(f"❌ Ollama недоступен. Статус: {response.status_code}")
-                return False
-        except requests.exceptions.RequestException as e:
-            logging.error(f"❌ Не удается подключиться к Ollama: {e}")
-            return False
+                logging.error(f"❌ Не удается подключиться к Ollama {backend.url}: {backend.last_error}")
+        return bool(self.backend_pool.healthy_backends())
     
     def check_model_availability(self) -> bool:
-        """Проверяет доступность модели"""
-        try:
-            response = requests.get(f"{self.ollama_url}/api/tags", timeout=5)
-            if response.status_code == 200:
-                models = response.json().get('models', [])
-                model_names = [model['name'] for model in models]
-                
-                if self.model_name in model_names:
-                    logging.info(f"✅ Модель '{self.model_name}' доступна")
-                    return True
-                else:
-                    logging.warning(f"⚠️ Модель '{self.model_name}' не найдена. Доступные модели: {model_names}")
-                    return False
-            return False
-        except Exception as e:
-            logging.error(f"❌ Ошибка при проверке модели: {e}")
-            return False
+        """Проверяет доступность модели хотя бы на одном сервере"""
+        self.backend_pool.probe()
+        healthy = self.backend_pool.healthy_backends()
+        model_names = sorted({name for backend in healthy for name in backend.models})
+        if self.model_name in model_names or any(backend.local for backend in healthy):
+            logging.info(f"✅ Модель '{self.model_name}' доступна")
+            return True
+        logging.warning(f"⚠️ Модель '{self.model_name}' не найдена. Доступные модели: {model_names}")
+        return False
+    
+    def mantra_prompt(self, repetitions: int = 1, mantra: Optional[str] = None) -> str:
+        """Промпт запроса с repetitions повторениями мантры"""
+        return MANTRA_PROMPT.format(build_chant_prompt(mantra or self.mantra, repetitions))
     
-    def send_mantra(self) -> Dict[str, Any]:
+    def preload_local_prompts(self, repetitions: Iterable[int] = (1,)):
+        """Промпты мантр всех языков модели local:// кодируют в токены один раз, до первого запроса"""
+        if any(backend.local for backend in self.backend_pool.backends):
+            preload_prompts(self.mantra_prompt(count, mantra)
+                            for mantra in self.mantras.values() for count in sorted(set(repetitions)))
+    
+    def send_mantra(self, repetitions: int = 1) -> Dict[str, Any]:
         """
         Отправляет махамантру к AI модели
         
+        Args:
+            repetitions: Повторений мантры в одном запросе (1-108)
+        
         Returns:
             Dict с ответом от модели
         """
+        validate_batch_size(repetitions)
         payload = {
             "model": self.model_name,
-            "prompt": f"Повтори махамантру: {self.mantra}",
+            "prompt": self.mantra_prompt(repetitions),
             "stream": False,
             "options": {
                 "temperature": 0.7,
@@ -100,41 +120,102 @@ class ChantMantra:
                 "num_predict": 100
             }
         }
+        context = (self.session_context.current(payload["prompt"], payload["options"]["num_predict"])
+                   if self.session_context else None)
+        if context:
+            payload["context"] = context
         
+        started = time.perf_counter()
         try:
-            logging.info(f"🕉️ Отправляю махамантру: {self.mantra}")
+            logging.info(f"🕉️ Отправляю махамантру: {self.mantra}"
+                         + (f" (x{repetitions})" if repetitions > 1 else ""), extra=CHANT_LINE)
             
-            response = requests.post(
-                f"{self.ollama_url}/api/generate",
-                json=payload,
-                timeout=30
-            )
+            def generate(backend: Backend) -> requests.Response:
+                response = backend.session.post(
+                    f"{backend.url}/api/generate",
+                    json=payload,
+                    # Длинный промпт дольше обрабатывается на CPU
+                    timeout=(DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT + repetitions)
+                )
+                if response.status_code >= 500:
+                    response.raise_for_status()  # Сбой сервера - повтор на другом сервере пула
+                return response
+            
+            response = self.backend_pool.call(generate)
             
             if response.status_code == 200:
                 result = response.json()
-                logging.info(f"✅ Ответ получен: {result.get('response', '')[:100]}...")
+                self.counter.record(repetitions, time.perf_counter() - started)
+                if self.session_context:
+                    self.session_context.update(result, context is not None, payload["prompt"])
+                logging.info(f"✅ Ответ получен: {result.get('response', '')[:100]}...", extra=CHANT_LINE)
                 return result
             else:
+                self.counter.record_lost(repetitions, time.perf_counter() - started)
                 logging.error(f"❌ Ошибка API: {response.status_code} - {response.text}")
                 return {"error": f"HTTP {response.status_code}", "details": response.text}
                 
+        except NoBackendAvailable as e:
+            # Запрос не отправлялся: автоматы защиты серверов разомкнуты
+            self.counter.record_lost(repetitions, time.perf_counter() - started)
+            logging.warning(f"⏸️ {e}")
+            return {"error": "No backend available", "details": str(e), "retry_after": e.retry_after}
         except requests.exceptions.RequestException as e:
+            self.counter.record_lost(repetitions, time.perf_counter() - started)
             logging.error(f"❌ Ошибка запроса: {e}")
             return {"error": "Request failed", "details": str(e)}
         except json.JSONDecodeError as e:
+            self.counter.record_lost(repetitions, time.perf_counter() - started)
             logging.error(f"❌ Ошибка парсинга JSON: {e}")
             return {"error": "JSON parse error", "details": str(e)}
     
-    def continuous_chant(self, interval: int = 60, max_requests: int = None):
+    def chant_round(self, repetitions: int = MALA_SIZE, batch_size: int = MALA_SIZE,
+                    concurrency: int = 1) -> Dict[str, Any]:
+        """
+        Отправляет круг повторений пакетами, при concurrency > 1 - параллельными запросами
+        
+        Args:
+            repetitions: Всего повторений (по умолчанию полный круг четок)
+            batch_size: Повторений в одном запросе
+            concurrency: Число одновременных запросов (с context - всегда 1: цепочка context последовательна)
+        
+        Returns:
+            Dict с числом засчитанных повторений, временем и повторениями в секунду
+        """
+        batches = split_round(repetitions, validate_batch_size(batch_size))
+        if self.session_context:
+            # Параллельные запросы отправили бы один context и перезаписали бы ответы друг друга
+            concurrency = 1
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+            results = list(executor.map(self.send_mantra, batches))
+        elapsed = time.perf_counter() - started
+        
+        chanted = sum(size for size, result in zip(batches, results) if "error" not in result)
+        failed = sum(1 for result in results if "error" in result)
+        return {
+            "repetitions": chanted,
+            "calls": len(batches),
+            "failed_calls": failed,
+            "elapsed": elapsed,
+            "repetitions_per_second": chanted / elapsed if elapsed else None
+        }
+    
+    def continuous_chant(self, interval: int = 60, max_requests: int = None,
+                         repetitions: int = 1, batch_size: int = MALA_SIZE, concurrency: int = 1):
         """
         Постоянно отправляет махамантру с заданным интервалом
         
         Args:
             interval: Интервал между запросами в секундах
             max_requests: Максимальное количество запросов (None = бесконечно)
+            repetitions: Повторений мантры за один запрос (больше 1 - круг через chant_round)
+            batch_size: Повторений в одном вызове модели при repetitions > 1
+            concurrency: Одновременных вызовов модели при repetitions > 1
         """
         logging.info(f"🚀 Начинаю непрерывную отправку махамантры каждые {interval} секунд")
         logging.info(f"🕉️ Махамантра: {self.mantra}")
+        self.preload_local_prompts(split_round(repetitions, min(batch_size, repetitions)) if repetitions > 1 else [1])
         
         request_count = 0
         
@@ -145,14 +226,19 @@ class ChantMantra:
                     break
                 
                 request_count += 1
-                logging.info(f"📝 Запрос #{request_count}")
+                logging.info(f"📝 Запрос #{request_count}", extra=CHANT_LINE)
                 
                 # Отправляем махамантру
-                result = self.send_mantra()
+                if repetitions > 1:
+                    result = self.chant_round(repetitions, min(batch_size, repetitions), concurrency)
+                    if result["failed_calls"]:
+                        result["error"] = f"{result['failed_calls']} из {result['calls']} вызовов неудачны"
+                else:
+                    result = self.send_mantra()
                 
                 # Логируем результат
                 if "error" not in result:
-                    logging.info(f"✅ Запрос #{request_count} успешен")
+                    logging.info(f"✅ Запрос #{request_count} успешен", extra=CHANT_LINE)
                 else:
                     logging.error(f"❌ Запрос #{request_count} неудачен: {result.get('error')}")
                 
@@ -160,7 +246,7 @@ class ChantMantra:
                 if max_requests and request_count >= max_requests:
                     break
                     
-                logging.info(f"⏳ Ожидание {interval} секунд до следующего запроса...")
+                logging.info(f"⏳ Ожидание {interval} секунд до следующего запроса...", extra=CHANT_LINE)
                 time.sleep(interval)
                 
         except KeyboardInterrupt:
@@ -168,7 +254,14 @@ class ChantMantra:
         except Exception as e:
             logging.error(f"❌ Неожиданная ошибка: {e}")
         finally:
-            logging.info(f"🏁 Завершено. Всего отправлено запросов: {request_count}")
+            logging.info(f"🏁 Завершено. Всего отправлено запросов: {request_count}, "
+                         f"засчитано повторений мантры: {self.counter.repetitions}")
+            if self.session_context:
+                stats = self.session_context.get_stats()
+                if stats["prompt_eval_saved"] is not None:
+                    logging.info(f"⚡ Контекст сэкономил {stats['prompt_eval_saved']:.2f}s prompt eval: "
+                                 f"{stats['prompt_eval_avg_fresh'] * 1000:.0f}ms без контекста, "
+                                 f"{stats['prompt_eval_avg_reused'] * 1000:.0f}ms с контекстом")
     
     def change_language(self, new_language: str):
         """
@@ -199,11 +292,39 @@ def main():
     parser.add_argument("--interval", type=int, default=60, help="Интервал между запросами в секундах")
     parser.add_argument("--max-requests", type=int, help="Максимальное количество запросов")
     parser.add_argument("--language", choices=["russian", "thai", "harkonnen", "atreides", "freemen"], default="russian", help="Язык махамантры")
+    parser.add_argument("--pool-size", type=int, default=DEFAULT_POOL_SIZE, help="Размер пула keep-alive соединений к Ollama")
+    parser.add_argument("--backend", action="append", metavar="URL[=ВЕС]", help="Сервер Ollama в пуле (можно указать несколько раз; заменяет --url)")
+    parser.add_argument("--backends-config", nargs="?", const=GLOBAL_CONFIG, help="Взять серверы из конфига (по умолчанию config/global.json)")
+    parser.add_argument("--local-threads", type=int, help="Потоков torch для серверов local:// (генерация в процессе на CPU)")
+    parser.add_argument("--local-batch", type=int, default=DEFAULT_MAX_BATCH_SIZE, help="Максимум одновременных запросов в одном пакете генерации local:// (1 - без батчинга)")
+    parser.add_argument("--local-batch-wait", type=float, default=DEFAULT_BATCH_WAIT, help="Сколько ждать запросы в пакет генерации local:// (с)")
+    parser.add_argument("--local-quantize", choices=QUANTIZE_MODES, help="int8-квантизация модели local:// на CPU")
+    parser.add_argument("--probe-interval", type=float, default=DEFAULT_PROBE_INTERVAL, help="Период проверки здоровья серверов (с)")
+    parser.add_argument("--chant-context", action="store_true", help="Передавать context Ollama из запроса в запрос")
+    parser.add_argument("--context-reset", type=int, default=DEFAULT_CONTEXT_RESET, help="Сбрасывать context после стольких запросов")
+    parser.add_argument("--repetitions", type=int, default=1, help="Повторений мантры за один запрос (108 - полный круг)")
+    parser.add_argument("--batch-size", type=int, default=MALA_SIZE, help="Повторений мантры в одном вызове модели")
+    parser.add_argument("--concurrency", type=int, default=1, help="Одновременных вызовов модели при пакетном чантинге")
+    
+    add_logging_arguments(parser, 'chant.log')
     
     args = parser.parse_args()
+    setup_logging_from_args(args, LOG_FORMAT, sys.stdout)
+    set_num_threads(args.local_threads)
+    set_batching(args.local_batch, args.local_batch_wait)
+    set_quantization(args.local_quantize)
+    
+    # Пул серверов Ollama: --backend и конфиг; без них - единственный сервер --url
+    backends = list(args.backend or [])
+    if args.backends_config:
+        backends.extend(backends_from_config(args.backends_config))
+    
+    if args.chant_context and args.concurrency > 1:
+        logging.warning("⚠️  С --chant-context запросы отправляются по одному: --concurrency игнорируется")
     
     # Создаем экземпляр класса
-    chanter = ChantMantra(args.url, args.model, args.language)
+    chanter = ChantMantra(args.url, args.model, args.language, args.pool_size, args.chant_context, args.context_reset,
+                          backends or None, args.probe_interval)
     
     # Проверяем доступность модели
     if not chanter.check_model_availability():
@@ -215,7 +336,7 @@ def main():
     logging.info(f"🌍 Выбранный язык: {args.language}")
     
     # Запускаем непрерывную отправку
-    chanter.continuous_chant(args.interval, args.max_requests)
+    chanter.continuous_chant(args.interval, args.max_requests, args.repetitions, args.batch_size, args.concurrency)
 
 if __name__ == "__main__":
     main()
@@ -9,50 +9,107 @@ import time
 import requests
 import json
 import logging
-from typing import Dict, List, Optional
-from queue import Queue, Empty
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+from queue import Empty, Full
 import signal
 import sys
 
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(threadName)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('chant_multithread.log'),
-        logging.StreamHandler()
-    ]
-)
+from ollama_client import (close_all_sessions, read_generate_stream, GenerationCancelled,
+                           DEFAULT_CONNECT_TIMEOUT, DEFAULT_POOL_SIZE, DEFAULT_READ_TIMEOUT, DEFAULT_TIMEOUT,
+                           GENERATION_OPTIONS)
+from backend_pool import (Backend, BackendPool, NoBackendAvailable, backends_from_config, split_backend_spec,
+                          DEFAULT_FAILURE_THRESHOLD, DEFAULT_PROBE_INTERVAL, GLOBAL_CONFIG)
+from circuit_breaker import DEFAULT_MAX_DELAY
+from cursor_request import CursorRequest, CursorResult, CursorRequestError, QueueFullError
+from dispatch import Dispatcher, Ewma, POLICIES, LeastLoadedPolicy, expected_wait
+from work_queue import StealableQueue, find_victims, steal_request
+from mantras import MANTRAS, DEFAULT_LANGUAGES, FALLBACK_LANGUAGE
+from chant_batch import ChantCounter, build_chant_prompt, validate_batch_size, MALA_SIZE
+from response_cache import ResponseCache, make_key, DEFAULT_CACHE_SIZE, DEFAULT_CACHE_TTL
+from chant_session import ChantSession, DEFAULT_CONTEXT_RESET, session_max_tokens
+from local_backend import (context_limit, preload_prompts, set_batching, set_num_threads, set_quantization,
+                           DEFAULT_MAX_BATCH_SIZE, DEFAULT_BATCH_WAIT, QUANTIZE_MODES)
+from warmup import warm_up, unload, merge_summaries, parse_keep_alive, DEFAULT_KEEP_ALIVE, KeepAlive
+from metrics import ChantMetrics
+from scheduler import WeightedScheduler, CHANT, CURSOR, failure_pause
+
+from logging_setup import CHANT_LINE, add_logging_arguments, setup_logging_from_args
+
+# Логирование настраивается в main: запись в файл идет в фоновом потоке
+LOG_FORMAT = '%(asctime)s - %(threadName)s - %(levelname)s - %(message)s'
 logger = logging.getLogger(__name__)
 
 class ChantWorker:
     """Рабочий поток для одной модели с автоматическим чантингом"""
     
     def __init__(self, thread_id: int, language: str, ollama_url: str = "http://localhost:11434", 
-                 chant_ratio: float = 0.8, cursor_ratio: float = 0.2):
+                 chant_ratio: float = 0.8, cursor_ratio: float = 0.2, pool_size: int = DEFAULT_POOL_SIZE,
+                 stream: bool = False, preempt: bool = True, work_stealing: bool = True,
+                 max_queue_size: int = 0, chant_batch: int = 1,
+                 response_cache: Optional[ResponseCache] = None, chant_context: bool = False,
+                 context_reset: int = DEFAULT_CONTEXT_RESET, keep_alive: KeepAlive = DEFAULT_KEEP_ALIVE,
+                 metrics: Optional[ChantMetrics] = None, backend_pool: Optional[BackendPool] = None,
+                 timeout: Tuple[float, float] = DEFAULT_TIMEOUT):
         self.thread_id = thread_id
         self.language = language
         self.ollama_url = ollama_url
+        # Серверы Ollama с общими keep-alive пулами соединений
+        self.backend_pool = backend_pool or BackendPool.from_specs([ollama_url], pool_size)
         self.model_name = "mozgach:latest"
+        self.keep_alive = keep_alive  # Передается с каждым запросом: модель не выгружается во время чантинга
+        self.timeout = timeout  # (соединение, чтение ответа) в секундах
+        self.backoff_until = 0.0  # До этого момента (monotonic) серверы отключены автоматом защиты
         self.running = False
-        self.request_queue = Queue()
+        self.request_queue = StealableQueue(max_queue_size)  # 0 - без ограничения
         self.last_request_time = time.time()
         self.chanting_active = True
         
         # Коэффициенты разбавки: чантинг vs запросы курсора
-        self.chant_ratio = chant_ratio      # 80% времени на чантинг
-        self.cursor_ratio = cursor_ratio    # 20% времени на запросы курсора
-        self.chant_interval = 0.1          # Интервал между чантингом (100ms)
-        self.cursor_interval = 0.5         # Интервал после обработки запроса курсора
+        self.chant_ratio = chant_ratio      # 80% времени модели на чантинг
+        self.cursor_ratio = cursor_ratio    # 20% времени модели на запросы курсора
+        self.scheduler = WeightedScheduler({CHANT: chant_ratio, CURSOR: cursor_ratio})
+        self._wakeup = threading.Event()   # Прерывает паузу чантинга при запросе курсора
+        self.chant_failures = 0             # Неудачных чантов подряд: пауза растет экспоненциально
+        
+        # Потоковая генерация для запросов курсора и её тайминги
+        self.stream = stream
+        self.last_timing: Optional[Dict] = None
+        self.last_result: Optional[Dict] = None  # Последний ответ Ollama со статистикой
+        self.last_error: Optional[str] = None
+        self.stream_stats = {"requests": 0, "ttft_sum": 0.0, "ttft_max": 0.0,
+                             "inter_token_sum": 0.0, "inter_token_count": 0}
+        
+        # Вытеснение чантинга: запрос курсора прерывает выполняющийся чант
+        self.preempt = preempt
+        self._preempt_event = threading.Event()
+        self.chant_in_flight = False
+        self.cursor_in_flight = False
+        self.latency = Ewma()  # EWMA задержки backend'а для диспетчера
+        self.preempted_chants = 0
+        self.cursor_wait_stats = {"requests": 0, "wait_sum": 0.0, "wait_max": 0.0}
+        
+        # Work stealing: свободный поток забирает запросы курсора у загруженных соседей
+        self.work_stealing = work_stealing
+        self.peers: List["ChantWorker"] = []
+        self.stolen_requests = 0
         
         # Махамантры на разных языках
-        self.mantras = {
-            "russianscsm": "Харей Кришна Харей Кришна Кришна Кришна Харей Харе Харей Рама Харей Рама Рама Рама Харей Харе",
-            "thai": "ฮาเร กฤษณะ ฮาเร กฤษณะ กฤษณะ กฤษณะ ฮาเร ฮาเร ฮาเร ราม ฮาเร ราม ราม ราม ฮาเร ฮาเร",
-            "harkonnen": "Ḥāre Kṛṣṇa Ḥāre Kṛṣṇa Kṛṣṇa Kṛṣṇa Ḥāre Ḥāre Ḥāre Rāma Ḥāre Rāma Rāma Rāma Ḥāre Ḥāre"
-        }
+        self.mantras = dict(MANTRAS)
+        
+        self.current_mantra = self.mantras.get(language, self.mantras[FALLBACK_LANGUAGE])
+        
+        # Пакетный чантинг: повторений мантры за один вызов модели
+        self.chant_batch = validate_batch_size(chant_batch)
+        self.chant_counter = ChantCounter()
         
-        self.current_mantra = self.mantras.get(language, self.mantras["russianscsm"])
+        # Сессия чантинга: context Ollama переносится из чанта в чант, в пределах окна самой короткой модели пула
+        self.chant_session = ChantSession(context_reset, session_max_tokens(
+            context_limit(backend.url) for backend in self.backend_pool.backends)) if chant_context else None
+        
+        # Общий кэш ответов курсора (заполняется потоками, читается менеджером)
+        self.response_cache = response_cache
+        self.metrics = metrics or ChantMetrics()
         
     def start(self):
         """Запуск рабочего потока"""
@@ -68,132 +125,386 @@ class ChantWorker:
         self.chanting_active = False
         logger.info(f"Остановка рабочего потока {self.thread_id}")
         
-    def add_request(self, request: str):
-        """Добавление запроса от курсора"""
-        self.request_queue.put(request)
+    def add_request(self, request: str, language: Optional[str] = None, thread_id: Optional[int] = None,
+                    on_token: Optional[Callable[[str], None]] = None) -> Future:
+        """
+        Добавление запроса от курсора
+        
+        Args:
+            request: Текст запроса
+            language: Язык, к потокам которого привязан запрос (None - любой поток)
+            thread_id: Поток, к которому жестко привязан запрос (не переносится соседям)
+            on_token: Вызывается с каждым фрагментом ответа; запрос выполняется в потоковом режиме
+            
+        Returns:
+            Future, который разрешится в CursorResult
+            
+        Raises:
+            queue.Full: Очередь потока заполнена
+        """
+        cursor_request = CursorRequest(request, language=language, thread_id=thread_id, on_token=on_token)
+        self.request_queue.put_nowait(cursor_request)
         self.last_request_time = time.time()
         self.chanting_active = False  # Временно отключаем чантинг
+        self._wakeup.set()
+        
+        # При накоплении очереди будим соседей, чтобы они забрали часть запросов
+        if self.work_stealing and (self.request_queue.qsize() >= 2 or self.cursor_in_flight):
+            for peer in self.peers:
+                if peer is not self:
+                    peer._wakeup.set()
+        
+        # Прерываем выполняющийся чант, если планировщик отдает время курсору
+        if self.preempt and self.chant_in_flight and self.scheduler.should_preempt(CHANT, CURSOR):
+            self._preempt_event.set()
         logger.info(f"Получен запрос в потоке {self.thread_id}: {request[:50]}...")
+        return cursor_request.future
+        
+    def fail_pending(self, reason: str):
+        """Завершает ошибкой все запросы, оставшиеся в очереди"""
+        while True:
+            try:
+                request = self.request_queue.get_nowait()
+            except Empty:
+                break
+            if request.future.set_running_or_notify_cancel():
+                request.future.set_exception(CursorRequestError(reason))
         
     def _work_loop(self):
-        """Основной цикл работы с коэффициентом разбавки"""
-        chant_counter = 0
+        """Основной цикл работы: доли времени модели делит взвешенный планировщик"""
         cursor_counter = 0
         
         while self.running:
             try:
-                # Проверяем запросы от курсора (с коэффициентом разбавки)
-                try:
-                    request = self.request_queue.get_nowait()
+                self._preempt_event.clear()
+                ready = [CHANT]
+                if not self.request_queue.empty():
+                    ready.append(CURSOR)
+                elif self.work_stealing and find_victims(self, self.peers):
+                    ready.append(CURSOR)
+                else:
+                    self.chanting_active = True
+                
+                kind = self.scheduler.choose(ready)
+                started = time.perf_counter()
+                
+                if kind == CURSOR:
+                    try:
+                        request = self.request_queue.get_nowait()
+                    except Empty:
+                        request = steal_request(self, self.peers) if self.work_stealing else None
+                        if request is None:
+                            continue
+                        self.stolen_requests += 1
+                        logger.info(f"Поток {self.thread_id} забрал запрос курсора у соседнего потока")
                     self._process_cursor_request(request)
                     self.last_request_time = time.time()
+                    self.scheduler.charge(CURSOR, time.perf_counter() - started)
                     cursor_counter += 1
                     
                     # Логируем статистику разбавки
                     if cursor_counter % 5 == 0:  # Каждые 5 запросов
-                        total = chant_counter + cursor_counter
-                        chant_percent = (chant_counter / total) * 100 if total > 0 else 0
-                        cursor_percent = (cursor_counter / total) * 100 if total > 0 else 0
-                        logger.info(f"Поток {self.thread_id} - Статистика: Чантинг {chant_percent:.1f}%, Курсор {cursor_percent:.1f}%")
-                    
-                    # Возвращаемся к чантинг с задержкой
-                    time.sleep(self.cursor_interval)
+                        stats = self.scheduler.get_stats()
+                        logger.info(f"Поток {self.thread_id} - Статистика: "
+                                    f"Чантинг {stats['achieved'][CHANT] * 100:.1f}% (цель {stats['target'][CHANT] * 100:.1f}%), "
+                                    f"Курсор {stats['achieved'][CURSOR] * 100:.1f}% (цель {stats['target'][CURSOR] * 100:.1f}%)")
                     continue
-                except Empty:
-                    pass
                 
-                # Основной режим - чантинг махамантры (приоритет)
-                if self.chanting_active and (time.time() - self.last_request_time) > self.cursor_interval:
-                    self._chant_mantra()
-                    chant_counter += 1
-                    time.sleep(self.chant_interval)  # Пауза между чантингом
+                # Чантинг махамантры, затем пауза, чтобы он не превышал свою долю времени модели
+                self._chant_mantra()
+                elapsed = time.perf_counter() - started
+                self.scheduler.charge(CHANT, elapsed)
+                pause = self.scheduler.pause_after(CHANT, elapsed)
+                # Неудачный чант (не прерванный) - пауза не короче CHANT_INTERVAL, растет при сбоях подряд
+                if self.last_error:
+                    self.chant_failures += 1
+                    pause = max(pause, failure_pause(self.chant_failures))
                 else:
-                    time.sleep(self.chant_interval)  # Небольшая пауза
+                    self.chant_failures = 0
+                # Пока автоматы защиты серверов разомкнуты, чанты не отправляются
+                pause = max(pause, self.backoff_until - time.monotonic())
+                self._wakeup.wait(pause)
+                self._wakeup.clear()
                     
             except Exception as e:
                 logger.error(f"Ошибка в потоке {self.thread_id}: {e}")
                 time.sleep(1)
                 
-    def _process_cursor_request(self, request: str):
+    def _process_cursor_request(self, request: CursorRequest):
         """Обработка запроса от курсора"""
+        # Вызывающий мог отменить future, пока запрос ждал в очереди
+        if not request.future.set_running_or_notify_cancel():
+            return
+            
         try:
-            logger.info(f"Обрабатываю запрос курсора в потоке {self.thread_id}")
+            wait = request.queue_wait()
+            self._record_queue_wait(wait)
+            logger.info(f"Обрабатываю запрос курсора в потоке {self.thread_id} (ожидание в очереди {wait * 1000:.0f}ms)")
             
             # Отправляем запрос к модели
-            response = self._send_to_model(request)
+            # С on_token запрос идет потоком, даже если --stream не включен
+            stream = self.stream or request.on_token is not None
+            self.cursor_in_flight = True
+            started = time.perf_counter()
+            try:
+                response = self._send_to_model(request.prompt, stream=stream, on_token=request.on_token)
+            finally:
+                self.cursor_in_flight = False
+            backend_time = time.perf_counter() - started
+            if stream and self.last_timing:
+                self._record_stream_timing(self.last_timing)
             
+            if response is None:
+                self.metrics.observe_error(self, CURSOR)
+                request.future.set_exception(CursorRequestError(self.last_error or "Нет ответа от модели"))
+                return
+                
             if response:
                 logger.info(f"Получен ответ от модели в потоке {self.thread_id}: {response[:100]}...")
             else:
                 logger.warning(f"Пустой ответ от модели в потоке {self.thread_id}")
                 
+            result = self.last_result or {}
+            if self.response_cache is not None:
+                self.response_cache.put(make_key(self.model_name, request.prompt, GENERATION_OPTIONS), {
+                    "response": response,
+                    "eval_count": result.get('eval_count'),
+                    "prompt_eval_count": result.get('prompt_eval_count')
+                })
+            total_time = request.queue_wait()
+            self.metrics.observe_cursor(self, wait, backend_time, total_time, result)
+            request.future.set_result(CursorResult(
+                response=response,
+                thread_id=self.thread_id,
+                queue_wait=wait,
+                backend_time=backend_time,
+                total_time=total_time,
+                eval_count=result.get('eval_count'),
+                prompt_eval_count=result.get('prompt_eval_count'),
+                ttft=self.last_timing.get('ttft') if stream and self.last_timing else None
+            ))
+                
         except Exception as e:
             logger.error(f"Ошибка обработки запроса курсора в потоке {self.thread_id}: {e}")
+            self.metrics.observe_error(self, CURSOR)
+            if not request.future.done():
+                request.future.set_exception(e)
             
     def _chant_mantra(self):
         """Отправка махамантры к модели"""
         try:
             mantra = f"Чантинг на языке {self.language}: {self.current_mantra}"
-            logger.info(f"Поток {self.thread_id}: {mantra}")
+            if self.chant_batch > 1:
+                mantra += f" (x{self.chant_batch})"
+            logger.info(f"Поток {self.thread_id}: {mantra}", extra=CHANT_LINE)
             
-            # Отправляем махамантру к модели
-            response = self._send_to_model(self.current_mantra)
+            # Отправляем махамантру к модели; в потоковом режиме её можно прервать
+            prompt = build_chant_prompt(self.current_mantra, self.chant_batch)
+            context = (self.chant_session.current(prompt, GENERATION_OPTIONS["max_tokens"])
+                       if self.chant_session else None)
+            self.chant_in_flight = True
+            started = time.perf_counter()
+            try:
+                response = self._send_to_model(prompt, stream=self.preempt,
+                                               cancel=self._preempt_event if self.preempt else None,
+                                               context=context)
+            finally:
+                self.chant_in_flight = False
+            
+            # Прерванный или неудачный пакет не засчитывается
+            elapsed = time.perf_counter() - started
+            if response is None:
+                self.chant_counter.record_lost(self.chant_batch, elapsed)
+                if self.last_error:
+                    self.metrics.observe_error(self, CHANT)
+                else:
+                    self.metrics.observe_preempted(self)
+            else:
+                self.chant_counter.record(self.chant_batch, elapsed)
+                self.metrics.observe_chant(self, elapsed, self.chant_batch, self.last_result)
+                if self.chant_session:
+                    self.chant_session.update(self.last_result or {}, context is not None, prompt)
             
             if response:
-                logger.debug(f"Модель в потоке {self.thread_id} ответила на мантру")
+                logger.debug(f"Модель в потоке {self.thread_id} ответила на мантру", extra=CHANT_LINE)
             else:
-                logger.debug(f"Модель в потоке {self.thread_id} не ответила на мантру")
+                logger.debug(f"Модель в потоке {self.thread_id} не ответила на мантру", extra=CHANT_LINE)
                 
         except Exception as e:
             logger.error(f"Ошибка чантинга в потоке {self.thread_id}: {e}")
+            self.last_error = f"Ошибка чантинга: {e}"
             
-    def _send_to_model(self, prompt: str) -> Optional[str]:
-        """Отправка запроса к модели через Ollama API"""
+    def _send_to_model(self, prompt: str, stream: bool = False,
+                       on_token: Optional[Callable[[str], None]] = None,
+                       cancel: Optional[threading.Event] = None,
+                       context: Optional[List[int]] = None) -> Optional[str]:
+        """
+        Отправка запроса к модели через Ollama API
+        
+        Args:
+            prompt: Текст запроса
+            stream: Потоковый режим - ответ читается по NDJSON-чанкам по мере генерации
+            on_token: Вызывается с каждым фрагментом текста (только в потоковом режиме)
+            cancel: Событие прерывания генерации (только в потоковом режиме)
+            context: context из предыдущего ответа Ollama (продолжение сессии)
+        """
+        started = time.perf_counter()
+        self.last_result = None
+        self.last_error = None
         try:
-            url = f"{self.ollama_url}/api/generate"
             payload = {
                 "model": self.model_name,
                 "prompt": prompt,
-                "stream": False,
-                "options": {
-                    "temperature": 0.7,
-                    "top_p": 0.9,
-                    "max_tokens": 100
-                }
+                "stream": stream,
+                "options": GENERATION_OPTIONS,
+                "keep_alive": self.keep_alive
             }
+            if context:
+                payload["context"] = context
             
-            response = requests.post(url, json=payload, timeout=30)
-            response.raise_for_status()
+            def generate(backend: Backend) -> str:
+                url = f"{backend.url}/api/generate"
+                if stream:
+                    with backend.session.post(url, json=payload, timeout=self.timeout, stream=True) as response:
+                        response.raise_for_status()
+                        text, timing, final = read_generate_stream(response, started, on_token, cancel)
+                    self.last_timing = timing
+                    self.last_result = dict(final, response=text)
+                    return text
+                
+                response = backend.session.post(url, json=payload, timeout=self.timeout)
+                response.raise_for_status()
+                
+                result = response.json()
+                self.last_result = result
+                return result.get('response', '')
             
-            result = response.json()
-            return result.get('response', '')
+            # При сбое сервера запрос повторяется на другом сервере пула
+            text = self.backend_pool.call(generate)
+            self.latency.update(time.perf_counter() - started)
+            return text
             
+        except GenerationCancelled:
+            # Ответ закрыт при выходе из with - Ollama прекращает генерацию
+            self.preempted_chants += 1
+            logger.debug(f"Чант в потоке {self.thread_id} прерван ради запроса курсора")
+            return None
+        except NoBackendAvailable as e:
+            # Запрос не отправлялся: серверы отключены автоматом защиты или заняты
+            self.backoff_until = time.monotonic() + e.retry_after
+            logger.debug(f"Поток {self.thread_id}: {e}")
+            self.last_error = f"Нет доступных серверов: {e}"
+            return None
         except requests.exceptions.RequestException as e:
             logger.error(f"Ошибка API в потоке {self.thread_id}: {e}")
+            self.last_error = f"Ошибка API: {e}"
             return None
         except Exception as e:
             logger.error(f"Неожиданная ошибка в потоке {self.thread_id}: {e}")
+            self.last_error = f"Неожиданная ошибка: {e}"
             return None
 
+    def _record_stream_timing(self, timing: Dict):
+        """Учет времени до первого токена и межтокенной задержки"""
+        stats = self.stream_stats
+        stats["requests"] += 1
+        if timing["ttft"] is not None:
+            stats["ttft_sum"] += timing["ttft"]
+            stats["ttft_max"] = max(stats["ttft_max"], timing["ttft"])
+        if timing["inter_token_avg"] is not None:
+            stats["inter_token_sum"] += timing["inter_token_avg"] * (timing["chunks"] - 1)
+            stats["inter_token_count"] += timing["chunks"] - 1
+        logger.debug(f"Поток {self.thread_id}: TTFT {timing['ttft']}, межтокенная задержка {timing['inter_token_avg']}")
+        
+    def _record_queue_wait(self, wait: float):
+        """Учет времени ожидания запроса курсора в очереди"""
+        stats = self.cursor_wait_stats
+        stats["requests"] += 1
+        stats["wait_sum"] += wait
+        stats["wait_max"] = max(stats["wait_max"], wait)
+        
+    def get_cursor_wait_stats(self) -> Dict:
+        """Время ожидания запросов курсора и число вытесненных чантов"""
+        stats = self.cursor_wait_stats
+        return {
+            "requests": stats["requests"],
+            "queue_wait_avg": stats["wait_sum"] / stats["requests"] if stats["requests"] else None,
+            "queue_wait_max": stats["wait_max"],
+            "preempted_chants": self.preempted_chants,
+            "stolen_requests": self.stolen_requests
+        }
+        
+    def get_stream_stats(self) -> Dict:
+        """Средние тайминги потоковой генерации"""
+        stats = self.stream_stats
+        return {
+            "requests": stats["requests"],
+            "ttft_avg": stats["ttft_sum"] / stats["requests"] if stats["requests"] else None,
+            "ttft_max": stats["ttft_max"],
+            "inter_token_avg": (stats["inter_token_sum"] / stats["inter_token_count"]
+                                if stats["inter_token_count"] else None)
+        }
+
 class ChantManager:
     """Менеджер для управления всеми рабочими потоками"""
     
     def __init__(self, ollama_url: str = "http://localhost:11434", 
-                 chant_ratio: float = 0.8, cursor_ratio: float = 0.2):
+                 chant_ratio: float = 0.8, cursor_ratio: float = 0.2, pool_size: int = DEFAULT_POOL_SIZE,
+                 languages: Optional[List[str]] = None, stream: bool = False, preempt: bool = True,
+                 dispatch_policy: str = LeastLoadedPolicy.name, work_stealing: bool = True,
+                 max_queue_size: int = 0, chant_batch: int = 1, cache_size: int = 0,
+                 cache_ttl: float = DEFAULT_CACHE_TTL, cache_path: Optional[str] = None,
+                 chant_context: bool = False, context_reset: int = DEFAULT_CONTEXT_RESET,
+                 keep_alive: KeepAlive = DEFAULT_KEEP_ALIVE, warmup: bool = True, unload_on_stop: bool = False,
+                 backends: Optional[List] = None, backend_concurrency: Optional[int] = None,
+                 probe_interval: float = DEFAULT_PROBE_INTERVAL, timeout: Tuple[float, float] = DEFAULT_TIMEOUT,
+                 breaker_threshold: int = DEFAULT_FAILURE_THRESHOLD, breaker_max_delay: float = DEFAULT_MAX_DELAY):
         self.ollama_url = ollama_url
+        self.model_name = "mozgach:latest"
         self.workers: Dict[int, ChantWorker] = {}
         self.running = False
+        self.pool_size = pool_size
+        
+        # Серверы Ollama ("URL" или "URL=ВЕС"); без списка - единственный сервер ollama_url
+        self.backend_pool = BackendPool.from_specs(backends or [ollama_url], backend_concurrency or pool_size,
+                                                   probe_interval, failure_threshold=breaker_threshold,
+                                                   breaker_max_delay=breaker_max_delay)
+        self.timeout = timeout
         
         # Коэффициенты разбавки
         self.chant_ratio = chant_ratio      # 80% времени на чантинг
         self.cursor_ratio = cursor_ratio    # 20% времени на запросы курсора
         
         # Языки для каждого потока
-        self.languages = ["russianscsm", "thai", "harkonnen"]
+        self.languages = languages or list(DEFAULT_LANGUAGES)
+        self.stream = stream
+        self.preempt = preempt
+        
+        # Выбор потока для запросов курсора без явного thread_id
+        self.dispatcher = Dispatcher(dispatch_policy)
+        self.work_stealing = work_stealing
+        self.max_queue_size = max_queue_size  # Лимит очереди потока для admission control
+        self.chant_batch = validate_batch_size(chant_batch)
+        
+        # Кэш ответов на повторяющиеся запросы курсора (cache_size=0 - выключен)
+        self.response_cache = ResponseCache(cache_size, cache_ttl, cache_path) if cache_size > 0 else None
+        
+        # Перенос context Ollama между чантами
+        self.chant_context = chant_context
+        self.context_reset = context_reset
+        
+        # Прогрев модели при запуске и keep_alive во время чантинга
+        self.keep_alive = keep_alive
+        self.warmup = warmup
+        self.unload_on_stop = unload_on_stop
+        self.warmup_stats: Optional[Dict] = None
+        
+        # Метрики Prometheus всех потоков
+        self.metrics = ChantMetrics()
         
     def start(self):
         """Запуск всех рабочих потоков"""
-        logger.info("Запуск системы чантинга с 3 потоками...")
+        logger.info(f"Запуск системы чантинга с {len(self.languages)} потоками...")
         
         # Проверяем доступность Ollama
         if not self._check_ollama():
@@ -208,10 +519,31 @@ class ChantManager:
         # Создаем и запускаем рабочие потоки
         for i, language in enumerate(self.languages):
             worker = ChantWorker(i + 1, language, self.ollama_url, 
-                               self.chant_ratio, self.cursor_ratio)
-            worker.start()
+                               self.chant_ratio, self.cursor_ratio, self.pool_size, self.stream,
+                               self.preempt, self.work_stealing, self.max_queue_size, self.chant_batch,
+                               self.response_cache, self.chant_context, self.context_reset,
+                               self.keep_alive, self.metrics, self.backend_pool, self.timeout)
             self.workers[i + 1] = worker
             
+        # Мантры всех языков модели local:// кодируют в токены один раз, до прогрева
+        if any(backend.local for backend in self.backend_pool.backends):
+            if self.stream or self.preempt:
+                # LocalAdapter отдает NDJSON только после генерации всего ответа
+                logger.warning("local:// генерирует ответ целиком: потоковая выдача (--stream, on_token), "
+                               "время до первого токена и вытеснение чанта (отключается --no-preempt) "
+                               "не действуют")
+            preload_prompts(build_chant_prompt(mantra, self.chant_batch) for mantra in MANTRAS.values())
+            
+        # Загружаем модель и прогреваем её мантрами потоков до начала работы
+        if self.warmup and not self._warm_up():
+            logger.error("Не удалось загрузить модель при прогреве")
+            return False
+            
+        # Потоки знают друг друга для work stealing
+        for worker in self.workers.values():
+            worker.peers = list(self.workers.values())
+            worker.start()
+            
         self.running = True
         logger.info("Все рабочие потоки запущены успешно!")
         return True
@@ -228,59 +560,168 @@ class ChantManager:
             if hasattr(worker, 'thread'):
                 worker.thread.join(timeout=5)
                 
+        # Необработанные запросы завершаются ошибкой, чтобы никто не ждал их вечно
+        for worker in self.workers.values():
+            worker.fail_pending("Система чантинга остановлена")
+                
+        if self.unload_on_stop:
+            for backend in self.backend_pool.healthy_backends():
+                unload(backend.session, backend.url, self.model_name)
+        self.backend_pool.stop()
+        close_all_sessions()
+        if self.response_cache:
+            self.response_cache.close()
         self.running = False
         logger.info("Система чантинга остановлена.")
         
-    def send_request(self, request: str, thread_id: Optional[int] = None):
-        """Отправка запроса от курсора"""
+    def send_request(self, request: str, thread_id: Optional[int] = None, language: Optional[str] = None,
+                     on_token: Optional[Callable[[str], None]] = None) -> Future:
+        """
+        Отправка запроса от курсора
+        
+        Args:
+            request: Текст запроса
+            thread_id: Конкретный поток (запрос не переносится соседям)
+            language: Язык потока (запрос переносится только между потоками этого языка)
+            on_token: Вызывается в рабочем потоке с каждым фрагментом ответа по мере генерации
+                (ответ из кэша передается одним фрагментом)
+            
+        Returns:
+            concurrent.futures.Future с CursorResult: полный ответ, ожидание в очереди,
+            время backend'а и число токенов. Много запросов можно отправить сразу
+            и собрать ответы через concurrent.futures.as_completed.
+        """
         if not self.running:
             logger.warning("Система не запущена")
-            return
+            future = Future()
+            future.set_exception(CursorRequestError("Система не запущена"))
+            return future
+            
+        # Повторяющийся запрос обслуживается из кэша, не занимая очередь и модель
+        cached = self._lookup_cache(request)
+        if cached is not None:
+            if on_token:
+                on_token(cached.result().response)
+            return cached
             
         if thread_id and thread_id in self.workers:
             # Отправляем в конкретный поток
-            self.workers[thread_id].add_request(request)
-            logger.info(f"Запрос отправлен в поток {thread_id}")
+            order = [self.workers[thread_id]]
+            kwargs = {"thread_id": thread_id, "on_token": on_token}
         else:
-            # Отправляем в случайный поток для балансировки нагрузки
-            import random
-            random_thread = random.choice(list(self.workers.keys()))
-            self.workers[random_thread].add_request(request)
-            logger.info(f"Запрос отправлен в случайный поток {random_thread}")
+            # Балансировка нагрузки выбранной политикой; при полной очереди - следующий поток
+            candidates = self._workers_for_language(language)
+            order = self.dispatcher.order(candidates)
+            pinned = language if language and candidates[0].language == language else None
+            kwargs = {"language": pinned, "on_token": on_token}
             
-    def _check_ollama(self) -> bool:
-        """Проверка доступности Ollama сервера"""
-        try:
-            response = requests.get(f"{self.ollama_url}/api/tags", timeout=5)
-            return response.status_code == 200
-        except:
+        for worker in order:
+            try:
+                future = worker.add_request(request, **kwargs)
+            except Full:
+                logger.debug(f"Очередь потока {worker.thread_id} заполнена, пробуем следующий поток")
+                continue
+            self.dispatcher.record(worker)
+            logger.info(f"Запрос отправлен в поток {worker.thread_id} (политика {self.dispatcher.policy.name})")
+            return future
+            
+        # Admission control: все подходящие очереди заполнены - отклоняем запрос и подсказываем, когда повторить
+        retry_after = max(1.0, min(expected_wait(worker) for worker in order))
+        names = ", ".join(str(worker.thread_id) for worker in order)
+        logger.warning(f"Очереди потоков {names} заполнены, запрос отклонен")
+        future = Future()
+        future.set_exception(QueueFullError(f"Очереди потоков {names} заполнены", retry_after))
+        return future
+            
+    def _warm_up(self) -> bool:
+        """Загрузка модели и прогрев мантрами всех потоков"""
+        logger.info(f"Прогрев модели {self.model_name} (keep_alive={self.keep_alive})...")
+        prompts = [build_chant_prompt(w.current_mantra, w.chant_batch) for w in self.workers.values()]
+        backends = self.backend_pool.healthy_backends()
+        # Серверы прогреваются параллельно: загрузка модели на каждом занимает минуты
+        with ThreadPoolExecutor(max_workers=max(1, len(backends)), thread_name_prefix="Warmup") as executor:
+            results = executor.map(lambda backend: warm_up(backend.session, backend.url, self.model_name,
+                                                           prompts, self.keep_alive), backends)
+            per_backend = {backend.url: stats for backend, stats in zip(backends, results)}
+        self.warmup_stats = merge_summaries(per_backend)
+        stats = self.warmup_stats
+        if stats["load_time"] is None:
             return False
+        logger.info(f"Модель прогрета за {stats['elapsed']:.1f}s (загрузка {stats['load_time']:.1f}s, "
+                    f"прогрето мантр: {stats['primed']}, ошибок: {stats['errors']})")
+        return True
+        
+    def _lookup_cache(self, request: str) -> Optional[Future]:
+        """Future с ответом из кэша или None при промахе"""
+        if self.response_cache is None:
+            return None
+        started = time.perf_counter()
+        value = self.response_cache.get(make_key(self.model_name, request, GENERATION_OPTIONS))
+        if value is None:
+            return None
+        logger.info(f"Ответ на запрос курсора взят из кэша: {request[:50]}...")
+        future = Future()
+        future.set_result(CursorResult(
+            response=value["response"],
+            thread_id=None,
+            queue_wait=0.0,
+            backend_time=0.0,
+            total_time=time.perf_counter() - started,
+            eval_count=value.get("eval_count"),
+            prompt_eval_count=value.get("prompt_eval_count"),
+            cached=True
+        ))
+        return future
+        
+    def _workers_for_language(self, language: Optional[str]) -> List:
+        """Потоки заданного языка или все потоки, если язык не указан или не найден"""
+        workers = list(self.workers.values())
+        if language is None:
+            return workers
+        matching = [worker for worker in workers if worker.language == language]
+        if not matching:
+            logger.warning(f"Нет потоков с языком {language}, запрос уйдет в любой поток")
+            return workers
+        return matching
+            
+    def _check_ollama(self) -> bool:
+        """Проверка доступности серверов Ollama и запуск их периодической проверки"""
+        self.backend_pool.start()
+        return bool(self.backend_pool.healthy_backends())
             
     def _check_model(self) -> bool:
-        """Проверка наличия модели mozgach:latest"""
-        try:
-            response = requests.get(f"{self.ollama_url}/api/tags", timeout=5)
-            if response.status_code == 200:
-                models = response.json().get('models', [])
-                return any('mozgach:latest' in model.get('name', '') for model in models)
-            return False
-        except:
-            return False
+        """Проверка наличия модели mozgach:latest хотя бы на одном сервере"""
+        return self.backend_pool.has_model(self.model_name)
             
     def get_status(self) -> Dict:
         """Получение статуса всех потоков"""
         status = {
             "running": self.running,
+            "dispatch": self.dispatcher.get_stats(),
+            "backends": self.backend_pool.get_stats(),
             "workers": {}
         }
+        if self.response_cache:
+            status["cache"] = self.response_cache.get_stats()
+        if self.warmup_stats:
+            status["warmup"] = self.warmup_stats
         
         for thread_id, worker in self.workers.items():
             status["workers"][thread_id] = {
                 "language": worker.language,
                 "chanting_active": worker.chanting_active,
                 "last_request_time": worker.last_request_time,
-                "queue_size": worker.request_queue.qsize()
+                "queue_size": worker.request_queue.qsize(),
+                "latency_ewma": worker.latency.value,
+                "backoff": max(0.0, worker.backoff_until - time.monotonic()),
+                "schedule": worker.scheduler.get_stats(),
+                "cursor": worker.get_cursor_wait_stats(),
+                "chanting": worker.chant_counter.get_stats()
             }
+            if worker.chant_session:
+                status["workers"][thread_id]["chanting"]["context"] = worker.chant_session.get_stats()
+            if worker.stream:
+                status["workers"][thread_id]["streaming"] = worker.get_stream_stats()
             
         return status
 
@@ -299,8 +740,77 @@ def main():
     parser.add_argument("--url", default="http://localhost:11434", help="URL Ollama сервера")
     parser.add_argument("--chant-ratio", type=float, default=0.8, help="Коэффициент времени на чантинг (0.0-1.0)")
     parser.add_argument("--cursor-ratio", type=float, default=0.2, help="Коэффициент времени на запросы курсора (0.0-1.0)")
+    parser.add_argument("--pool-size", type=int, default=DEFAULT_POOL_SIZE, help="Размер пула keep-alive соединений к Ollama")
+    parser.add_argument("--backend", action="append", metavar="URL[=ВЕС]",
+                        help="Сервер Ollama в пуле (можно указать несколько раз; заменяет --url)")
+    parser.add_argument("--backends-config", nargs="?", const=GLOBAL_CONFIG,
+                        help="Взять серверы из конфига (по умолчанию config/global.json)")
+    parser.add_argument("--backend-concurrency", type=int,
+                        help="Одновременных запросов к одному серверу (по умолчанию --pool-size)")
+    parser.add_argument("--probe-interval", type=float, default=DEFAULT_PROBE_INTERVAL,
+                        help="Период проверки здоровья серверов (с, 0 - только при запуске)")
+    parser.add_argument("--connect-timeout", type=float, default=DEFAULT_CONNECT_TIMEOUT,
+                        help="Таймаут соединения с сервером Ollama (с)")
+    parser.add_argument("--read-timeout", type=float, default=DEFAULT_READ_TIMEOUT,
+                        help="Таймаут ожидания ответа сервера Ollama (с)")
+    parser.add_argument("--breaker-threshold", type=int, default=DEFAULT_FAILURE_THRESHOLD,
+                        help="Сбоев подряд, после которых запросы к серверу приостанавливаются")
+    parser.add_argument("--breaker-max-delay", type=float, default=DEFAULT_MAX_DELAY,
+                        help="Предел паузы автомата защиты сервера (с)")
+    parser.add_argument("--local-threads", type=int,
+                        help="Потоков torch для серверов local:// (генерация в процессе на CPU)")
+    parser.add_argument("--local-batch", type=int, default=DEFAULT_MAX_BATCH_SIZE,
+                        help="Максимум одновременных запросов в одном пакете генерации local:// (1 - без батчинга)")
+    parser.add_argument("--local-batch-wait", type=float, default=DEFAULT_BATCH_WAIT,
+                        help="Сколько ждать запросы в пакет генерации local:// (с)")
+    parser.add_argument("--local-quantize", choices=QUANTIZE_MODES,
+                        help="int8-квантизация модели local:// на CPU (benchmark_quantize.py - сравнение)")
+    parser.add_argument("--languages", nargs="+", default=DEFAULT_LANGUAGES, help="Языки потоков чантинга")
+    parser.add_argument("--mode", choices=["threads", "async"], default="threads",
+                        help="Режим работы: поток на воркер или один asyncio event loop")
+    parser.add_argument("--streams-per-language", type=int, default=1,
+                        help="Количество потоков чантинга на язык (для async режима)")
+    parser.add_argument("--stream", action="store_true",
+                        help="Потоковая генерация ответов курсора с замером времени до первого токена")
+    parser.add_argument("--no-preempt", action="store_true",
+                        help="Не прерывать выполняющийся чант при поступлении запроса курсора")
+    parser.add_argument("--dispatch", choices=list(POLICIES), default=LeastLoadedPolicy.name,
+                        help="Политика выбора потока для запросов курсора")
+    parser.add_argument("--no-steal", action="store_true",
+                        help="Отключить перенос запросов курсора между потоками (work stealing)")
+    parser.add_argument("--max-queue", type=int, default=16,
+                        help="Максимальная очередь запросов курсора на поток (0 - без ограничения)")
+    parser.add_argument("--chant-batch", type=int, default=1,
+                        help=f"Повторений мантры за один вызов модели (1-{MALA_SIZE})")
+    parser.add_argument("--cache-size", type=int, default=0,
+                        help=f"Записей в кэше ответов курсора (0 - без кэша, например {DEFAULT_CACHE_SIZE}); "
+                             f"ответы с temperature > 0 повторяются до истечения --cache-ttl")
+    parser.add_argument("--cache-ttl", type=float, default=DEFAULT_CACHE_TTL,
+                        help="Время жизни ответа в кэше (с)")
+    parser.add_argument("--cache-path",
+                        help="Файл sqlite для кэша ответов, переживающего перезапуск")
+    parser.add_argument("--chant-context", action="store_true",
+                        help="Передавать context Ollama из чанта в чант, не вычисляя префикс заново")
+    parser.add_argument("--context-reset", type=int, default=DEFAULT_CONTEXT_RESET,
+                        help="Сбрасывать context после стольких чантов")
+    parser.add_argument("--keep-alive", type=parse_keep_alive, default=DEFAULT_KEEP_ALIVE,
+                        help="Сколько Ollama держит модель в памяти после запроса (\"30m\", -1 - всегда)")
+    parser.add_argument("--no-warmup", action="store_true",
+                        help="Не прогревать модель при запуске")
+    parser.add_argument("--unload-on-stop", action="store_true",
+                        help="Выгрузить модель из памяти Ollama при остановке")
+    parser.add_argument("--metrics-port", type=int,
+                        help="Порт, на котором метрики отдаются в формате Prometheus (/metrics)")
+    parser.add_argument("--serve-port", type=int,
+                        help="Порт локального HTTP front-end для запросов курсора")
+    
+    add_logging_arguments(parser, 'chant_multithread.log')
     
     args = parser.parse_args()
+    setup_logging_from_args(args, LOG_FORMAT)
+    set_num_threads(args.local_threads)
+    set_batching(args.local_batch, args.local_batch_wait)
+    set_quantization(args.local_quantize)
     
     # Проверяем корректность коэффициентов
     if args.chant_ratio + args.cursor_ratio > 1.0:
@@ -310,9 +820,37 @@ def main():
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
     
+    # Пул серверов Ollama: --backend и конфиг; без них - единственный сервер --url
+    backends = list(args.backend or [])
+    if args.backends_config:
+        backends.extend(backends_from_config(args.backends_config))
+    
     # Создание менеджера с настройками коэффициентов
-    manager = ChantManager(args.url, args.chant_ratio, args.cursor_ratio)
+    if args.mode == "async":
+        from chant_async import AsyncChantManager
+        if args.stream:
+            print("⚠️  --stream поддерживается только в режиме threads: в режиме async ответы курсора приходят целиком")
+        if len(backends) > 1:
+            print("⚠️  Пул серверов поддерживается только в режиме threads, используется первый сервер")
+        url = split_backend_spec(backends[0])[0] if backends else args.url
+        manager = AsyncChantManager(url, args.chant_ratio, args.cursor_ratio, args.pool_size,
+                                    args.languages, args.streams_per_language, not args.no_preempt,
+                                    args.dispatch, not args.no_steal, args.max_queue, args.chant_batch,
+                                    args.cache_size, args.cache_ttl, args.cache_path,
+                                    args.chant_context, args.context_reset, args.keep_alive,
+                                    not args.no_warmup, args.unload_on_stop)
+    else:
+        manager = ChantManager(args.url, args.chant_ratio, args.cursor_ratio, args.pool_size, args.languages,
+                               args.stream, not args.no_preempt, args.dispatch, not args.no_steal,
+                               args.max_queue, args.chant_batch, args.cache_size, args.cache_ttl,
+                               args.cache_path, args.chant_context, args.context_reset, args.keep_alive,
+                               not args.no_warmup, args.unload_on_stop, backends or None,
+                               args.backend_concurrency, args.probe_interval,
+                               (args.connect_timeout, args.read_timeout), args.breaker_threshold,
+                               args.breaker_max_delay)
     signal_handler.manager = manager  # Сохраняем ссылку для обработчика сигналов
+    server = None
+    metrics_server = None
     
     try:
         # Запуск системы
@@ -320,6 +858,13 @@ def main():
             logger.info("Система чантинга запущена и работает...")
             logger.info("Используйте Ctrl+C для остановки")
             
+            if args.serve_port:
+                from chant_server import ChantServer
+                server = ChantServer(manager, args.serve_port).start()
+            if args.metrics_port:
+                from metrics import MetricsServer
+                metrics_server = MetricsServer(manager, args.metrics_port).start()
+            
             # Основной цикл
             while manager.running:
                 time.sleep(1)
@@ -337,6 +882,10 @@ def main():
     except Exception as e:
         logger.error(f"Критическая ошибка: {e}")
     finally:
+        if server:
+            server.stop()
+        if metrics_server:
+            metrics_server.stop()
         manager.stop()
 
 if __name__ == "__main__":
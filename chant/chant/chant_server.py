@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Chant Server - локальный HTTP front-end для системы чантинга
+Принимает запросы курсора и направляет их через планировщик потоков ChantManager
+"""
+
+import json
+import logging
+import math
+import threading
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from dataclasses import asdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+from cursor_request import CursorRequestError, QueueFullError
+from metrics import CONTENT_TYPE, render_manager_metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 8765
+
+# Сколько ждать ответа модели, если клиент не указал timeout
+DEFAULT_REQUEST_TIMEOUT = 120.0
+
+
+class ChantRequestHandler(BaseHTTPRequestHandler):
+    """
+    Обработчик HTTP API
+
+    POST /api/cursor   {"prompt": "...", "thread_id": 1, "language": "thai", "timeout": 60}
+    POST /api/generate совместим с Ollama ({"model", "prompt", "stream"}) - для test_cursor_requests.py
+    GET  /status       статус ChantManager
+    GET  /metrics      метрики в формате Prometheus
+    GET  /health       200, если система запущена
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        logger.debug(f"HTTP {self.address_string()} {format % args}")
+
+    def _send_json(self, status: int, body: dict, headers: Optional[dict] = None):
+        data = json.dumps(body, ensure_ascii=False, default=str).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        manager = self.server.manager
+        if self.path == "/status":
+            self._send_json(200, manager.get_status())
+        elif self.path == "/metrics":
+            data = render_manager_metrics(manager).encode('utf-8')
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        elif self.path == "/health":
+            self._send_json(200 if manager.running else 503, {"running": manager.running})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path not in ("/api/cursor", "/api/generate"):
+            self._send_json(404, {"error": "not found"})
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except (ValueError, json.JSONDecodeError):
+            self._send_json(400, {"error": "invalid JSON"})
+            return
+
+        prompt = body.get("prompt")
+        if not isinstance(prompt, str) or not prompt:
+            self._send_json(400, {"error": "prompt is required"})
+            return
+
+        thread_id = body.get("thread_id")
+        if thread_id is not None and (isinstance(thread_id, bool) or not isinstance(thread_id, int)):
+            self._send_json(400, {"error": "thread_id must be an integer"})
+            return
+
+        timeout = body.get("timeout")
+        if timeout is None:
+            timeout = self.server.request_timeout
+        elif (isinstance(timeout, bool) or not isinstance(timeout, (int, float))
+              or not math.isfinite(timeout) or timeout <= 0):
+            self._send_json(400, {"error": "timeout must be a positive number of seconds"})
+            return
+
+        language = body.get("language")
+        if language is not None and not isinstance(language, str):
+            self._send_json(400, {"error": "language must be a string"})
+            return
+
+        manager = self.server.manager
+        if not manager.running:
+            self._send_json(503, {"error": "chant system is not running"}, {"Retry-After": "5"})
+            return
+
+        future = manager.send_request(prompt, thread_id, language)
+        try:
+            result = future.result(timeout=timeout)
+        except QueueFullError as e:
+            self._send_json(429, {"error": str(e), "retry_after": e.retry_after},
+                            {"Retry-After": str(math.ceil(e.retry_after))})
+            return
+        except FutureTimeoutError:
+            future.cancel()
+            self._send_json(504, {"error": "timed out waiting for the model"})
+            return
+        except CursorRequestError as e:
+            self._send_json(502, {"error": str(e)})
+            return
+        except Exception as e:
+            # Прочие ошибки вызова модели: клиент получает ответ, а не оборванное соединение
+            logger.error(f"Ошибка обработки запроса курсора: {e}")
+            self._send_json(500, {"error": f"{type(e).__name__}: {e}"})
+            return
+
+        if self.path == "/api/generate":
+            # Ответ в формате Ollama: чтобы существующие клиенты работали без изменений
+            self._send_generate_reply(body, result)
+        else:
+            self._send_json(200, asdict(result))
+
+    def _send_generate_reply(self, body: dict, result):
+        reply = {
+            "model": body.get("model"),
+            "response": result.response,
+            "done": True,
+            "eval_count": result.eval_count,
+            "prompt_eval_count": result.prompt_eval_count,
+            "total_duration": int(result.total_time * 1e9)
+        }
+        if body.get("stream", True):
+            # Весь ответ одним NDJSON-чанком с done=True
+            data = (json.dumps(reply, ensure_ascii=False) + "\n").encode('utf-8')
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        else:
+            self._send_json(200, reply)
+
+
+class ChantServer(ThreadingHTTPServer):
+    """HTTP-сервер перед ChantManager (или AsyncChantManager)"""
+
+    daemon_threads = True
+
+    def __init__(self, manager, port: int = DEFAULT_PORT, host: str = "127.0.0.1",
+                 request_timeout: float = DEFAULT_REQUEST_TIMEOUT):
+        super().__init__((host, port), ChantRequestHandler)
+        self.manager = manager
+        self.request_timeout = request_timeout
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """Запуск сервера в фоновом потоке"""
+        self._thread = threading.Thread(target=self.serve_forever, name="ChantServer", daemon=True)
+        self._thread.start()
+        logger.info(f"HTTP front-end запущен: {self.url}")
+        return self
+
+    def stop(self):
+        """Остановка сервера"""
+        self.shutdown()
+        self.server_close()
+        logger.info("HTTP front-end остановлен")
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Chant Session - перенос контекста Ollama между чантами
+Возвращенный /api/generate массив context передается в следующий чант, чтобы
+Ollama не вычисляла заново уже обработанный префикс
+"""
+
+import threading
+from typing import Dict, Iterable, List, Optional
+
+# Сброс контекста после стольких чантов подряд
+DEFAULT_CONTEXT_RESET = 32
+
+# Сброс контекста, если он вырос больше этого числа токенов
+DEFAULT_MAX_CONTEXT_TOKENS = 2048
+
+
+def session_max_tokens(limits: Iterable[Optional[int]], default: int = DEFAULT_MAX_CONTEXT_TOKENS) -> int:
+    """Предел сессии для пула серверов: наименьшее окно модели (None - окно не ограничивает)"""
+    return min([default] + [limit for limit in limits if limit])
+
+
+class ChantSession:
+    """
+    Сессия чантинга: хранит context последнего ответа и статистику prompt eval
+
+    Каждый запрос несет весь context и полный промпт чанта: новый текст - это
+    и есть очередной промпт, context лишь заменяет заново вычисляемый префикс.
+    Выигрыш есть только там, где сервер держит KV-кэш этого префикса (Ollama);
+    local:// вычисляет context заново, и он только удлиняет вход.
+
+    Контекст растет с каждым чантом (промпт и ответ добавляются к нему), поэтому
+    он сбрасывается: через reset_every чантов, при превышении max_tokens после
+    ответа и заранее, если context, промпт и ответ не поместятся в max_tokens.
+    Экономия prompt_eval_saved - разница измеренных сервером prompt_eval_duration
+    (без контекста минус с контекстом) на число запросов с контекстом; это не
+    число пропущенных токенов, и она может быть отрицательной.
+
+    Args:
+        reset_every: Чантов до принудительного сброса контекста
+        max_tokens: Окно модели в токенах: context, промпт и ответ вместе
+    """
+
+    def __init__(self, reset_every: int = DEFAULT_CONTEXT_RESET,
+                 max_tokens: int = DEFAULT_MAX_CONTEXT_TOKENS):
+        self.reset_every = reset_every
+        self.max_tokens = max_tokens
+        self.context: Optional[List[int]] = None
+        self._lock = threading.Lock()
+        self._calls_since_reset = 0
+        self.resets = 0
+        self.overflow_resets = 0     # Сбросы перед запросом, который не поместился бы в окно
+        self.context_tokens_sent = 0
+        self._prompt_tokens: Dict[str, int] = {}
+        self.stats = {"fresh_calls": 0, "fresh_prompt_eval": 0.0,
+                      "reused_calls": 0, "reused_prompt_eval": 0.0}
+
+    def current(self, prompt: str = "", max_new_tokens: int = 0) -> Optional[List[int]]:
+        """
+        Контекст для следующего чанта (None - начать с чистого листа)
+
+        Если context вместе с промптом и max_new_tokens токенами ответа не
+        помещается в max_tokens, сессия сбрасывается до отправки запроса.
+        Длина промпта берется из prompt_eval_count ответа без контекста на
+        тот же промпт, до него - из длины в байтах (верхняя граница для BPE GPT-2).
+        """
+        with self._lock:
+            if self.context is None:
+                return None
+            prompt_tokens = self._prompt_tokens.get(prompt, len(prompt.encode("utf-8")))
+            if len(self.context) + prompt_tokens + max_new_tokens > self.max_tokens:
+                self.overflow_resets += 1
+                self._reset()
+                return None
+            self.context_tokens_sent += len(self.context)
+            return self.context
+
+    def update(self, result: Dict, used_context: bool, prompt: Optional[str] = None):
+        """
+        Учитывает ответ Ollama: сохраняет новый context и время prompt eval
+
+        Args:
+            result: Ответ /api/generate (или последний чанк потокового ответа)
+            used_context: Был ли в запросе передан context
+            prompt: Промпт запроса: без контекста его prompt_eval_count - длина промпта в токенах
+        """
+        duration = result.get("prompt_eval_duration")
+        with self._lock:
+            if duration is not None:
+                kind = "reused" if used_context else "fresh"
+                self.stats[f"{kind}_calls"] += 1
+                self.stats[f"{kind}_prompt_eval"] += duration / 1e9
+            if prompt is not None and not used_context and result.get("prompt_eval_count"):
+                self._prompt_tokens[prompt] = result["prompt_eval_count"]
+
+            self.context = result.get("context") or None
+            self._calls_since_reset += 1
+            too_long = self.context is not None and len(self.context) > self.max_tokens
+            if too_long or self._calls_since_reset >= self.reset_every:
+                self._reset()
+
+    def reset(self):
+        """Сбрасывает контекст: следующий чант начнется без него"""
+        with self._lock:
+            self._reset()
+
+    def _reset(self):
+        self.context = None
+        self._calls_since_reset = 0
+        self.resets += 1
+
+    def get_stats(self) -> Dict:
+        """Среднее время prompt eval с контекстом и без, оценка сэкономленного времени"""
+        with self._lock:
+            stats = dict(self.stats)
+            context_tokens = len(self.context) if self.context else 0
+            resets = self.resets
+            overflow_resets = self.overflow_resets
+            context_tokens_sent = self.context_tokens_sent
+        fresh_avg = stats["fresh_prompt_eval"] / stats["fresh_calls"] if stats["fresh_calls"] else None
+        reused_avg = stats["reused_prompt_eval"] / stats["reused_calls"] if stats["reused_calls"] else None
+        saved = None
+        if fresh_avg is not None and reused_avg is not None:
+            saved = (fresh_avg - reused_avg) * stats["reused_calls"]
+        return {
+            "fresh_calls": stats["fresh_calls"],
+            "reused_calls": stats["reused_calls"],
+            "prompt_eval_avg_fresh": fresh_avg,
+            "prompt_eval_avg_reused": reused_avg,
+            "prompt_eval_saved": saved,      # Оценка по prompt_eval_duration сервера, см. ChantSession
+            "context_tokens": context_tokens,
+            "context_tokens_sent": context_tokens_sent,
+            "resets": resets,
+            "overflow_resets": overflow_resets
+        }
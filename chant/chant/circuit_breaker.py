@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Circuit Breaker - автомат защиты сервера Ollama от запросов во время сбоя
+closed: запросы идут; после failure_threshold сбоев подряд - open.
+open: запросы не отправляются; пауза растет экспоненциально со случайным разбросом.
+half_open: после паузы проходит один пробный запрос: успех - closed, сбой - снова open.
+"""
+
+import random
+import threading
+import time
+from typing import Dict, Optional
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Пауза после первого срабатывания и её предел (с)
+DEFAULT_BASE_DELAY = 1.0
+DEFAULT_MAX_DELAY = 60.0
+
+# Доля паузы, на которую она случайно сокращается: серверы и потоки не просыпаются одновременно
+DEFAULT_JITTER = 0.5
+
+
+def backoff_delay(attempt: int, base_delay: float = DEFAULT_BASE_DELAY, max_delay: float = DEFAULT_MAX_DELAY,
+                  jitter: float = DEFAULT_JITTER) -> float:
+    """Экспоненциальная пауза перед попыткой attempt (с 1) со случайным сокращением до jitter"""
+    delay = min(max_delay, base_delay * 2 ** max(0, attempt - 1))
+    return delay * (1 - jitter * random.random())
+
+
+class CircuitBreaker:
+    """
+    Автомат защиты одного сервера
+
+    Args:
+        failure_threshold: Сбоев подряд до размыкания
+        base_delay: Пауза после первого размыкания (с)
+        max_delay: Предел паузы (с)
+        jitter: Доля паузы, на которую она случайно сокращается (0 - без разброса)
+    """
+
+    def __init__(self, failure_threshold: int = 3, base_delay: float = DEFAULT_BASE_DELAY,
+                 max_delay: float = DEFAULT_MAX_DELAY, jitter: float = DEFAULT_JITTER):
+        if failure_threshold < 1:
+            raise ValueError(f"Порог сбоев должен быть не меньше 1: {failure_threshold}")
+        self.failure_threshold = failure_threshold
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opens = 0               # Размыканий подряд без успешного запроса: показатель паузы
+        self.trips = 0               # Всего размыканий
+        self.open_until = 0.0
+        self.trial_in_flight = False
+        self.last_change = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _set_state(self, state: str):
+        if state != self.state:
+            self.state = state
+            self.last_change = time.monotonic()
+
+    def _refresh(self):
+        if self.state == OPEN and time.monotonic() >= self.open_until:
+            self._set_state(HALF_OPEN)
+            self.trial_in_flight = False
+
+    def available(self) -> bool:
+        """Запрос был бы пропущен сейчас (без занятия пробного места)"""
+        with self._lock:
+            self._refresh()
+            return self.state == CLOSED or (self.state == HALF_OPEN and not self.trial_in_flight)
+
+    def allow(self) -> bool:
+        """Пропускает запрос; в half_open занимает единственное пробное место"""
+        with self._lock:
+            self._refresh()
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        """Сервер ответил: автомат замыкается, пауза сбрасывается"""
+        with self._lock:
+            self.consecutive_failures = 0
+            self.opens = 0
+            self.trial_in_flight = False
+            self._set_state(CLOSED)
+
+    def release_trial(self):
+        """
+        Запрос завершился без оценки сервера (ошибка запроса, прерывание генерации):
+        пробное место освобождается, состояние и счетчик сбоев не меняются
+        """
+        with self._lock:
+            self.trial_in_flight = False
+
+    def record_failure(self) -> Optional[float]:
+        """
+        Сбой сервера
+
+        Returns:
+            Пауза, если автомат разомкнулся, иначе None
+        """
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.state == HALF_OPEN or (self.state == CLOSED and
+                                           self.consecutive_failures >= self.failure_threshold):
+                return self._open()
+            return None
+
+    def _open(self) -> float:
+        self.opens += 1
+        self.trips += 1
+        delay = backoff_delay(self.opens, self.base_delay, self.max_delay, self.jitter)
+        self.open_until = time.monotonic() + delay
+        self.trial_in_flight = False
+        self._set_state(OPEN)
+        return delay
+
+    def half_open(self):
+        """Проверка здоровья прошла: пробный запрос можно отправить, не дожидаясь конца паузы"""
+        with self._lock:
+            if self.state == OPEN:
+                self._set_state(HALF_OPEN)
+                self.trial_in_flight = False
+
+    def retry_after(self) -> float:
+        """Через сколько секунд автомат пропустит запрос (0 - уже пропускает)"""
+        with self._lock:
+            self._refresh()
+            if self.state == OPEN:
+                return max(0.0, self.open_until - time.monotonic())
+            if self.state == HALF_OPEN and self.trial_in_flight:
+                # Результат пробного запроса еще неизвестен
+                return backoff_delay(1, self.base_delay, self.max_delay, self.jitter)
+            return 0.0
+
+    def get_stats(self) -> Dict:
+        retry_after = self.retry_after()
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "trips": self.trips,
+                "retry_after": retry_after,
+                "state_age": time.monotonic() - self.last_change
+            }
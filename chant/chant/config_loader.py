@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+"""
+Config Loader - чтение конфигов chant/config/*.json
+Файлы пишутся вручную и содержат висячие запятые, поэтому разбор снисходительный
+"""
+
+import json
+import os
+import re
+from typing import Any
+
+# Каталог chant/config относительно chant/chant
+CONFIG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "config")
+
+# Запятая перед закрывающей скобкой вне строк
+_TRAILING_COMMA = re.compile(r'("(?:\\.|[^"\\])*")|,(\s*[}\]])')
+
+
+def strip_trailing_commas(text: str) -> str:
+    """Убирает висячие запятые, не трогая содержимое строк"""
+    return _TRAILING_COMMA.sub(lambda m: m.group(1) or m.group(2), text)
+
+
+def load_json(path: str) -> Any:
+    """Загружает JSON, допуская висячие запятые"""
+    with open(path, encoding='utf-8') as f:
+        return json.loads(strip_trailing_commas(f.read()))
+
+
+def config_path(name: str) -> str:
+    """Путь к файлу в chant/config"""
+    return os.path.join(CONFIG_DIR, name)
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Cursor Request - запрос от курсора в очереди рабочего потока
+"""
+
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+
+class CursorRequestError(Exception):
+    """Запрос курсора не удалось выполнить (ошибка backend'а или остановка системы)"""
+
+
+class QueueFullError(CursorRequestError):
+    """Очереди потоков заполнены - запрос не принят (admission control)"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after  # Через сколько секунд имеет смысл повторить
+
+
+@dataclass
+class CursorResult:
+    """Полный ответ на запрос курсора с таймингами"""
+
+    response: str
+    thread_id: Optional[int]                # None - ответ из кэша, без обращения к потоку
+    queue_wait: float                       # Ожидание в очереди (с)
+    backend_time: float                     # Время вызова модели (с)
+    total_time: float                       # От постановки в очередь до ответа (с)
+    eval_count: Optional[int] = None        # Сгенерировано токенов (по данным Ollama)
+    prompt_eval_count: Optional[int] = None  # Токенов в промпте
+    ttft: Optional[float] = None            # Время до первого токена (потоковый режим)
+    cached: bool = False                    # Ответ взят из кэша ответов
+
+
+@dataclass
+class CursorRequest:
+    """
+    Запрос курсора с моментом постановки в очередь для замера ожидания
+
+    language и thread_id задают привязку запроса: такой запрос не переносится
+    в поток другого языка или в другой поток при work stealing.
+    future разрешается в CursorResult, когда поток получит ответ модели.
+    on_token вызывается в рабочем потоке с каждым фрагментом ответа по мере генерации.
+    """
+
+    prompt: str
+    enqueued_at: float = field(default_factory=time.perf_counter)
+    language: Optional[str] = None
+    thread_id: Optional[int] = None
+    future: Future = field(default_factory=Future, repr=False, compare=False)
+    on_token: Optional[Callable[[str], None]] = field(default=None, repr=False, compare=False)
+
+    def queue_wait(self) -> float:
+        """Время ожидания в очереди до текущего момента (в секундах)"""
+        return time.perf_counter() - self.enqueued_at
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Dispatch - политики выбора рабочего потока для запросов курсора
+random, round-robin, least-loaded и power-of-two-choices со статистикой по политике
+"""
+
+import itertools
+import random
+import threading
+from typing import Dict, List, Optional
+
+# Оценка времени вызова модели, пока у потока нет замеров
+DEFAULT_LATENCY = 1.0
+
+
+class Ewma:
+    """Экспоненциальное скользящее среднее задержки backend'а"""
+
+    def __init__(self, alpha: float = 0.2):
+        self.alpha = alpha
+        self.value: Optional[float] = None
+
+    def update(self, sample: float):
+        """Добавляет новый замер"""
+        if self.value is None:
+            self.value = sample
+        else:
+            self.value = self.alpha * sample + (1 - self.alpha) * self.value
+
+    def get(self, default: float = DEFAULT_LATENCY) -> float:
+        """Текущее значение или default, если замеров еще не было"""
+        return self.value if self.value is not None else default
+
+
+def expected_wait(worker) -> float:
+    """
+    Ожидаемое время до начала обработки нового запроса в потоке
+
+    Учитывает глубину очереди, выполняющийся запрос курсора и EWMA задержки
+    backend'а этого потока. Выполняющийся чант не учитывается, если поток
+    может его вытеснить.
+    """
+    latency = worker.latency.get()
+    pending = worker.request_queue.qsize() + (1 if worker.cursor_in_flight else 0)
+    if worker.chant_in_flight and not worker.preempt:
+        pending += 1
+    return pending * latency
+
+
+class DispatchPolicy:
+    """Базовая политика выбора потока"""
+
+    name = "base"
+
+    def choose(self, workers: List) -> object:
+        raise NotImplementedError
+
+
+class RandomPolicy(DispatchPolicy):
+    """Случайный поток"""
+
+    name = "random"
+
+    def choose(self, workers: List) -> object:
+        return random.choice(workers)
+
+
+class RoundRobinPolicy(DispatchPolicy):
+    """Потоки по кругу"""
+
+    name = "round-robin"
+
+    def __init__(self):
+        self._counter = itertools.count()
+
+    def choose(self, workers: List) -> object:
+        return workers[next(self._counter) % len(workers)]
+
+
+class LeastLoadedPolicy(DispatchPolicy):
+    """Поток с наименьшим ожидаемым временем ожидания"""
+
+    name = "least-loaded"
+
+    def choose(self, workers: List) -> object:
+        return min(workers, key=expected_wait)
+
+
+class PowerOfTwoPolicy(DispatchPolicy):
+    """Лучший из двух случайных потоков: почти как least-loaded, но без опроса всех потоков"""
+
+    name = "p2c"
+
+    def choose(self, workers: List) -> object:
+        if len(workers) < 2:
+            return workers[0]
+        return min(random.sample(workers, 2), key=expected_wait)
+
+
+POLICIES = {
+    policy.name: policy
+    for policy in (RandomPolicy, RoundRobinPolicy, LeastLoadedPolicy, PowerOfTwoPolicy)
+}
+
+
+class Dispatcher:
+    """Потокобезопасный диспетчер запросов курсора со статистикой политики"""
+
+    def __init__(self, policy: str = LeastLoadedPolicy.name):
+        if policy not in POLICIES:
+            raise ValueError(f"Неизвестная политика балансировки: {policy}. Доступные: {list(POLICIES)}")
+        self.policy = POLICIES[policy]()
+        self._lock = threading.Lock()
+        self.dispatched = 0
+        self.per_worker: Dict[int, int] = {}
+        self.expected_wait_sum = 0.0
+        self.expected_wait_max = 0.0
+
+    def order(self, workers: List) -> List:
+        """
+        Порядок попыток постановки запроса: сначала поток, выбранный политикой,
+        затем остальные по возрастанию ожидаемого времени ожидания
+        """
+        with self._lock:
+            first = self.policy.choose(workers)
+        rest = sorted((worker for worker in workers if worker is not first), key=expected_wait)
+        return [first] + rest
+
+    def record(self, worker):
+        """Учитывает в статистике поток, принявший запрос"""
+        wait = expected_wait(worker)
+        with self._lock:
+            self.dispatched += 1
+            self.per_worker[worker.thread_id] = self.per_worker.get(worker.thread_id, 0) + 1
+            self.expected_wait_sum += wait
+            self.expected_wait_max = max(self.expected_wait_max, wait)
+
+    def choose(self, workers: List) -> object:
+        """Выбирает поток для запроса и учитывает выбор в статистике"""
+        worker = self.order(workers)[0]
+        self.record(worker)
+        return worker
+
+    def get_stats(self) -> Dict:
+        """Статистика распределения запросов по потокам"""
+        with self._lock:
+            return {
+                "policy": self.policy.name,
+                "dispatched": self.dispatched,
+                "per_worker": dict(self.per_worker),
+                "expected_wait_avg": self.expected_wait_sum / self.dispatched if self.dispatched else None,
+                "expected_wait_max": self.expected_wait_max
+            }
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Fake Ollama - локальная замена Ollama для проверки системы чантинга без модели
+Отвечает на /api/tags и /api/generate (обычный и потоковый режимы)
+с настраиваемой задержкой, скоростью генерации и инъекцией ошибок
+"""
+
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    """Обработчик запросов в формате Ollama API"""
+
+    protocol_version = "HTTP/1.1"  # keep-alive, как у настоящего Ollama
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, body: dict):
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self._send_json(200, {"models": [{"name": self.server.model_name}]})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path != "/api/generate":
+            self._send_json(404, {"error": "not found"})
+            return
+
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        self.server.record_request(payload)
+
+        # Загрузка модели (запрос без промпта) не сбоит, чтобы прогрев был предсказуемым
+        if payload.get("prompt") and self.server.should_fail():
+            time.sleep(self.server.latency)
+            self._send_json(500, {"error": "injected failure"})
+            return
+
+        prompt = payload.get("prompt", "")
+        tokens = self.server.reply_tokens(prompt)
+        started = time.perf_counter()
+        time.sleep(self.server.latency)
+
+        if payload.get("stream", True):
+            self._stream_reply(payload, tokens, started)
+        else:
+            time.sleep(self.server.token_interval * len(tokens))
+            self._send_json(200, self.server.final_chunk(payload, "".join(tokens), len(tokens), started))
+
+    def _stream_reply(self, payload: dict, tokens, started: float):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for token in tokens:
+                self._write_chunk({"model": payload.get("model"), "response": token, "done": False})
+                time.sleep(self.server.token_interval)
+            self._write_chunk(self.server.final_chunk(payload, "", len(tokens), started))
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # Клиент закрыл соединение - как и Ollama, прекращаем генерацию
+            self.close_connection = True
+
+    def _write_chunk(self, body: dict):
+        line = (json.dumps(body, ensure_ascii=False) + "\n").encode('utf-8')
+        self.wfile.write(f"{len(line):x}\r\n".encode() + line + b"\r\n")
+        self.wfile.flush()
+
+
+class FakeOllama(ThreadingHTTPServer):
+    """
+    Сервер-заглушка Ollama
+
+    Args:
+        port: Порт (0 - выбрать свободный)
+        latency: Задержка перед первым токеном (с)
+        token_interval: Интервал между токенами (с)
+        model_name: Модель, которую сервер "предоставляет"
+        token_rate: Скорость генерации (токенов/с), задается вместо token_interval
+        failure_rate: Доля запросов /api/generate, на которые отвечаем HTTP 500
+        seed: Зерно генератора для воспроизводимой инъекции ошибок
+    """
+
+    daemon_threads = True
+
+    def __init__(self, port: int = 0, latency: float = 0.05, token_interval: float = 0.01,
+                 model_name: str = "mozgach:latest", host: str = "127.0.0.1",
+                 token_rate: Optional[float] = None, failure_rate: float = 0.0, seed: Optional[int] = None):
+        super().__init__((host, port), FakeOllamaHandler)
+        self.latency = latency
+        self.token_interval = 1.0 / token_rate if token_rate else token_interval
+        self.model_name = model_name
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+        self.requests = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def handle_error(self, request, client_address):
+        # Клиенты закрывают keep-alive соединения при остановке - это не ошибка
+        if isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            return
+        super().handle_error(request, client_address)
+
+    def record_request(self, payload: dict):
+        with self._lock:
+            self.requests += 1
+
+    def should_fail(self) -> bool:
+        """Инъекция ошибки с вероятностью failure_rate"""
+        with self._lock:
+            if self.failure_rate and self._random.random() < self.failure_rate:
+                self.failures += 1
+                return True
+            return False
+
+    def reply_tokens(self, prompt: str):
+        """Ответ модели: слова промпта по одному токену"""
+        words = prompt.split() or ["ом"]
+        return [word + " " for word in words]
+
+    def final_chunk(self, payload: dict, response: str, eval_count: int, started: float) -> dict:
+        """Последний чанк со статистикой в формате Ollama (длительности в наносекундах)"""
+        total = int((time.perf_counter() - started) * 1e9)
+        return {
+            "model": payload.get("model"),
+            "response": response,
+            "done": True,
+            "total_duration": total,
+            "prompt_eval_count": len(payload.get("prompt", "").split()),
+            "prompt_eval_duration": int(self.latency * 1e9),
+            "eval_count": eval_count,
+            "eval_duration": max(total - int(self.latency * 1e9), 0),
+            # Условные id токенов: предыдущий context, промпт и ответ
+            "context": list(payload.get("context", [])) + list(range(len(payload.get("prompt", "").split()) + eval_count))
+        }
+
+    def start(self):
+        """Запуск в фоновом потоке"""
+        self._thread = threading.Thread(target=self.serve_forever, name="FakeOllama", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Остановка сервера"""
+        self.shutdown()
+        self.server_close()
+
+
+def main():
+    """Основная функция"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Локальная заглушка Ollama API")
+    parser.add_argument("--port", type=int, default=11435, help="Порт сервера")
+    parser.add_argument("--latency", type=float, default=0.05, help="Задержка до первого токена (с)")
+    parser.add_argument("--token-interval", type=float, default=0.01, help="Интервал между токенами (с)")
+    parser.add_argument("--model", default="mozgach:latest", help="Название модели")
+    parser.add_argument("--token-rate", type=float, help="Скорость генерации, токенов/с (вместо --token-interval)")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Доля запросов с ошибкой HTTP 500")
+    parser.add_argument("--seed", type=int, help="Зерно для воспроизводимой инъекции ошибок")
+
+    args = parser.parse_args()
+
+    server = FakeOllama(args.port, args.latency, args.token_interval, args.model,
+                        token_rate=args.token_rate, failure_rate=args.failure_rate, seed=args.seed)
+    print(f"🧪 Заглушка Ollama запущена: {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n🛑 Остановка заглушки")
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+Load Generator - генератор нагрузки с открытым циклом для запросов курсора
+Запросы отправляются по расписанию (пуассоновский поток или фиксированная частота)
+независимо от ответов, поэтому видно насыщение и рост очередей. Задержки пишутся
+в гистограммы в стиле HDR; исправленная задержка считается от запланированного
+момента отправки, что устраняет coordinated omission.
+"""
+
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+ARRIVALS = ("poisson", "fixed")
+
+
+class LatencyHistogram:
+    """
+    Гистограмма задержек в стиле HdrHistogram
+
+    Значения хранятся в микросекундах в лог-линейных корзинах: каждая степень
+    двойки делится на 2**precision_bits корзин, поэтому относительная
+    погрешность не превышает 2**-precision_bits при любом диапазоне значений.
+    """
+
+    def __init__(self, precision_bits: int = 7, unit: float = 1e-6):
+        self.precision_bits = precision_bits
+        self.unit = unit
+        self._counts: Dict[Tuple[int, int], int] = {}
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def _bucket(self, value: float) -> Tuple[int, int]:
+        ticks = max(0, int(value / self.unit))
+        shift = max(0, ticks.bit_length() - self.precision_bits)
+        return shift, ticks >> shift
+
+    def _bucket_value(self, bucket: Tuple[int, int]) -> float:
+        """Верхняя граница корзины в секундах"""
+        shift, mantissa = bucket
+        return (((mantissa + 1) << shift) - 1) * self.unit
+
+    def record(self, value: float, count: int = 1):
+        """Добавляет значение (в секундах)"""
+        bucket = self._bucket(value)
+        with self._lock:
+            self._counts[bucket] = self._counts.get(bucket, 0) + count
+            self.count += count
+            self.total += value * count
+            self.max = max(self.max, value)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Значение, не меньше которого q процентов записей (q от 0 до 100)"""
+        with self._lock:
+            if not self.count:
+                return None
+            target = max(1, int(round(q / 100 * self.count + 0.5)))
+            seen = 0
+            for bucket in sorted(self._counts, key=self._bucket_value):
+                seen += self._counts[bucket]
+                if seen >= target:
+                    return min(self._bucket_value(bucket), self.max)
+            return self.max
+
+    def merge(self, other: "LatencyHistogram"):
+        """Добавляет записи другой гистограммы с теми же параметрами"""
+        with other._lock:
+            counts = dict(other._counts)
+            count, total, maximum = other.count, other.total, other.max
+        with self._lock:
+            for bucket, n in counts.items():
+                self._counts[bucket] = self._counts.get(bucket, 0) + n
+            self.count += count
+            self.total += total
+            self.max = max(self.max, maximum)
+
+    def summary(self) -> Dict:
+        """Сводка: количество, среднее и перцентили (в секундах)"""
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else None,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "p99.9": self.percentile(99.9),
+            "max": self.max if self.count else None
+        }
+
+
+def arrival_times(rate: float, duration: float, arrival: str = "poisson",
+                  rng: Optional[random.Random] = None) -> List[float]:
+    """Моменты отправки (секунды от начала) для заданной средней частоты"""
+    if arrival not in ARRIVALS:
+        raise ValueError(f"Неизвестный режим поступления: {arrival}. Доступные: {ARRIVALS}")
+    rng = rng or random.Random()
+    times = []
+    t = 0.0
+    while True:
+        t += rng.expovariate(rate) if arrival == "poisson" else 1.0 / rate
+        if t >= duration:
+            return times
+        times.append(t)
+
+
+def parse_language_mix(items: List[str]) -> Dict[str, float]:
+    """["thai=2", "harkonnen"] -> {"thai": 2.0, "harkonnen": 1.0}"""
+    mix = {}
+    for item in items:
+        language, _, weight = item.partition("=")
+        mix[language] = float(weight) if weight else 1.0
+    return mix
+
+
+class OllamaTarget:
+    """Запросы напрямую в Ollama /api/generate"""
+
+    name = "ollama"
+
+    def __init__(self, base_url: str, model: str = "mozgach:latest", pool_size: int = 10, timeout: float = 120):
+        self.url = f"{base_url.rstrip('/')}/api/generate"
+        self.model = model
+        self.timeout = timeout
+        self.session = _session(pool_size)
+
+    def send(self, prompt: str, language: str) -> int:
+        response = self.session.post(self.url, json={"model": self.model, "prompt": prompt, "stream": False},
+                                     timeout=self.timeout)
+        return response.status_code
+
+
+class FrontendTarget:
+    """Запросы в HTTP front-end системы чантинга (POST /api/cursor)"""
+
+    name = "frontend"
+
+    def __init__(self, base_url: str, pool_size: int = 10, timeout: float = 120):
+        self.url = f"{base_url.rstrip('/')}/api/cursor"
+        self.timeout = timeout
+        self.session = _session(pool_size)
+
+    def send(self, prompt: str, language: str) -> int:
+        response = self.session.post(self.url, json={"prompt": prompt, "language": language,
+                                                     "timeout": self.timeout}, timeout=self.timeout)
+        return response.status_code
+
+
+def _session(pool_size: int) -> requests.Session:
+    # Отдельная сессия генератора: пул не меньше числа одновременных запросов
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+class LoadGenerator:
+    """
+    Генератор нагрузки с открытым циклом
+
+    Args:
+        target: OllamaTarget или FrontendTarget (любой объект с send(prompt, language) -> HTTP-статус)
+        prompts: Промпты по языкам
+        rate: Средняя частота запросов (в секунду)
+        duration: Длительность отправки (с)
+        concurrency: Максимум одновременных запросов; лишние ждут, и это видно в исправленной задержке
+        arrival: "poisson" или "fixed"
+        language_mix: Веса языков (None - равномерно)
+        seed: Зерно для воспроизводимого расписания
+    """
+
+    def __init__(self, target, prompts: Dict[str, List[str]], rate: float, duration: float,
+                 concurrency: int = 10, arrival: str = "poisson",
+                 language_mix: Optional[Dict[str, float]] = None, seed: Optional[int] = None):
+        self.target = target
+        self.prompts = prompts
+        self.rate = rate
+        self.duration = duration
+        self.concurrency = concurrency
+        self.arrival = arrival
+        self.rng = random.Random(seed)
+        mix = language_mix or {language: 1.0 for language in prompts}
+        unknown = set(mix) - set(prompts)
+        if unknown:
+            raise ValueError(f"Нет промптов для языков: {sorted(unknown)}")
+        self.languages = list(mix)
+        self.weights = [mix[language] for language in self.languages]
+
+        self.corrected = LatencyHistogram()     # От запланированного момента отправки
+        self.uncorrected = LatencyHistogram()   # От фактической отправки (время обслуживания)
+        self.per_language: Dict[str, LatencyHistogram] = {language: LatencyHistogram() for language in self.languages}
+        self.statuses: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.max_lag = 0.0  # Наибольшее отставание фактической отправки от расписания
+
+    def _plan(self) -> List[Tuple[float, str, str]]:
+        plan = []
+        counters = {language: 0 for language in self.languages}
+        for at in arrival_times(self.rate, self.duration, self.arrival, self.rng):
+            language = self.rng.choices(self.languages, self.weights)[0]
+            prompts = self.prompts[language]
+            plan.append((at, language, prompts[counters[language] % len(prompts)]))
+            counters[language] += 1
+        return plan
+
+    def _execute(self, intended: float, language: str, prompt: str):
+        started = time.perf_counter()
+        try:
+            status = str(self.target.send(prompt, language))
+        except requests.exceptions.RequestException as e:
+            status = type(e).__name__
+        finished = time.perf_counter()
+
+        with self._lock:
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+            self.max_lag = max(self.max_lag, started - intended)
+        if status == "200":
+            self.corrected.record(finished - intended)
+            self.uncorrected.record(finished - started)
+            self.per_language[language].record(finished - intended)
+
+    def run(self, on_progress: Optional[Callable[[int, int], None]] = None) -> Dict:
+        """
+        Отправляет запросы по расписанию и ждет все ответы
+
+        Args:
+            on_progress: Вызывается (отправлено, всего) раз в секунду
+        """
+        plan = self._plan()
+        started = time.perf_counter()
+        last_progress = started
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="Load") as executor:
+            for i, (at, language, prompt) in enumerate(plan):
+                intended = started + at
+                delay = intended - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                # Отправка не ждет предыдущих ответов: открытый цикл
+                executor.submit(self._execute, intended, language, prompt)
+                if on_progress and time.perf_counter() - last_progress >= 1.0:
+                    last_progress = time.perf_counter()
+                    on_progress(i + 1, len(plan))
+        elapsed = time.perf_counter() - started
+
+        ok = self.statuses.get("200", 0)
+        return {
+            "target": getattr(self.target, "name", type(self.target).__name__),
+            "arrival": self.arrival,
+            "rate": self.rate,
+            "concurrency": self.concurrency,
+            "sent": len(plan),
+            "ok": ok,
+            "statuses": dict(self.statuses),
+            "elapsed": elapsed,
+            "throughput": ok / elapsed if elapsed else None,
+            "max_schedule_lag": self.max_lag,
+            "latency": self.corrected.summary(),
+            "service_time": self.uncorrected.summary(),
+            "per_language": {language: hist.summary() for language, hist in self.per_language.items()}
+        }
@@ -0,0 +1,851 @@
+#!/usr/bin/env python3
+"""
+Local Backend - генерация ruGPT-3 в процессе чантинга на CPU, без сервера Ollama
+Модель подключается как сервер с адресом local://ТИП (например, local://rugptsmall):
+транспортный адаптер requests отвечает на /api/generate и /api/tags в формате Ollama,
+поэтому рабочие потоки, пул серверов и прогрев работают без изменений.
+Одновременные запросы собираются в пакеты и генерируются одним вызовом model.generate;
+промпты мантр кодируются в токены один раз, новые промпты пакета - одним вызовом токенизатора.
+torch и transformers импортируются только при первой загрузке модели; веса хранятся
+в локальном кэше safetensors и отображаются в память, так что процессы на одной машине
+делят page cache.
+"""
+
+import io
+import json
+import logging
+import os
+import queue
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import BaseAdapter
+
+logger = logging.getLogger(__name__)
+
+LOCAL_SCHEME = "local://"
+
+# Типы экземпляров из config/config.json и модели для них
+MODEL_TYPES = {
+    "rugptsmall": "sberbank-ai/rugpt3small_based_on_gpt2",
+    "rugptlarge": "sberbank-ai/rugpt3large_based_on_gpt2"
+}
+
+# Параметры генерации из actions/generate.py
+GENERATE_DEFAULTS = {
+    "do_sample": True,
+    "repetition_penalty": 5.0,
+    "top_k": 5,
+    "top_p": 0.95,
+    "temperature": 1.0,
+    "num_beams": None,
+    "no_repeat_ngram_size": 3
+}
+
+# Токенов ответа, если в options нет num_predict / max_tokens
+DEFAULT_NUM_PREDICT = 50
+
+# Динамический батчинг: до скольких запросов в пакете и сколько ждать попутчиков (с)
+DEFAULT_MAX_BATCH_SIZE = 8
+DEFAULT_BATCH_WAIT = 0.01
+
+# Закодированных промптов в кэше токенизатора сверх закрепленных мантр
+DEFAULT_TOKEN_CACHE_SIZE = 1024
+
+# Режимы квантизации на CPU: int8 - линейные слои блоков, int8-head - еще и выходной слой
+QUANTIZE_MODES = ("int8", "int8-head")
+
+# Кэш моделей в safetensors (CHANT_MODEL_CACHE; пустая строка - загрузка через from_pretrained)
+MODEL_CACHE_DIR = os.environ.get("CHANT_MODEL_CACHE",
+                                 os.path.join(os.path.expanduser("~"), ".cache", "chant", "models"))
+WEIGHTS_FILE = "model.safetensors"
+
+_models: Dict[Tuple[str, str], Tuple[Any, Any]] = {}
+_models_lock = threading.Lock()
+_load_stats: Dict[Tuple[str, str], Dict] = {}
+_model_cache_dir: Optional[str] = MODEL_CACHE_DIR or None
+_local_models: Dict[Tuple[str, str], "LocalModel"] = {}
+_local_models_lock = threading.Lock()  # Отдельно от загрузки: проверка /api/tags не ждет загрузку модели
+_num_threads: Optional[int] = None
+_quantize: Optional[str] = None
+_preloaded_prompts: List[str] = []
+_safetensors_warned = False
+_batching = {"max_batch_size": DEFAULT_MAX_BATCH_SIZE, "max_wait": DEFAULT_BATCH_WAIT}
+
+
+def set_num_threads(num_threads: Optional[int]):
+    """
+    Потоков torch для генерации в этом процессе (None - по умолчанию torch)
+
+    Действует на модели, загруженные после вызова; при нескольких процессах
+    чантинга на машине имеет смысл делить ядра между ними.
+    """
+    global _num_threads
+    _num_threads = num_threads
+    if num_threads and _models:
+        import torch
+        torch.set_num_threads(num_threads)
+
+
+def set_batching(max_batch_size: int = DEFAULT_MAX_BATCH_SIZE, max_wait: float = DEFAULT_BATCH_WAIT):
+    """Параметры батчинга для моделей, впервые запрошенных после вызова (1 - без батчинга)"""
+    if max_batch_size < 1 or max_wait < 0:
+        raise ValueError(f"Некорректные параметры батчинга: {max_batch_size}, {max_wait}")
+    _batching.update(max_batch_size=max_batch_size, max_wait=max_wait)
+
+
+def set_quantization(mode: Optional[str]):
+    """Квантизация моделей, загруженных после вызова (None - полная точность)"""
+    global _quantize
+    if mode is not None and mode not in QUANTIZE_MODES:
+        raise ValueError(f"Неизвестный режим квантизации: {mode} (доступны {', '.join(QUANTIZE_MODES)})")
+    _quantize = mode
+
+
+def preload_prompts(prompts: Iterable[str]):
+    """
+    Промпты, которые кэш токенизатора каждой модели хранит всегда (мантры чантинга)
+
+    Уже загруженные модели кодируют их сразу, остальные - при загрузке.
+    """
+    prompts = [prompt for prompt in prompts if prompt not in _preloaded_prompts]
+    _preloaded_prompts.extend(prompts)
+    with _local_models_lock:
+        local_models = list(_local_models.values())
+    for local_model in local_models:
+        if local_model.token_cache is not None:
+            local_model.token_cache.pin(prompts)
+
+
+def resolve_model(ref: str) -> str:
+    """Тип экземпляра ("rugptsmall") -> имя модели; имя или путь возвращаются как есть"""
+    return MODEL_TYPES.get(ref, ref)
+
+
+def set_model_cache(cache_dir: Optional[str]):
+    """Каталог кэша safetensors для моделей, загружаемых после вызова (None - без кэша)"""
+    global _model_cache_dir
+    _model_cache_dir = cache_dir or None
+
+
+def _tokenizer_class():
+    """Быстрый токенизатор (Rust), если доступен: кодирует пакет промптов одним вызовом"""
+    try:
+        from transformers import GPT2TokenizerFast
+        return GPT2TokenizerFast
+    except ImportError:
+        from transformers import GPT2Tokenizer
+        return GPT2Tokenizer
+
+
+def cached_model_path(model_name_or_path: str) -> Optional[str]:
+    """
+    Каталог с весами в safetensors для модели или None, если кэш недоступен
+
+    Обученная модель, уже сохраненная в safetensors, читается из своего каталога.
+    """
+    if os.path.isfile(os.path.join(model_name_or_path, WEIGHTS_FILE)):
+        return model_name_or_path
+    if not _model_cache_dir:
+        return None
+    try:
+        import safetensors.torch  # noqa: F401
+    except ImportError:
+        global _safetensors_warned
+        if not _safetensors_warned:
+            _safetensors_warned = True
+            logger.warning("Пакет safetensors не установлен: кэш моделей отключен, каждый процесс загружает "
+                           "веса через from_pretrained (pip install -r requirements-local.txt)")
+        return None
+    name = os.path.abspath(model_name_or_path) if os.path.isdir(model_name_or_path) else model_name_or_path
+    return os.path.join(_model_cache_dir, name.strip("/").replace("/", "--"))
+
+
+def _cache_is_fresh(source: str, path: str) -> bool:
+    """Кэш есть и не старше обученной модели, из которой сделан"""
+    weights = os.path.join(path, WEIGHTS_FILE)
+    if not os.path.isfile(weights):
+        return False
+    if not os.path.isdir(source) or os.path.samefile(source, path):
+        return True
+    newest = max((entry.stat().st_mtime for entry in os.scandir(source) if entry.is_file()), default=0)
+    return newest <= os.path.getmtime(weights)
+
+
+@contextmanager
+def _cache_lock(path: str):
+    """Межпроцессная блокировка каталога кэша на время сохранения (fcntl, без него - без блокировки)"""
+    try:
+        import fcntl
+    except ImportError:
+        yield
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(f"{path}.lock", "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _export_to_cache(source: str, path: str) -> bool:
+    """
+    Однократно сохраняет токенизатор, конфиг и веса модели в safetensors
+
+    Сохранение идет под файловой блокировкой: процессы, запустившиеся
+    одновременно, ждут первого, а затем видят свежий кэш и ничего не удаляют.
+    Каталог собирается во временном и переименовывается целиком, так что
+    недописанный кэш никто не читает.
+
+    Returns:
+        True, если кэш сохранен этим процессом; False, если другой процесс сохранил его раньше
+    """
+    with _cache_lock(path):
+        if _cache_is_fresh(source, path):
+            return False
+
+        from safetensors.torch import save_file
+        from transformers import GPT2LMHeadModel
+
+        tok = _tokenizer_class().from_pretrained(source)
+        model = GPT2LMHeadModel.from_pretrained(source)
+        state = model.state_dict()
+        # Выходной слой связан с эмбеддингами: safetensors не сохраняет общую память дважды
+        if model.get_output_embeddings().weight is model.get_input_embeddings().weight:
+            state.pop("lm_head.weight", None)
+
+        tmp = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+        try:
+            tok.save_pretrained(tmp)
+            model.config.save_pretrained(tmp)
+            save_file({key: value.contiguous() for key, value in state.items()}, os.path.join(tmp, WEIGHTS_FILE))
+            if os.path.isdir(path):
+                # Под блокировкой и после проверки: это устаревший кэш обученной модели
+                shutil.rmtree(path)
+            os.rename(tmp, path)
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+        return True
+
+
+def _load_from_cache(path: str):
+    """
+    Токенизатор и модель из каталога safetensors без копирования весов
+
+    Тензоры остаются отображенными в память (torch >= 2.1, load_state_dict(assign=True)):
+    страницы файла общие для всех процессов, загрузивших эту модель.
+    """
+    from contextlib import nullcontext
+
+    from safetensors.torch import load_file
+    from transformers import GPT2Config, GPT2LMHeadModel
+
+    try:
+        from transformers.modeling_utils import no_init_weights
+    except ImportError:
+        no_init_weights = nullcontext
+
+    tok = _tokenizer_class().from_pretrained(path)
+    config = GPT2Config.from_pretrained(path)
+    with no_init_weights():  # Случайная инициализация все равно будет заменена весами
+        model = GPT2LMHeadModel(config)
+    state = load_file(os.path.join(path, WEIGHTS_FILE))
+    try:
+        result = model.load_state_dict(state, strict=False, assign=True)
+    except TypeError:
+        # torch < 2.1: веса копируются в память процесса
+        result = model.load_state_dict(state, strict=False)
+    # Без strict проверяем сами: допустим только связанный с эмбеддингами выходной слой
+    missing = set(result.missing_keys) - {"lm_head.weight"}
+    if missing or result.unexpected_keys:
+        raise RuntimeError(f"Кэш {path} не соответствует конфигурации модели: "
+                           f"нет весов {sorted(missing)}, лишние веса {sorted(result.unexpected_keys)}. "
+                           f"Удалите каталог кэша")
+    model.tie_weights()
+    return tok, model
+
+
+def conv1d_to_linear(model):
+    """
+    Заменяет Conv1D из transformers на nn.Linear с теми же весами
+
+    GPT-2 хранит проекции внимания и MLP в Conv1D (веса (in, out)), а
+    динамическая квантизация torch работает только с nn.Linear.
+    """
+    import torch
+
+    try:
+        from transformers.pytorch_utils import Conv1D
+    except ImportError:
+        from transformers.modeling_utils import Conv1D
+
+    for module in list(model.modules()):
+        for name, child in list(module.named_children()):
+            if isinstance(child, Conv1D):
+                in_features, out_features = child.weight.shape
+                linear = torch.nn.Linear(in_features, out_features, bias=child.bias is not None)
+                with torch.no_grad():
+                    linear.weight.copy_(child.weight.t())
+                    if child.bias is not None:
+                        linear.bias.copy_(child.bias)
+                setattr(module, name, linear)
+    return model
+
+
+def quantize_model(model, mode: str):
+    """
+    Динамическая int8-квантизация линейных слоев (только CPU)
+
+    Веса хранятся в int8, активации квантуются на лету; выходной слой
+    (связан с эмбеддингами) квантуется только в режиме int8-head.
+    """
+    import torch
+
+    conv1d_to_linear(model)
+    if mode == "int8-head":
+        return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+    # Только слои блоков: lm_head остается в полной точности и связанным с эмбеддингами
+    layers = {name for name, module in model.named_modules()
+              if isinstance(module, torch.nn.Linear) and module is not model.get_output_embeddings()}
+    return torch.quantization.quantize_dynamic(model, layers, dtype=torch.qint8, inplace=True)
+
+
+def load_tokenizer_and_model(model_name_or_path: str, device: str = "cpu"):
+    """
+    Токенизатор и модель; загружаются один раз на процесс и переиспользуются
+
+    При первой загрузке модель сохраняется в кэш safetensors (MODEL_CACHE_DIR),
+    дальше все процессы читают её оттуда через mmap. Без пакета safetensors
+    или с пустым CHANT_MODEL_CACHE модель загружается через from_pretrained.
+    С set_quantization("int8") модель после загрузки квантуется (только CPU).
+
+    Args:
+        model_name_or_path: Имя модели Hugging Face или путь к обученной модели
+        device: Устройство torch ("cpu" или "cuda")
+    """
+    key = (model_name_or_path, device)
+    with _models_lock:
+        if key not in _models:
+            started = time.perf_counter()
+            import torch
+            from transformers import GPT2LMHeadModel
+            imported = time.perf_counter()
+
+            if _num_threads:
+                torch.set_num_threads(_num_threads)
+            if _quantize and device != "cpu":
+                raise ValueError(f"Квантизация {_quantize} поддерживается только на CPU, не на {device}")
+            stats = {"model": model_name_or_path, "device": device, "import": imported - started, "export": 0.0,
+                     "quantize": _quantize}
+            path = cached_model_path(model_name_or_path)
+            if path is not None:
+                stats["source"] = "cache"
+                if not _cache_is_fresh(model_name_or_path, path):
+                    logger.info(f"Сохранение {model_name_or_path} в кэш safetensors: {path}")
+                    if _export_to_cache(model_name_or_path, path):
+                        stats["source"] = "export"
+                    stats["export"] = time.perf_counter() - imported
+                loading = time.perf_counter()
+                tok, model = _load_from_cache(path)
+            else:
+                stats["source"] = "from_pretrained"
+                loading = time.perf_counter()
+                tok = _tokenizer_class().from_pretrained(model_name_or_path)
+                model = GPT2LMHeadModel.from_pretrained(model_name_or_path)
+            model = model.to(device)
+            model.eval()
+            stats["load"] = time.perf_counter() - loading
+            if _quantize:
+                quantizing = time.perf_counter()
+                model = quantize_model(model, _quantize)
+                stats["quantize_time"] = time.perf_counter() - quantizing
+            stats["total"] = time.perf_counter() - started
+            _models[key] = (tok, model)
+            _load_stats[key] = stats
+            logger.info(f"Модель {model_name_or_path} загружена на {device} за {stats['total']:.1f}s "
+                        f"(импорт {stats['import']:.1f}s, кэш {stats['export']:.1f}s, "
+                        f"веса {stats['load']:.1f}s из {stats['source']}, квантизация {_quantize or 'нет'}; потоков torch: {torch.get_num_threads()})")
+        return _models[key]
+
+
+def get_load_stats() -> List[Dict]:
+    """Время импорта torch/transformers, сохранения в кэш и загрузки весов для моделей процесса"""
+    with _models_lock:
+        return [dict(stats) for stats in _load_stats.values()]
+
+
+def unload_model(model_name_or_path: str, device: str = "cpu") -> bool:
+    """Освобождает память модели; следующий запрос загрузит её заново"""
+    with _models_lock:
+        _load_stats.pop((model_name_or_path, device), None)
+        return _models.pop((model_name_or_path, device), None) is not None
+
+
+def generate_batch(model, tok, batch_ids: List[List[int]], max_new_tokens: int = DEFAULT_NUM_PREDICT,
+                   device: str = "cpu", **kwargs) -> List[List[int]]:
+    """
+    Продолжения нескольких последовательностей токенов одним вызовом model.generate
+
+    Последовательности разной длины дополняются слева (attention_mask скрывает
+    дополнение), чтобы генерация у всех начиналась с последней позиции.
+
+    Returns:
+        Новые токены каждой последовательности без входных токенов и хвоста после EOS
+    """
+    import torch
+
+    params = dict(GENERATE_DEFAULTS, **kwargs)
+    pad = tok.eos_token_id
+    width = max(len(ids) for ids in batch_ids)
+    input_ids = torch.tensor([[pad] * (width - len(ids)) + list(ids) for ids in batch_ids], device=device)
+    attention_mask = torch.tensor([[0] * (width - len(ids)) + [1] * len(ids) for ids in batch_ids],
+                                  device=device)
+    with torch.no_grad():
+        out = model.generate(
+            input_ids,
+            attention_mask=attention_mask,
+            max_length=width + max_new_tokens,
+            pad_token_id=pad,
+            **params
+        )
+    results = []
+    for row in out.tolist():
+        new_ids = row[width:]
+        # Закончившие раньше последовательности дополнены EOS до общей длины
+        if pad in new_ids:
+            new_ids = new_ids[:new_ids.index(pad)]
+        results.append(new_ids)
+    return results
+
+
+def generate_ids(model, tok, input_ids: List[int], max_new_tokens: int = DEFAULT_NUM_PREDICT,
+                 device: str = "cpu", **kwargs) -> List[int]:
+    """Продолжение одной последовательности токенов (без входных токенов)"""
+    return generate_batch(model, tok, [input_ids], max_new_tokens, device, **kwargs)[0]
+
+
+class PromptTokenCache:
+    """
+    Токены промптов для одного токенизатора
+
+    Закрепленные промпты (мантры) кодируются заранее и не вытесняются,
+    остальные хранятся в LRU. Токены - кортежи, общие для всех запросов.
+
+    Args:
+        tok: Токенизатор
+        pinned: Промпты, которые кодируются сразу и хранятся всегда
+        max_size: Сколько прочих промптов хранить (0 - не хранить)
+    """
+
+    def __init__(self, tok, pinned: Iterable[str] = (), max_size: int = DEFAULT_TOKEN_CACHE_SIZE):
+        self.tok = tok
+        self.max_size = max_size
+        self._pinned: Dict[str, Tuple[int, ...]] = {}
+        self._recent: "OrderedDict[str, Tuple[int, ...]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.encode_calls = 0
+        self.pin(pinned)
+
+    def _encode_all(self, prompts: Sequence[str]) -> List[Tuple[int, ...]]:
+        """Один вызов пакетного кодирования токенизатора"""
+        self.encode_calls += 1
+        return [tuple(ids) for ids in self.tok.batch_encode_plus(list(prompts))["input_ids"]]
+
+    def pin(self, prompts: Iterable[str]):
+        """Кодирует и закрепляет промпты"""
+        with self._lock:
+            missing = list(dict.fromkeys(prompt for prompt in prompts if prompt not in self._pinned))
+            if missing:
+                self._pinned.update(zip(missing, self._encode_all(missing)))
+
+    def encode_batch(self, prompts: Sequence[str]) -> List[Tuple[int, ...]]:
+        """Токены промптов; отсутствующие в кэше кодируются вместе одним вызовом"""
+        with self._lock:
+            found: Dict[str, Tuple[int, ...]] = {}
+            for prompt in prompts:
+                ids = self._pinned.get(prompt)
+                if ids is None:
+                    ids = self._recent.get(prompt)
+                    if ids is not None:
+                        self._recent.move_to_end(prompt)
+                if ids is not None:
+                    found[prompt] = ids
+            missing = list(dict.fromkeys(prompt for prompt in prompts if prompt not in found))
+            misses = sum(1 for prompt in prompts if prompt not in found)
+            self.misses += misses
+            self.hits += len(prompts) - misses
+            if missing:
+                for prompt, ids in zip(missing, self._encode_all(missing)):
+                    found[prompt] = ids
+                    if self.max_size > 0:
+                        self._recent[prompt] = ids
+                while len(self._recent) > self.max_size:
+                    self._recent.popitem(last=False)
+            return [found[prompt] for prompt in prompts]
+
+    def encode(self, prompt: str) -> Tuple[int, ...]:
+        return self.encode_batch([prompt])[0]
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "pinned": len(self._pinned),
+                "cached": len(self._recent),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else None,
+                "encode_calls": self.encode_calls
+            }
+
+
+class BatchGenerator:
+    """
+    Динамический батчинг запросов к одной модели
+
+    Фоновый поток берет первый запрос из очереди, ждет попутчиков не дольше
+    max_wait и генерирует пакет одним вызовом model.generate. Вместе
+    генерируются только запросы с одинаковыми параметрами сэмплирования;
+    каждый получает свой результат через Future. Текстовые промпты пакета
+    кодируются вместе через кэш токенизатора.
+
+    Args:
+        model, tok: Модель и токенизатор
+        device: Устройство torch
+        max_batch_size: Максимум запросов в пакете
+        max_wait: Сколько ждать следующих запросов после первого (с)
+        token_cache: Кэш токенов промптов (по умолчанию - свой, без закрепленных промптов)
+    """
+
+    def __init__(self, model, tok, device: str = "cpu", max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+                 max_wait: float = DEFAULT_BATCH_WAIT, token_cache: Optional[PromptTokenCache] = None):
+        self.model = model
+        self.tok = tok
+        self.token_cache = token_cache or PromptTokenCache(tok)
+        self.device = device
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue: queue.Queue = queue.Queue()
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.requests = 0
+        self.tokens = 0
+        self.generate_time = 0.0
+        self._thread = threading.Thread(target=self._loop, name="LocalBatcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, input_ids: List[int], max_new_tokens: int = DEFAULT_NUM_PREDICT, **kwargs) -> Future:
+        """Ставит запрос в очередь; Future вернет новые токены"""
+        future: Future = Future()
+        self._queue.put((list(input_ids), max_new_tokens, tuple(sorted(kwargs.items())), future, None))
+        return future
+
+    def submit_prompt(self, prompt: str, prefix: Sequence[int] = (), max_new_tokens: int = DEFAULT_NUM_PREDICT,
+                      **kwargs) -> Future:
+        """
+        Ставит в очередь текстовый промпт; он кодируется вместе с другими промптами пакета
+
+        Future вернет (входные токены с prefix, новые токены).
+        """
+        future: Future = Future()
+        self._queue.put((prompt, max_new_tokens, tuple(sorted(kwargs.items())), future, tuple(prefix)))
+        return future
+
+    def generate(self, input_ids: List[int], max_new_tokens: int = DEFAULT_NUM_PREDICT, **kwargs) -> List[int]:
+        """Синхронный вызов: ждет свой результат из пакета"""
+        return self.submit(input_ids, max_new_tokens, **kwargs).result()
+
+    def generate_prompt(self, prompt: str, prefix: Sequence[int] = (), max_new_tokens: int = DEFAULT_NUM_PREDICT,
+                        **kwargs) -> Tuple[List[int], List[int]]:
+        """Синхронный вызов для текстового промпта: (входные токены, новые токены)"""
+        return self.submit_prompt(prompt, prefix, max_new_tokens, **kwargs).result()
+
+    def close(self):
+        """Останавливает фоновый поток после уже поставленных запросов"""
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+
+    def _collect(self, first) -> List:
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)  # Остановка после текущего пакета
+                break
+            batch.append(item)
+        return batch
+
+    def _loop(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            groups: Dict[Tuple, List] = {}
+            for item in self._collect(first):
+                groups.setdefault(item[2], []).append(item)
+            for params, items in groups.items():
+                self._run(items, dict(params))
+
+    def _run(self, items: List, params: Dict):
+        started = time.perf_counter()
+        try:
+            # Промпты без токенов (prefix не None) - одним вызовом кэша токенизатора
+            encoded = iter(self.token_cache.encode_batch([item[0] for item in items if item[4] is not None]))
+            batch_ids = [item[0] if item[4] is None else list(item[4]) + list(next(encoded)) for item in items]
+            outputs = generate_batch(self.model, self.tok, batch_ids, max(item[1] for item in items),
+                                     self.device, **params)
+        except Exception as e:
+            for item in items:
+                item[3].set_exception(e)
+            return
+        elapsed = time.perf_counter() - started
+        tokens = 0
+        for (_, max_new_tokens, _, future, prefix), input_ids, new_ids in zip(items, batch_ids, outputs):
+            new_ids = new_ids[:max_new_tokens]
+            tokens += len(new_ids)
+            future.set_result(new_ids if prefix is None else (input_ids, new_ids))
+        with self._lock:
+            self.batches += 1
+            self.requests += len(items)
+            self.tokens += tokens
+            self.generate_time += elapsed
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {
+                "batches": self.batches,
+                "requests": self.requests,
+                "avg_batch_size": self.requests / self.batches if self.batches else None,
+                "tokens": self.tokens,
+                "tokens_per_second": self.tokens / self.generate_time if self.generate_time else None,
+                "token_cache": self.token_cache.get_stats()
+            }
+
+
+def generate(model, tok, text: str, max_length: int = 50, device: str = "cpu", **kwargs) -> List[str]:
+    """Генерация по тексту, как в actions/generate.py: возвращает тексты вместе с промптом"""
+    import torch
+
+    params = dict(GENERATE_DEFAULTS, **kwargs)
+    input_ids = tok.encode(text, return_tensors="pt").to(device)
+    with torch.no_grad():
+        out = model.generate(input_ids, max_length=max_length, **params)
+    return list(map(tok.decode, out))
+
+
+class LocalModel:
+    """
+    Модель в процессе, отвечающая на запросы в формате Ollama /api/generate
+
+    Одновременные запросы генерируются пакетами (BatchGenerator); при
+    max_batch_size=1 - по очереди. Ядра в любом случае использует сама torch.
+    """
+
+    def __init__(self, ref: str, device: str = "cpu", max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+                 max_wait: float = DEFAULT_BATCH_WAIT):
+        self.ref = ref
+        self.model_name_or_path = resolve_model(ref)
+        self.device = device
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._lock = threading.Lock()
+        self.batcher: Optional[BatchGenerator] = None
+        self.token_cache: Optional[PromptTokenCache] = None
+
+    def load(self) -> Tuple[Any, Any]:
+        tok, model = load_tokenizer_and_model(self.model_name_or_path, self.device)
+        with self._lock:
+            if self.token_cache is None or self.token_cache.tok is not tok:
+                self.token_cache = PromptTokenCache(tok, _preloaded_prompts)
+            if self.max_batch_size > 1 and (self.batcher is None or self.batcher.model is not model):
+                if self.batcher is not None:
+                    self.batcher.close()
+                self.batcher = BatchGenerator(model, tok, self.device, self.max_batch_size, self.max_wait,
+                                              self.token_cache)
+        return tok, model
+
+    def unload(self):
+        """Выгружает модель и останавливает батчинг"""
+        unload_model(self.model_name_or_path, self.device)
+        with self._lock:
+            if self.batcher is not None:
+                self.batcher.close()
+                self.batcher = None
+
+    def generate(self, payload: Dict) -> Dict:
+        """Ответ в формате Ollama: response, context и статистика в наносекундах"""
+        started = time.perf_counter_ns()
+        if payload.get("keep_alive") == 0 and not payload.get("prompt"):
+            self.unload()
+            return self._reply(payload, "", [], 0, started, started, done_reason="unload")
+        tok, model = self.load()
+        loaded = time.perf_counter_ns()
+        prompt = payload.get("prompt")
+        if not prompt:
+            # Запрос без промпта только загружает модель (прогрев)
+            return self._reply(payload, "", [], 0, started, loaded, load_duration=loaded - started)
+
+        options = payload.get("options") or {}
+        prefix = list(payload.get("context") or [])
+        kwargs = {key: options[key] for key in ("temperature", "top_p", "top_k", "repetition_penalty")
+                  if key in options}
+        num_predict = options.get("num_predict") or options.get("max_tokens") or DEFAULT_NUM_PREDICT
+        eval_started = time.perf_counter_ns()
+        if self.batcher is not None:
+            input_ids, output_ids = self.batcher.generate_prompt(prompt, prefix, num_predict, **kwargs)
+        else:
+            input_ids = prefix + list(self.token_cache.encode(prompt))
+            with self._lock:
+                output_ids = generate_ids(model, tok, input_ids, num_predict, self.device, **kwargs)
+        text = tok.decode(output_ids)
+        return self._reply(payload, text, input_ids + output_ids, len(output_ids), started, eval_started,
+                           prompt_eval_count=len(input_ids), load_duration=loaded - started)
+
+    def _reply(self, payload: Dict, text: str, context: List[int], eval_count: int,
+               started: int, eval_started: int, **extra) -> Dict:
+        now = time.perf_counter_ns()
+        return dict({
+            "model": payload.get("model", self.ref),
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "response": text,
+            "done": True,
+            "context": context,
+            "total_duration": now - started,
+            "eval_count": eval_count,
+            "eval_duration": now - eval_started
+        }, **extra)
+
+
+def get_local_model(ref: str, device: str = "cpu") -> LocalModel:
+    """Общий LocalModel на процесс: все сессии делят модель и очередь генерации"""
+    key = (ref, device)
+    with _local_models_lock:
+        if key not in _local_models:
+            _local_models[key] = LocalModel(ref, device, _batching["max_batch_size"], _batching["max_wait"])
+        return _local_models[key]
+
+
+class LocalAdapter(BaseAdapter):
+    """
+    Транспорт requests для адресов local://: запрос обслуживает LocalModel
+
+    local://rugptsmall/api/generate, local://sberbank-ai/rugpt3small_based_on_gpt2/api/generate,
+    local:///models/armysmall/api/generate (путь к обученной модели).
+    """
+
+    ENDPOINTS = ("/api/generate", "/api/tags")
+
+    def __init__(self, device: str = "cpu"):
+        super().__init__()
+        self.device = device
+
+    @classmethod
+    def split_url(cls, url: str) -> Tuple[str, str]:
+        """(модель, endpoint) из адреса local://"""
+        parts = urlsplit(url)
+        path = parts.netloc + parts.path
+        for endpoint in cls.ENDPOINTS:
+            if path.endswith(endpoint):
+                return path[:-len(endpoint)].rstrip("/"), endpoint
+        return path.rstrip("/"), ""
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        ref, endpoint = self.split_url(request.url)
+        model = get_local_model(ref, self.device)
+        try:
+            if endpoint == "/api/tags":
+                return self._response(request, 200, {"models": [{"name": model.ref,
+                                                                 "model": model.model_name_or_path}]})
+            if endpoint != "/api/generate" or request.method != "POST":
+                return self._response(request, 404, {"error": f"{request.method} {endpoint} не поддерживается"})
+            payload = json.loads(request.body or b"{}")
+            result = model.generate(payload)
+        except ImportError as e:
+            return self._response(request, 500, {"error": f"Нет зависимостей локальной модели: {e}"})
+        except Exception as e:
+            logger.error(f"Ошибка локальной модели {ref}: {e}")
+            return self._response(request, 500, {"error": str(e)})
+
+        if payload.get("stream", True):
+            return self._stream_response(request, result)
+        return self._response(request, 200, result)
+
+    def _stream_response(self, request, result: Dict) -> requests.Response:
+        """
+        NDJSON как у Ollama: текст по словам, затем итоговый чанк со статистикой
+
+        Поток собирается после генерации всего ответа: время до первого токена
+        равно времени ответа, а закрытие потока генерацию не прерывает.
+        """
+        lines = []
+        words = result["response"].split(" ")
+        for i, word in enumerate(words):
+            piece = word if i == len(words) - 1 else word + " "
+            if piece:
+                lines.append({"model": result["model"], "response": piece, "done": False})
+        lines.append(dict(result, response=""))
+        body = "".join(json.dumps(line, ensure_ascii=False) + "\n" for line in lines)
+        return self._build(request, 200, body.encode("utf-8"), "application/x-ndjson")
+
+    def _response(self, request, status: int, body: Dict) -> requests.Response:
+        return self._build(request, status, json.dumps(body, ensure_ascii=False).encode("utf-8"),
+                           "application/json")
+
+    @staticmethod
+    def _build(request, status: int, data: bytes, content_type: str) -> requests.Response:
+        response = requests.Response()
+        response.status_code = status
+        response.reason = "OK" if status == 200 else "Error"
+        response.headers["Content-Type"] = content_type
+        response.headers["Content-Length"] = str(len(data))
+        response.raw = io.BytesIO(data)
+        response.encoding = "utf-8"
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+def is_local(url: str) -> bool:
+    return url.startswith(LOCAL_SCHEME)
+
+
+_context_limits: Dict[str, int] = {}
+
+
+def context_limit(url: str) -> Optional[int]:
+    """Окно модели local:// в токенах (n_positions из конфига); None для Ollama"""
+    if not is_local(url):
+        return None
+    ref = LocalAdapter.split_url(url)[0]
+    if ref not in _context_limits:
+        from transformers import GPT2Config
+
+        source = resolve_model(ref)
+        path = cached_model_path(source)
+        config_source = path if path is not None and _cache_is_fresh(source, path) else source
+        _context_limits[ref] = GPT2Config.from_pretrained(config_source).n_positions
+    return _context_limits[ref]
+
+
+def mount(session: requests.Session, device: str = "cpu") -> requests.Session:
+    """Добавляет сессии транспорт для адресов local://"""
+    session.mount(LOCAL_SCHEME, LocalAdapter(device))
+    return session
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Logging Setup - неблокирующее логирование для горячих циклов чантинга
+Потоки только кладут записи в очередь; запись в файл с ротацией и сжатием
+выполняет фоновый QueueListener. Строки о каждом чанте можно прореживать.
+"""
+
+import atexit
+import gzip
+import itertools
+import logging
+import logging.handlers
+import os
+import queue
+import shutil
+import sys
+from typing import Optional
+
+DEFAULT_MAX_BYTES = 10 * 1024 * 1024
+DEFAULT_BACKUP_COUNT = 5
+
+# Признак строки о каждом чанте: logger.info(..., extra=CHANT_LINE)
+CHANT_LINE = {"chant_line": True}
+
+
+class ChantSampler(logging.Filter):
+    """
+    Пропускает одну из every строк о чантах; остальные записи не трогает
+
+    Строка о чанте помечается extra=CHANT_LINE. Предупреждения и ошибки
+    пропускаются всегда.
+    """
+
+    def __init__(self, every: int = 1):
+        super().__init__()
+        self.every = max(1, every)
+        self._counter = itertools.count()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.every == 1 or record.levelno >= logging.WARNING:
+            return True
+        if not getattr(record, "chant_line", False):
+            return True
+        return next(self._counter) % self.every == 0
+
+
+def _gzip_namer(name: str) -> str:
+    return name + ".gz"
+
+
+def _gzip_rotator(source: str, dest: str):
+    """Сжимает закрытый файл лога при ротации (выполняется в потоке QueueListener)"""
+    with open(source, 'rb') as src, gzip.open(dest, 'wb') as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(source)
+
+
+def make_file_handler(log_file: str, max_bytes: int = DEFAULT_MAX_BYTES,
+                      backup_count: int = DEFAULT_BACKUP_COUNT, when: Optional[str] = None,
+                      compress: bool = False) -> logging.Handler:
+    """
+    Файловый обработчик с ротацией по размеру или по времени
+
+    Args:
+        log_file: Путь к файлу лога
+        max_bytes: Размер файла для ротации (0 - без ротации по размеру)
+        backup_count: Сколько старых файлов хранить
+        when: Ротация по времени ("midnight", "H", ...) вместо ротации по размеру
+        compress: Сжимать старые файлы gzip
+    """
+    if when:
+        handler = logging.handlers.TimedRotatingFileHandler(log_file, when=when, backupCount=backup_count,
+                                                            encoding='utf-8')
+    else:
+        handler = logging.handlers.RotatingFileHandler(log_file, maxBytes=max_bytes, backupCount=backup_count,
+                                                       encoding='utf-8')
+    if compress:
+        handler.namer = _gzip_namer
+        handler.rotator = _gzip_rotator
+    return handler
+
+
+def setup_logging(log_file: str, fmt: str = '%(asctime)s - %(levelname)s - %(message)s',
+                  level: int = logging.INFO, max_bytes: int = DEFAULT_MAX_BYTES,
+                  backup_count: int = DEFAULT_BACKUP_COUNT, when: Optional[str] = None,
+                  compress: bool = False, sample_every: int = 1,
+                  stream=None) -> logging.handlers.QueueListener:
+    """
+    Настраивает корневой логгер: QueueHandler в потоках, файл и консоль в фоновом потоке
+
+    Returns:
+        Запущенный QueueListener (останавливается автоматически при выходе)
+    """
+    formatter = logging.Formatter(fmt)
+    file_handler = make_file_handler(log_file, max_bytes, backup_count, when, compress)
+    console_handler = logging.StreamHandler(stream or sys.stderr)
+    for handler in (file_handler, console_handler):
+        handler.setFormatter(formatter)
+
+    # Очередь без ограничения: поток чантинга никогда не ждет запись на диск
+    log_queue: queue.Queue = queue.Queue(-1)
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    # Прореживание до постановки в очередь, чтобы лишние строки ничего не стоили
+    queue_handler.addFilter(ChantSampler(sample_every))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    listener = logging.handlers.QueueListener(log_queue, file_handler, console_handler,
+                                              respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+def add_logging_arguments(parser, default_file: str):
+    """Общие аргументы командной строки для логирования"""
+    parser.add_argument("--log-file", default=default_file, help="Файл лога")
+    parser.add_argument("--log-max-bytes", type=int, default=DEFAULT_MAX_BYTES,
+                        help="Размер файла лога для ротации (байт)")
+    parser.add_argument("--log-backups", type=int, default=DEFAULT_BACKUP_COUNT,
+                        help="Сколько старых файлов лога хранить")
+    parser.add_argument("--log-rotate-when",
+                        help="Ротация по времени вместо размера (midnight, H, ...)")
+    parser.add_argument("--log-compress", action="store_true", help="Сжимать старые файлы лога gzip")
+    parser.add_argument("--log-sample", type=int, default=1,
+                        help="Писать в лог одну из N строк о чантах")
+
+
+def setup_logging_from_args(args, fmt: str, stream=None) -> logging.handlers.QueueListener:
+    """setup_logging по аргументам из add_logging_arguments"""
+    return setup_logging(args.log_file, fmt, max_bytes=args.log_max_bytes, backup_count=args.log_backups,
+                         when=args.log_rotate_when, compress=args.log_compress,
+                         sample_every=args.log_sample, stream=stream)
@@ -0,0 +1,20 @@
+#!/usr/bin/env python3
+"""
+Mantras - махамантры на всех поддерживаемых языках
+Общий справочник для многопоточного и asyncio режимов чантинга
+"""
+
+MANTRAS = {
+    "russian": "Харе Кришна Харе Кришна Кришна Кришна Харе Харе Харе Рама Харе Рама Рама Рама Харе Харе",
+    "russianscsm": "Харей Кришна Харей Кришна Кришна Кришна Харей Харе Харей Рама Харей Рама Рама Рама Харей Харе",
+    "thai": "ฮาเร กฤษณะ ฮาเร กฤษณะ กฤษณะ กฤษณะ ฮาเร ฮาเร ฮาเร ราม ฮาเร ราม ราม ราม ฮาเร ฮาเร",
+    "harkonnen": "Ḥāre Kṛṣṇa Ḥāre Kṛṣṇa Kṛṣṇa Kṛṣṇa Ḥāre Ḥāre Ḥāre Rāma Ḥāre Rāma Rāma Rāma Ḥāre Ḥāre",
+    "atreides": "Hāre Kṛṣṇa Hāre Kṛṣṇa Kṛṣṇa Kṛṣṇa Hāre Hāre Hāre Rāma Hāre Rāma Rāma Rāma Hāre Hāre",
+    "freemen": "Ḥāre Kṛṣṇa Ḥāre Kṛṣṇa Kṛṣṇa Kṛṣṇa Ḥāre Ḥāre Ḥāre Rāma Ḥāre Rāma Rāma Rāma Ḥāre Ḥāre"
+}
+
+# Языки потоков по умолчанию (по одному потоку на язык)
+DEFAULT_LANGUAGES = ["russianscsm", "thai", "harkonnen"]
+
+# Язык, используемый для неизвестных языков
+FALLBACK_LANGUAGE = "russianscsm"
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+Metrics - метрики системы чантинга в текстовом формате Prometheus
+Гистограммы задержек по потокам и языкам, токены в секунду, частота чантов и запросов, ошибки
+"""
+
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_METRICS_PORT = 9108
+
+# Границы корзин гистограмм задержки (с): от быстрых ответов из кэша до медленной генерации на CPU
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Границы корзин скорости генерации (токенов в секунду)
+TOKEN_RATE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    """Базовая метрика с набором меток"""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Sequence[str]) -> Tuple[str, ...]:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name}: ожидаются метки {self.labelnames}, получено {tuple(labels)}")
+        return tuple(str(label) for label in labels)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        return lines + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    """Монотонно растущий счетчик"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, labels: Sequence[str] = (), amount: float = 1.0):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def set(self, labels: Sequence[str] = (), value: float = 0.0):
+        """Устанавливает значение (для счетчиков, которые ведутся в другом месте)"""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def get(self, labels: Sequence[str] = ()) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in items]
+
+
+class Gauge(Counter):
+    """Значение, которое может расти и уменьшаться"""
+
+    kind = "gauge"
+
+
+class Histogram(Metric):
+    """Гистограмма с накопительными корзинами, суммой и количеством"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._series: Dict[Tuple[str, ...], List] = {}  # ключ -> [счетчики корзин, сумма, количество]
+
+    def observe(self, labels: Sequence[str], value: float):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, [list(s[0]), s[1], s[2]]) for key, s in self._series.items())
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class ChantMetrics:
+    """Метрики рабочих потоков чантинга (общие для потокового и asyncio режимов)"""
+
+    def __init__(self):
+        worker_labels = ("worker", "language")
+        kind_labels = ("worker", "language", "kind")
+        self.requests = Counter("chant_requests_total", "Вызовы модели по типу (chant, cursor)", kind_labels)
+        self.errors = Counter("chant_errors_total", "Неудачные вызовы модели по типу", kind_labels)
+        self.preempted = Counter("chant_preempted_total", "Чанты, прерванные запросом курсора", worker_labels)
+        self.repetitions = Counter("chant_repetitions_total", "Засчитанные повторения мантры", worker_labels)
+        self.eval_tokens = Counter("chant_eval_tokens_total", "Сгенерированные токены (eval_count)", kind_labels)
+        self.eval_seconds = Counter("chant_eval_seconds_total", "Время генерации по данным Ollama (eval_duration)",
+                                    kind_labels)
+        self.token_rate = Histogram("chant_tokens_per_second", "Скорость генерации eval_count / eval_duration",
+                                    kind_labels, TOKEN_RATE_BUCKETS)
+        self.queue_wait = Histogram("chant_cursor_queue_wait_seconds", "Ожидание запроса курсора в очереди",
+                                    worker_labels)
+        self.backend = Histogram("chant_backend_seconds", "Время вызова модели", kind_labels)
+        self.total = Histogram("chant_cursor_total_seconds", "Время запроса курсора от постановки в очередь до ответа",
+                               worker_labels)
+        self.queue_size = Gauge("chant_cursor_queue_size", "Запросы курсора в очереди потока", worker_labels)
+        self.cache = Counter("chant_cache_events_total", "Попадания и промахи кэша ответов", ("event",))
+        self._metrics: List[Metric] = [
+            self.requests, self.errors, self.preempted, self.repetitions, self.eval_tokens, self.eval_seconds,
+            self.token_rate, self.queue_wait, self.backend, self.total, self.queue_size, self.cache
+        ]
+
+    @staticmethod
+    def _labels(worker) -> Tuple[str, str]:
+        return str(worker.thread_id), worker.language
+
+    def _observe_eval(self, labels: Tuple[str, ...], result: Optional[Dict]):
+        """Токены в секунду по eval_count и eval_duration ответа Ollama"""
+        if not result:
+            return
+        tokens, duration = result.get("eval_count"), result.get("eval_duration")
+        if tokens is None or not duration:
+            return
+        self.eval_tokens.inc(labels, tokens)
+        self.eval_seconds.inc(labels, duration / 1e9)
+        self.token_rate.observe(labels, tokens / (duration / 1e9))
+
+    def observe_chant(self, worker, elapsed: float, repetitions: int, result: Optional[Dict]):
+        """Успешный чант"""
+        labels = self._labels(worker) + ("chant",)
+        self.requests.inc(labels)
+        self.backend.observe(labels, elapsed)
+        self.repetitions.inc(self._labels(worker), repetitions)
+        self._observe_eval(labels, result)
+
+    def observe_cursor(self, worker, queue_wait: float, backend_time: float, total_time: float,
+                       result: Optional[Dict]):
+        """Обработанный запрос курсора"""
+        labels = self._labels(worker) + ("cursor",)
+        self.requests.inc(labels)
+        self.queue_wait.observe(self._labels(worker), queue_wait)
+        self.backend.observe(labels, backend_time)
+        self.total.observe(self._labels(worker), total_time)
+        self._observe_eval(labels, result)
+
+    def observe_error(self, worker, kind: str):
+        """Неудачный вызов модели"""
+        self.errors.inc(self._labels(worker) + (kind,))
+
+    def observe_preempted(self, worker):
+        """Прерванный чант"""
+        self.preempted.inc(self._labels(worker))
+
+    def render(self, workers: Iterable = (), cache=None) -> str:
+        """Текст для /metrics; мгновенные значения снимаются в момент запроса"""
+        for worker in workers:
+            queue = worker.request_queue
+            self.queue_size.set(self._labels(worker), queue.qsize() if queue else 0)
+        if cache is not None:
+            stats = cache.get_stats()
+            for event in ("hits", "disk_hits", "misses", "evictions"):
+                self.cache.set((event,), stats[event])
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    """GET /metrics в текстовом формате Prometheus"""
+
+    def log_message(self, format, *args):
+        logger.debug(f"Metrics {self.address_string()} {format % args}")
+
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        data = render_manager_metrics(self.server.manager).encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def render_manager_metrics(manager) -> str:
+    """Метрики менеджера чантинга (ChantManager или AsyncChantManager)"""
+    return manager.metrics.render(list(manager.workers.values()), manager.response_cache)
+
+
+class MetricsServer(ThreadingHTTPServer):
+    """Локальный HTTP-сервер метрик для Prometheus"""
+
+    daemon_threads = True
+
+    def __init__(self, manager, port: int = DEFAULT_METRICS_PORT, host: str = "127.0.0.1"):
+        super().__init__((host, port), MetricsRequestHandler)
+        self.manager = manager
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/metrics"
+
+    def start(self):
+        """Запуск сервера в фоновом потоке"""
+        self._thread = threading.Thread(target=self.serve_forever, name="MetricsServer", daemon=True)
+        self._thread.start()
+        logger.info(f"Метрики Prometheus: {self.url}")
+        return self
+
+    def stop(self):
+        """Остановка сервера"""
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Ollama Client - общий пул keep-alive HTTP-соединений к серверам Ollama
+Все рабочие потоки переиспользуют одну requests.Session на каждый backend
+"""
+
+import json
+import threading
+import time
+import logging
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from local_backend import is_local, mount as mount_local
+
+logger = logging.getLogger(__name__)
+
+# Размер пула соединений на один backend по умолчанию
+DEFAULT_POOL_SIZE = 10
+
+# Таймауты запросов (с): соединение с живым сервером устанавливается быстро,
+# а генерация на CPU может идти долго - упавший сервер не должен держать поток 30 секунд
+DEFAULT_CONNECT_TIMEOUT = 3.05
+DEFAULT_READ_TIMEOUT = 30.0
+DEFAULT_TIMEOUT = (DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT)
+
+# Параметры генерации рабочих потоков чантинга (входят в ключ кэша ответов)
+GENERATION_OPTIONS = {
+    "temperature": 0.7,
+    "top_p": 0.9,
+    "max_tokens": 100
+}
+
+
+class GenerationCancelled(Exception):
+    """Генерация прервана до завершения (например, ради запроса курсора)"""
+
+
+_sessions: Dict[str, requests.Session] = {}
+_sessions_lock = threading.Lock()
+
+
+def get_session(base_url: str, pool_size: int = DEFAULT_POOL_SIZE) -> requests.Session:
+    """
+    Возвращает общую сессию с пулом соединений для backend'а
+
+    Сессия создается один раз на URL и разделяется всеми потоками.
+    pool_block=True ограничивает число сокетов размером пула: лишние
+    потоки ждут свободное соединение, а не открывают новое и не оставляют
+    его в TIME_WAIT после закрытия.
+
+    Args:
+        base_url: URL Ollama сервера
+        pool_size: Максимальное число соединений к этому серверу
+                   (учитывается только при первом создании сессии)
+
+    Returns:
+        requests.Session, общая для всех вызывающих
+    """
+    key = base_url.rstrip('/')
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            if is_local(key):
+                mount_local(session)  # Модель в процессе (local_backend.py)
+            _sessions[key] = session
+            logger.debug(f"Создан пул соединений для {key} (размер {pool_size})")
+        return session
+
+
+def close_all_sessions():
+    """Закрывает все сессии и их соединения"""
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+
+def read_generate_stream(response: requests.Response, started: float,
+                         on_token: Optional[Callable[[str], None]] = None,
+                         cancel: Optional[threading.Event] = None) -> Tuple[str, Dict[str, Any], Dict[str, Any]]:
+    """
+    Читает потоковый ответ /api/generate (NDJSON) по мере поступления чанков
+
+    Args:
+        response: Ответ, полученный с stream=True
+        started: Момент отправки запроса (time.perf_counter())
+        on_token: Вызывается с каждым фрагментом текста сразу при получении
+        cancel: Если событие установлено, чтение прерывается на следующем чанке
+
+    Raises:
+        GenerationCancelled: Если генерация прервана через cancel. Вызывающий
+            закрывает ответ, и Ollama прекращает генерацию по разрыву соединения.
+
+    Returns:
+        (полный текст, тайминги, последний чанк с done=True и статистикой Ollama)
+    """
+    parts = []
+    gaps = []
+    first_token_at = None
+    last_token_at = None
+    final: Dict[str, Any] = {}
+
+    for line in response.iter_lines():
+        if cancel is not None and cancel.is_set():
+            raise GenerationCancelled()
+        if not line:
+            continue
+        chunk = json.loads(line)
+        if 'error' in chunk:
+            raise RuntimeError(f"Ollama: {chunk['error']}")
+
+        token = chunk.get('response', '')
+        if token:
+            now = time.perf_counter()
+            if first_token_at is None:
+                first_token_at = now
+            else:
+                gaps.append(now - last_token_at)
+            last_token_at = now
+            parts.append(token)
+            if on_token:
+                on_token(token)
+
+        if chunk.get('done'):
+            final = chunk
+            break
+
+    timing = {
+        "ttft": first_token_at - started if first_token_at is not None else None,
+        "inter_token_avg": sum(gaps) / len(gaps) if gaps else None,
+        "inter_token_max": max(gaps) if gaps else None,
+        "chunks": len(parts),
+        "total": time.perf_counter() - started
+    }
+    return ''.join(parts), timing, final
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Response Cache - кэш ответов модели на повторяющиеся запросы курсора
+LRU в памяти с TTL и необязательный уровень на диске (sqlite), переживающий перезапуск
+"""
+
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_SIZE = 256
+DEFAULT_CACHE_TTL = 600.0
+
+
+def make_key(model: str, prompt: str, options: Optional[Dict] = None) -> str:
+    """Ключ кэша: модель, промпт и параметры генерации"""
+    raw = json.dumps([model, prompt, options or {}], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class DiskTier:
+    """Уровень кэша на диске: sqlite-таблица ключ -> (срок годности, ответ)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS responses "
+                         "(key TEXT PRIMARY KEY, expires_at REAL, value TEXT)")
+        # Просроченные записи прошлых запусков не нужны
+        self._db.execute("DELETE FROM responses WHERE expires_at < ?", (time.time(),))
+        self._db.commit()
+
+    def get(self, key: str) -> Optional[Tuple[float, Dict]]:
+        with self._lock:
+            row = self._db.execute("SELECT expires_at, value FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        return row[0], json.loads(row[1])
+
+    def put(self, key: str, expires_at: float, value: Dict):
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?)",
+                             (key, expires_at, json.dumps(value, ensure_ascii=False)))
+            self._db.commit()
+
+    def delete(self, key: str):
+        with self._lock:
+            self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._db.commit()
+
+    def size(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class ResponseCache:
+    """
+    Потокобезопасный LRU-кэш ответов с TTL
+
+    Время хранения считается по wall-clock (time.time), чтобы записи на диске
+    сохраняли срок годности между перезапусками.
+
+    Args:
+        max_entries: Максимум записей в памяти (вытесняются давно не использованные)
+        ttl: Время жизни записи в секундах
+        disk_path: Файл sqlite для уровня на диске (None - только память)
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_CACHE_SIZE, ttl: float = DEFAULT_CACHE_TTL,
+                 disk_path: Optional[str] = None):
+        if max_entries < 1:
+            raise ValueError("Размер кэша должен быть больше 0")
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, Dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.disk = DiskTier(disk_path) if disk_path else None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Ответ из кэша или None; попадание на диске поднимается в память"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._entries[key]
+                self.expirations += 1
+
+        entry = self.disk.get(key) if self.disk else None
+        with self._lock:
+            if entry is not None and entry[0] > now:
+                self._store(key, entry)
+                self.hits += 1
+                self.disk_hits += 1
+                return entry[1]
+            self.misses += 1
+        if entry is not None:
+            self.disk.delete(key)
+        return None
+
+    def put(self, key: str, value: Dict):
+        """Сохраняет ответ в памяти и на диске"""
+        entry = (time.time() + self.ttl, value)
+        with self._lock:
+            self._store(key, entry)
+        if self.disk:
+            self.disk.put(key, *entry)
+
+    def _store(self, key: str, entry: Tuple[float, Dict]):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def close(self):
+        """Закрывает уровень на диске"""
+        if self.disk:
+            self.disk.close()
+
+    def get_stats(self) -> Dict:
+        """Счетчики попаданий и промахов"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            stats = {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else None,
+                "evictions": self.evictions,
+                "expirations": self.expirations
+            }
+        if self.disk:
+            stats["disk_size"] = self.disk.size()
+        return stats
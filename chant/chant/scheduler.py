@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Scheduler - взвешенный справедливый планировщик времени backend'а
+Делит время модели между чантингом и запросами курсора по chant_ratio / cursor_ratio
+"""
+
+import threading
+from typing import Dict, Iterable, Optional
+
+from circuit_breaker import backoff_delay
+
+CHANT = "chant"
+CURSOR = "cursor"
+
+# Минимальная пауза между чантами после неудачи (с) и её предел при сбоях подряд
+CHANT_INTERVAL = 0.1
+MAX_CHANT_BACKOFF = 10.0
+
+# Минимальный вес: класс с нулевым коэффициентом не должен голодать полностью
+MIN_WEIGHT = 1e-3
+
+
+def failure_pause(failures: int) -> float:
+    """
+    Пауза после failures неудачных чантов подряд
+
+    Доля времени от неудачи не спасает: запрос, отклоненный мгновенно (HTTP 4xx),
+    дал бы почти нулевую паузу, поэтому пауза растет экспоненциально от CHANT_INTERVAL.
+    """
+    return max(CHANT_INTERVAL, backoff_delay(failures, CHANT_INTERVAL, MAX_CHANT_BACKOFF))
+
+
+class WeightedScheduler:
+    """
+    Планировщик по виртуальному времени (weighted fair queuing)
+
+    Каждый класс работы накапливает виртуальное время = время backend'а / вес.
+    Из классов, у которых есть работа, выбирается класс с наименьшим виртуальным
+    временем, поэтому при постоянной нагрузке обоих классов доли времени модели
+    сходятся к заданным весам. Класс, вернувшийся после простоя, не получает
+    "долг" за время простоя: его виртуальное время подтягивается к активным.
+    """
+
+    def __init__(self, weights: Dict[str, float]):
+        self.weights = {kind: max(weight, MIN_WEIGHT) for kind, weight in weights.items()}
+        self.targets = dict(weights)
+        self.virtual_time = {kind: 0.0 for kind in weights}
+        self.backend_time = {kind: 0.0 for kind in weights}
+        self.counts = {kind: 0 for kind in weights}
+        self._backlogged = set()
+        self._lock = threading.Lock()
+
+    def choose(self, ready: Iterable[str]) -> Optional[str]:
+        """
+        Выбирает следующий класс работы
+
+        Args:
+            ready: Классы, у которых сейчас есть работа
+
+        Returns:
+            Класс для выполнения или None, если работы нет
+        """
+        ready = [kind for kind in ready if kind in self.weights]
+        with self._lock:
+            if not ready:
+                self._backlogged.clear()
+                return None
+
+            active = [self.virtual_time[kind] for kind in ready if kind in self._backlogged]
+            floor = min(active) if active else min(self.virtual_time[kind] for kind in ready)
+            for kind in ready:
+                if kind not in self._backlogged:
+                    self.virtual_time[kind] = max(self.virtual_time[kind], floor)
+            self._backlogged = set(ready)
+
+            return min(ready, key=lambda kind: self.virtual_time[kind])
+
+    def charge(self, kind: str, elapsed: float):
+        """Учитывает время backend'а, потраченное на класс работы"""
+        with self._lock:
+            self.backend_time[kind] += elapsed
+            self.virtual_time[kind] += elapsed / self.weights[kind]
+            self.counts[kind] += 1
+
+    def should_preempt(self, running: str, arriving: str) -> bool:
+        """
+        Нужно ли прервать выполняющуюся работу ради пришедшей
+
+        Пришедший после простоя класс догоняет выполняющийся и вытесняет его;
+        класс, уже превысивший свою долю, ждет своей очереди.
+        """
+        with self._lock:
+            arriving_time = self.virtual_time[arriving]
+            if arriving not in self._backlogged:
+                arriving_time = max(arriving_time, self.virtual_time[running])
+            return arriving_time <= self.virtual_time[running]
+
+    def pause_after(self, kind: str, elapsed: float) -> float:
+        """
+        Пауза после работы класса, чтобы он один не занимал больше своей доли
+
+        При доле 0.8 после чанта длительностью 1с модель отдыхает 0.25с:
+        оставшиеся 20% времени остаются свободными для запросов курсора.
+        """
+        share = min(max(self.targets.get(kind, 1.0), MIN_WEIGHT), 1.0)
+        return elapsed * (1.0 - share) / share
+
+    def get_stats(self) -> Dict:
+        """Целевые и фактические доли времени backend'а"""
+        with self._lock:
+            total = sum(self.backend_time.values())
+            weight_sum = sum(self.targets.values())
+            return {
+                "target": {kind: (weight / weight_sum if weight_sum > 0 else 0.0)
+                           for kind, weight in self.targets.items()},
+                "achieved": {kind: (spent / total if total > 0 else 0.0)
+                             for kind, spent in self.backend_time.items()},
+                "backend_time": dict(self.backend_time),
+                "counts": dict(self.counts)
+            }
@@ -0,0 +1,381 @@
+#!/usr/bin/env python3
+"""
+Supervisor - процессы чантинга по конфигу chant/config/config.json
+Для каждого экземпляра из "instances" запускается process_count процессов со своим
+циклом чантинга. Статистика собирается через очередь multiprocessing, упавшие
+процессы перезапускаются. Процессы не делят GIL и загружают все ядра.
+"""
+
+import logging
+import logging.handlers
+import multiprocessing
+import os
+import queue
+import signal
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from config_loader import config_path, load_json
+from local_backend import LOCAL_SCHEME, MODEL_TYPES, QUANTIZE_MODES, is_local, set_num_threads, set_quantization
+from mantras import DEFAULT_LANGUAGES
+from logging_setup import ChantSampler, add_logging_arguments, setup_logging_from_args
+
+# Процессы запускаются через spawn: родитель уже держит потоки логирования
+_context = multiprocessing.get_context("spawn")
+
+LOG_FORMAT = '%(asctime)s - %(processName)s - %(levelname)s - %(message)s'
+logger = logging.getLogger(__name__)
+
+INSTANCES_CONFIG = config_path("config.json")
+
+# Модель Ollama для типа экземпляра, если не задана в конфиге или через --model
+DEFAULT_MODEL = "mozgach:latest"
+
+# Как часто процесс отправляет статистику (с)
+REPORT_INTERVAL = 2.0
+
+# Задержка перезапуска упавшего процесса (с), удваивается при частых падениях
+RESTART_DELAY = 1.0
+MAX_RESTART_DELAY = 60.0
+
+# Пауза после неудачного чанта, чтобы недоступный сервер не крутил цикл впустую (с)
+ERROR_BACKOFF = 1.0
+
+# Процесс, проработавший дольше, считается стабильным: задержка сбрасывается
+STABLE_UPTIME = 60.0
+
+# Счетчики ChantCounter, которые суммируются по процессам
+SUMMED_STATS = ("calls", "repetitions", "rounds", "lost_calls", "lost_repetitions")
+
+
+@dataclass
+class InstanceConfig:
+    """Экземпляр из config.json: тип модели и число процессов"""
+    type: str
+    process_count: int
+    model: Optional[str] = None
+    url: Optional[str] = None
+
+
+@dataclass
+class WorkerSpec:
+    """Параметры одного процесса чантинга (передаются в дочерний процесс)"""
+    name: str
+    type: str
+    model: str
+    url: str
+    language: str
+    interval: float = 0.0
+    repetitions: int = 1
+    log_sample: int = 1
+    local_threads: Optional[int] = None  # Потоков torch, если модель работает в процессе
+    local_quantize: Optional[str] = None  # Квантизация модели в процессе (int8, int8-head)
+
+
+@dataclass
+class ChildState:
+    """Процесс чантинга глазами супервизора"""
+    spec: WorkerSpec
+    process: Optional[multiprocessing.process.BaseProcess] = None
+    started: float = 0.0
+    restarts: int = 0
+    restart_at: Optional[float] = None
+    delay: float = RESTART_DELAY
+    last_exitcode: Optional[int] = None
+    stats: Dict[int, Dict] = field(default_factory=dict)  # pid -> последняя статистика процесса
+
+
+def load_instances(path: str = INSTANCES_CONFIG) -> List[InstanceConfig]:
+    """
+    Экземпляры из config.json
+
+    process_count в конфиге записан строкой; висячие запятые допускаются.
+    """
+    instances = []
+    for item in load_json(path).get("instances", []):
+        count = int(item.get("process_count", 1))
+        if count < 0:
+            raise ValueError(f"process_count не может быть отрицательным: {item}")
+        instances.append(InstanceConfig(item["type"], count, item.get("model"), item.get("url")))
+    return instances
+
+
+def _setup_child_logging(log_queue, sample_every: int):
+    """Записи дочернего процесса уходят в очередь, их пишет QueueListener родителя"""
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    handler = logging.handlers.QueueHandler(log_queue)
+    handler.addFilter(ChantSampler(sample_every))
+    root.addHandler(handler)
+    root.setLevel(logging.INFO)
+
+
+def run_worker(spec: WorkerSpec, stats_queue, log_queue, stop_event):
+    """Цикл чантинга в дочернем процессе"""
+    _setup_child_logging(log_queue, spec.log_sample)
+    set_num_threads(spec.local_threads)
+    set_quantization(spec.local_quantize)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Остановкой управляет супервизор
+
+    from chant_mantra import ChantMantra
+
+    chanter = ChantMantra(spec.url, spec.model, spec.language, pool_size=1)
+    chanter.preload_local_prompts([spec.repetitions])
+    last_report = time.monotonic()
+    while not stop_event.is_set():
+        result = chanter.send_mantra(spec.repetitions)
+        if time.monotonic() - last_report >= REPORT_INTERVAL:
+            stats_queue.put((spec.name, os.getpid(), chanter.counter.get_stats()))
+            last_report = time.monotonic()
+        if "error" in result:
+            # Разомкнутый автомат защиты подсказывает, когда серверы снова примут запрос
+            stop_event.wait(max(spec.interval, ERROR_BACKOFF, result.get("retry_after", 0)))
+        elif spec.interval:
+            stop_event.wait(spec.interval)
+    stats_queue.put((spec.name, os.getpid(), chanter.counter.get_stats()))
+
+
+class Supervisor:
+    """
+    Запускает и перезапускает процессы чантинга
+
+    Args:
+        instances: Экземпляры из config.json
+        url: URL Ollama сервера по умолчанию
+        models: Модель Ollama по типу экземпляра
+        languages: Языки процессов (по кругу внутри экземпляра)
+        interval: Пауза между чантами в процессе (с)
+        repetitions: Повторений мантры за один вызов модели
+        log_sample: Писать в лог одну из N строк о чантах
+        local: Модель в процессе (local://ТИП) вместо Ollama для экземпляров без url
+        local_threads: Потоков torch на процесс (по умолчанию ядра делятся между процессами)
+        local_quantize: Квантизация модели в процессе (None - полная точность)
+        log_handlers: Обработчики, в которые пишутся записи дочерних процессов
+
+    Raises:
+        ValueError: С local есть экземпляр без url, тип которого не поддерживается local://
+    """
+
+    def __init__(self, instances: List[InstanceConfig], url: str = "http://localhost:11434",
+                 models: Optional[Dict[str, str]] = None, languages: Optional[List[str]] = None,
+                 interval: float = 0.0, repetitions: int = 1, log_sample: int = 1, log_handlers: Tuple = (),
+                 local: bool = False, local_threads: Optional[int] = None,
+                 local_quantize: Optional[str] = None):
+        models = models or {}
+        languages = languages or list(DEFAULT_LANGUAGES)
+        if local:
+            unsupported = sorted({instance.type for instance in instances if not instance.url
+                                  and instance.process_count and instance.type not in MODEL_TYPES
+                                  and not os.path.isdir(instance.type)})
+            if unsupported:
+                raise ValueError(f"Типы {unsupported} не поддерживаются local://, доступны {list(MODEL_TYPES)} "
+                                 f"или путь к обученной модели; укажите для этих экземпляров url или уберите их")
+        total = sum(instance.process_count for instance in instances)
+        # Процессы с моделью в процессе делят ядра, чтобы потоки torch не конкурировали
+        local_threads = local_threads or max(1, (os.cpu_count() or 1) // max(1, total))
+        self.children: List[ChildState] = []
+        for instance in instances:
+            for i in range(instance.process_count):
+                worker_url = instance.url or (f"{LOCAL_SCHEME}{instance.type}" if local else url)
+                spec = WorkerSpec(
+                    name=f"{instance.type}-{i + 1}",
+                    type=instance.type,
+                    model=models.get(instance.type) or instance.model or DEFAULT_MODEL,
+                    url=worker_url,
+                    language=languages[i % len(languages)],
+                    interval=interval,
+                    repetitions=repetitions,
+                    log_sample=log_sample,
+                    local_threads=local_threads if is_local(worker_url) else None,
+                    local_quantize=local_quantize if is_local(worker_url) else None
+                )
+                self.children.append(ChildState(spec))
+
+        self.stats_queue = _context.Queue()
+        self.log_queue = _context.Queue()
+        self.stop_event = _context.Event()
+        self.log_listener = logging.handlers.QueueListener(self.log_queue, *log_handlers,
+                                                           respect_handler_level=True)
+        self.running = False
+
+    def start(self):
+        """Запуск всех процессов"""
+        logger.info(f"Запуск {len(self.children)} процессов чантинга...")
+        self.log_listener.start()
+        self.running = True
+        for child in self.children:
+            self._spawn(child)
+
+    def _spawn(self, child: ChildState):
+        process = _context.Process(target=run_worker, name=child.spec.name,
+                                   args=(child.spec, self.stats_queue, self.log_queue, self.stop_event))
+        process.start()
+        child.process = process
+        child.started = time.monotonic()
+        child.restart_at = None
+        logger.info(f"Запущен процесс {child.spec.name} (pid {process.pid}, модель {child.spec.model}, "
+                    f"язык {child.spec.language})")
+
+    def poll(self):
+        """Собирает статистику и перезапускает упавшие процессы"""
+        self._drain_stats()
+        if not self.running:
+            return
+        now = time.monotonic()
+        for child in self.children:
+            process = child.process
+            if child.restart_at is not None:
+                if now >= child.restart_at:
+                    child.restarts += 1
+                    self._spawn(child)
+                continue
+            if process is None or process.is_alive():
+                continue
+            child.last_exitcode = process.exitcode
+            # Частые падения - растущая задержка, чтобы не перезапускать процесс в цикле
+            if now - child.started >= STABLE_UPTIME:
+                child.delay = RESTART_DELAY
+            child.restart_at = now + child.delay
+            logger.warning(f"Процесс {child.spec.name} завершился с кодом {process.exitcode}, "
+                           f"перезапуск через {child.delay:.0f}s")
+            child.delay = min(child.delay * 2, MAX_RESTART_DELAY)
+
+    def _drain_stats(self):
+        by_name = {child.spec.name: child for child in self.children}
+        while True:
+            try:
+                name, pid, stats = self.stats_queue.get_nowait()
+            except queue.Empty:
+                return
+            by_name[name].stats[pid] = stats
+
+    def stop(self, timeout: float = 10.0):
+        """Остановка всех процессов: сначала по событию, затем принудительно"""
+        logger.info("Остановка процессов чантинга...")
+        self.running = False
+        self.stop_event.set()
+        deadline = time.monotonic() + timeout
+        for child in self.children:
+            if child.process is not None:
+                child.process.join(max(0.0, deadline - time.monotonic()))
+                if child.process.is_alive():
+                    logger.warning(f"Процесс {child.spec.name} не остановился, завершаю принудительно")
+                    child.process.terminate()
+                    child.process.join(5)
+        self._drain_stats()
+        self.log_listener.stop()
+        logger.info("Процессы чантинга остановлены.")
+
+    def get_status(self) -> Dict:
+        """Статистика по типам экземпляров и процессам"""
+        status: Dict = {"running": self.running, "instances": {}}
+        for child in self.children:
+            instance = status["instances"].setdefault(child.spec.type, {
+                "processes": 0, "alive": 0, "restarts": 0, "repetitions_per_second": 0.0,
+                **{key: 0 for key in SUMMED_STATS}, "workers": {}
+            })
+            alive = child.process is not None and child.process.is_alive()
+            instance["processes"] += 1
+            instance["alive"] += alive
+            instance["restarts"] += child.restarts
+            # Счетчики перезапущенных процессов тоже учитываются; скорость - только живого
+            for stats in child.stats.values():
+                for key in SUMMED_STATS:
+                    instance[key] += stats[key]
+            current = child.stats.get(child.process.pid) if alive else None
+            if current and current["repetitions_per_second"]:
+                instance["repetitions_per_second"] += current["repetitions_per_second"]
+            instance["workers"][child.spec.name] = {
+                "pid": child.process.pid if child.process else None,
+                "alive": alive,
+                "language": child.spec.language,
+                "restarts": child.restarts,
+                "last_exitcode": child.last_exitcode,
+                "chanting": current
+            }
+        return status
+
+
+def parse_models(items: List[str]) -> Dict[str, str]:
+    """["rugptsmall=mozgach:latest"] -> {"rugptsmall": "mozgach:latest"}"""
+    models = {}
+    for item in items:
+        instance_type, sep, model = item.partition("=")
+        if not sep:
+            raise ValueError(f"Ожидается ТИП=МОДЕЛЬ: {item}")
+        models[instance_type] = model
+    return models
+
+
+def main():
+    """Основная функция"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Процессы чантинга по экземплярам из config.json")
+    parser.add_argument("--config", default=INSTANCES_CONFIG, help="Конфиг с экземплярами (instances)")
+    parser.add_argument("--url", default="http://localhost:11434", help="URL Ollama сервера")
+    parser.add_argument("--model", nargs="+", default=[], metavar="ТИП=МОДЕЛЬ",
+                        help=f"Модель Ollama для типа экземпляра (по умолчанию {DEFAULT_MODEL})")
+    parser.add_argument("--languages", nargs="+", default=DEFAULT_LANGUAGES,
+                        help="Языки процессов (по кругу внутри экземпляра)")
+    parser.add_argument("--interval", type=float, default=0.0, help="Пауза между чантами в процессе (с)")
+    parser.add_argument("--repetitions", type=int, default=1, help="Повторений мантры за один вызов модели")
+    parser.add_argument("--local", action="store_true",
+                        help="Генерация в процессе на CPU (local://ТИП) вместо Ollama")
+    parser.add_argument("--local-threads", type=int,
+                        help="Потоков torch на процесс (по умолчанию ядра делятся между процессами)")
+    parser.add_argument("--local-quantize", choices=QUANTIZE_MODES,
+                        help="int8-квантизация модели в процессе (меньше памяти на процесс)")
+    parser.add_argument("--status-interval", type=float, default=30.0, help="Период вывода статуса (с)")
+
+    add_logging_arguments(parser, 'chant_supervisor.log')
+
+    args = parser.parse_args()
+    listener = setup_logging_from_args(args, LOG_FORMAT)
+
+    instances = load_instances(args.config)
+    total = sum(instance.process_count for instance in instances)
+    print(f"🕉️ Экземпляров: {len(instances)}, процессов: {total} (ядер: {os.cpu_count()})")
+    if not total:
+        print("❌ В конфиге нет процессов для запуска")
+        sys.exit(1)
+
+    try:
+        supervisor = Supervisor(instances, args.url, parse_models(args.model), args.languages,
+                                args.interval, args.repetitions, args.log_sample, listener.handlers,
+                                args.local, args.local_threads, args.local_quantize)
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+
+    def handle_signal(signum, frame):
+        supervisor.running = False
+
+    signal.signal(signal.SIGINT, handle_signal)
+    signal.signal(signal.SIGTERM, handle_signal)
+
+    supervisor.start()
+    last_status = time.monotonic()
+    try:
+        while supervisor.running:
+            time.sleep(0.5)
+            supervisor.poll()
+            if time.monotonic() - last_status >= args.status_interval:
+                last_status = time.monotonic()
+                for instance_type, stats in supervisor.get_status()["instances"].items():
+                    logger.info(f"{instance_type}: процессов {stats['alive']}/{stats['processes']}, "
+                                f"чантов {stats['calls']}, повторений {stats['repetitions']}, "
+                                f"ошибок {stats['lost_calls']}, перезапусков {stats['restarts']}")
+    finally:
+        supervisor.stop()
+        status = supervisor.get_status()
+        for instance_type, stats in status["instances"].items():
+            print(f"🏁 {instance_type}: чантов {stats['calls']}, повторений {stats['repetitions']}, "
+                  f"перезапусков {stats['restarts']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -10,11 +10,16 @@ import json
 import threading
 from typing import Optional
 
+from ollama_client import read_generate_stream
+from load_generator import LoadGenerator, OllamaTarget, FrontendTarget, ARRIVALS, parse_language_mix
+
 class CursorRequestTester:
     """Тестер для отправки запросов от курсора"""
     
-    def __init__(self, base_url: str = "http://localhost:11434"):
+    def __init__(self, base_url: str = "http://localhost:11434", stream: bool = False):
         self.base_url = base_url
+        self.stream = stream  # Потоковый вывод ответа с замером времени до первого токена
+        self.timings = []
         
         # Запросы на разных языках из списка системы чантинга
         self.test_requests = {
@@ -56,7 +61,7 @@ class CursorRequestTester:
             payload = {
                 "model": "mozgach:latest",
                 "prompt": request,
-                "stream": False,
+                "stream": self.stream,
                 "options": {
                     "temperature": 0.7,
                     "top_p": 0.9,
@@ -64,6 +69,22 @@ class CursorRequestTester:
                 }
             }
             
+            if self.stream:
+                print("✅ Получен ответ: ", end='', flush=True)
+                started = time.perf_counter()
+                with requests.post(f"{self.base_url}/api/generate", json=payload, timeout=30,
+                                   stream=True) as response:
+                    response.raise_for_status()
+                    _, timing, _ = read_generate_stream(
+                        response, started, lambda token: print(token, end='', flush=True))
+                print()
+                self.timings.append(timing)
+                ttft = f"{timing['ttft'] * 1000:.0f}ms" if timing['ttft'] is not None else "n/a"
+                itl = (f"{timing['inter_token_avg'] * 1000:.1f}ms"
+                       if timing['inter_token_avg'] is not None else "n/a")
+                print(f"⏱️  TTFT: {ttft}, межтокенная задержка: {itl}, всего: {timing['total']:.2f}s")
+                return True
+            
             response = requests.post(f"{self.base_url}/api/generate", json=payload, timeout=30)
             response.raise_for_status()
             
@@ -149,6 +170,51 @@ class CursorRequestTester:
                 
         print("🏁 Пакетное тестирование завершено")
         
+    def run_load_test(self, rate: float = 5.0, duration: float = 30.0, concurrency: int = 10,
+                      arrival: str = "poisson", language_mix: Optional[dict] = None,
+                      target: str = "ollama", seed: Optional[int] = None) -> dict:
+        """
+        Нагрузочное тестирование с открытым циклом
+        
+        Запросы отправляются по расписанию, не дожидаясь ответов на предыдущие,
+        поэтому при перегрузке растут очереди и задержка. Задержка считается от
+        запланированного момента отправки (поправка на coordinated omission).
+        
+        Args:
+            rate: Средняя частота запросов в секунду
+            duration: Длительность отправки (с)
+            concurrency: Максимум одновременных запросов
+            arrival: "poisson" или "fixed"
+            language_mix: Веса языков, например {"thai": 2, "harkonnen": 1}
+            target: "ollama" (напрямую) или "frontend" (HTTP front-end системы чантинга)
+            seed: Зерно для воспроизводимого расписания
+        """
+        print(f"📈 Нагрузочный тест: {rate} запросов/с ({arrival}), {duration}s, "
+              f"до {concurrency} одновременно, цель: {target} {self.base_url}")
+        print("-" * 60)
+        
+        if target == "frontend":
+            sender = FrontendTarget(self.base_url, concurrency)
+        else:
+            sender = OllamaTarget(self.base_url, pool_size=concurrency)
+        generator = LoadGenerator(sender, self.test_requests, rate, duration, concurrency,
+                                  arrival, language_mix, seed)
+        report = generator.run(lambda sent, total: print(f"📤 Отправлено {sent}/{total}"))
+        
+        def fmt(value):
+            return f"{value * 1000:.0f}ms" if value is not None else "n/a"
+        
+        latency, service = report["latency"], report["service_time"]
+        print("-" * 60)
+        print(f"✅ Успешно {report['ok']} из {report['sent']}, статусы: {report['statuses']}")
+        print(f"📊 Пропускная способность: {report['throughput']:.2f} ответов/с")
+        print(f"⏱️  Задержка (от расписания): p50 {fmt(latency['p50'])}, p90 {fmt(latency['p90'])}, "
+              f"p99 {fmt(latency['p99'])}, p99.9 {fmt(latency['p99.9'])}, max {fmt(latency['max'])}")
+        print(f"⏱️  Время обслуживания: p50 {fmt(service['p50'])}, p99 {fmt(service['p99'])}")
+        for language, stats in report["per_language"].items():
+            print(f"🌍 {language}: {stats['count']} ответов, p50 {fmt(stats['p50'])}, p99 {fmt(stats['p99'])}")
+        return report
+        
     def run_interactive_test(self):
         """Интерактивное тестирование"""
         print("🎮 Интерактивное тестирование")
@@ -212,7 +278,7 @@ def main():
     
     parser = argparse.ArgumentParser(description="Тестирование запросов от курсора")
     parser.add_argument("--url", default="http://localhost:11434", help="URL Ollama сервера")
-    parser.add_argument("--mode", choices=["continuous", "burst", "interactive"], 
+    parser.add_argument("--mode", choices=["continuous", "burst", "interactive", "load"], 
                        default="interactive", help="Режим тестирования")
     parser.add_argument("--interval", type=float, default=5.0, 
                        help="Интервал между запросами (для continuous режима)")
@@ -220,17 +286,42 @@ def main():
                        help="Размер пакета (для burst режима)")
     parser.add_argument("--delay", type=float, default=0.5, 
                        help="Задержка между запросами в пакете (для burst режима)")
+    parser.add_argument("--stream", action="store_true",
+                       help="Потоковый вывод ответа с замером времени до первого токена")
+    
+    parser.add_argument("--rate", type=float, default=5.0,
+                       help="Запросов в секунду (для load режима)")
+    parser.add_argument("--duration", type=float, default=30.0,
+                       help="Длительность нагрузки в секундах (для load режима)")
+    parser.add_argument("--concurrency", type=int, default=10,
+                       help="Максимум одновременных запросов (для load режима)")
+    parser.add_argument("--arrival", choices=ARRIVALS, default="poisson",
+                       help="Поток запросов: пуассоновский или с фиксированной частотой (для load режима)")
+    parser.add_argument("--language-mix", nargs="+",
+                       help="Веса языков, например thai=2 harkonnen=1 (для load режима)")
+    parser.add_argument("--target", choices=["ollama", "frontend"], default="ollama",
+                       help="Ollama напрямую или HTTP front-end системы чантинга (для load режима)")
+    parser.add_argument("--seed", type=int,
+                       help="Зерно для воспроизводимого расписания запросов (для load режима)")
+    parser.add_argument("--json", help="Сохранить отчет load режима в JSON-файл")
     
     args = parser.parse_args()
     
     # Создаем тестер
-    tester = CursorRequestTester(args.url)
+    tester = CursorRequestTester(args.url, args.stream)
     
     # Запускаем выбранный режим
     if args.mode == "continuous":
         tester.run_continuous_test(args.interval)
     elif args.mode == "burst":
         tester.run_burst_test(args.burst_size, args.delay)
+    elif args.mode == "load":
+        mix = parse_language_mix(args.language_mix) if args.language_mix else None
+        report = tester.run_load_test(args.rate, args.duration, args.concurrency, args.arrival, mix, args.target,
+                                     args.seed)
+        if args.json:
+            with open(args.json, 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
     else:  # interactive
         tester.run_interactive_test()
 
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Warmup - прогрев модели при запуске и управление keep_alive
+Модель загружается и прогревается мантрами потоков до того, как система сообщит о готовности
+"""
+
+import logging
+import time
+from typing import Dict, Iterable, Optional, Union
+
+import requests
+
+from ollama_client import DEFAULT_CONNECT_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+# Сколько Ollama держит модель в памяти после последнего запроса.
+# Передается с каждым запросом, пока идет чантинг.
+DEFAULT_KEEP_ALIVE = "30m"
+
+# Загрузка модели на CPU может занимать минуты
+WARMUP_TIMEOUT = 300
+
+KeepAlive = Union[str, int]
+
+
+def load_payload(model: str, keep_alive: KeepAlive) -> Dict:
+    """Запрос без промпта: Ollama только загружает модель в память"""
+    return {"model": model, "stream": False, "keep_alive": keep_alive}
+
+
+def parse_keep_alive(value: str) -> KeepAlive:
+    """Значение --keep-alive: число секунд ("-1" - навсегда) или длительность ("30m")"""
+    try:
+        return int(value)
+    except ValueError:
+        return value
+
+
+def prime_payload(model: str, prompt: str, keep_alive: KeepAlive) -> Dict:
+    """Прогрев промптом: обработка промпта и один токен ответа"""
+    return {
+        "model": model,
+        "prompt": prompt,
+        "stream": False,
+        "keep_alive": keep_alive,
+        "options": {"num_predict": 1}
+    }
+
+
+def unload_payload(model: str) -> Dict:
+    """keep_alive=0 выгружает модель сразу"""
+    return {"model": model, "keep_alive": 0}
+
+
+def summarize(load_time: Optional[float], primed: int, errors: int, started: float) -> Dict:
+    """Итог прогрева в одном формате для потокового и asyncio режимов"""
+    return {
+        "ready": errors == 0,
+        "load_time": load_time,
+        "primed": primed,
+        "errors": errors,
+        "elapsed": time.perf_counter() - started
+    }
+
+
+def warm_up(session: requests.Session, base_url: str, model: str, prompts: Iterable[str],
+            keep_alive: KeepAlive = DEFAULT_KEEP_ALIVE) -> Dict:
+    """
+    Загружает модель и прогревает её каждым промптом
+
+    Args:
+        session: Сессия с пулом соединений
+        base_url: URL Ollama сервера
+        model: Название модели
+        prompts: Промпты для прогрева (мантры потоков), повторы отбрасываются
+        keep_alive: Сколько держать модель в памяти
+
+    Returns:
+        Dict: ready, load_time (с), primed, errors, elapsed (с)
+    """
+    started = time.perf_counter()
+    url = f"{base_url}/api/generate"
+    try:
+        response = session.post(url, json=load_payload(model, keep_alive), timeout=(DEFAULT_CONNECT_TIMEOUT, WARMUP_TIMEOUT))
+        response.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        logger.error(f"Не удалось загрузить модель {model}: {e}")
+        return summarize(None, 0, 1, started)
+    load_time = time.perf_counter() - started
+
+    primed = errors = 0
+    for prompt in dict.fromkeys(prompts):
+        try:
+            response = session.post(url, json=prime_payload(model, prompt, keep_alive), timeout=(DEFAULT_CONNECT_TIMEOUT, WARMUP_TIMEOUT))
+            response.raise_for_status()
+            primed += 1
+        except requests.exceptions.RequestException as e:
+            logger.warning(f"Прогрев промптом не удался: {e}")
+            errors += 1
+    return summarize(load_time, primed, errors, started)
+
+
+def unload(session: requests.Session, base_url: str, model: str):
+    """Просит Ollama выгрузить модель (при остановке чантинга)"""
+    try:
+        session.post(f"{base_url}/api/generate", json=unload_payload(model), timeout=(DEFAULT_CONNECT_TIMEOUT, 10))
+    except requests.exceptions.RequestException as e:
+        logger.warning(f"Не удалось выгрузить модель {model}: {e}")
+
+
+def merge_summaries(per_backend: Dict[str, Dict]) -> Dict:
+    """
+    Итог прогрева пула серверов: модель готова, если загрузилась хотя бы на одном
+
+    Для одного сервера возвращается его итог без изменений.
+    """
+    if len(per_backend) == 1:
+        return next(iter(per_backend.values()))
+    load_times = [stats["load_time"] for stats in per_backend.values() if stats["load_time"] is not None]
+    return {
+        "ready": bool(per_backend) and all(stats["ready"] for stats in per_backend.values()),
+        "load_time": max(load_times) if load_times else None,
+        "primed": sum(stats["primed"] for stats in per_backend.values()),
+        "errors": sum(stats["errors"] for stats in per_backend.values()),
+        "elapsed": max((stats["elapsed"] for stats in per_backend.values()), default=0.0),
+        "backends": per_backend
+    }
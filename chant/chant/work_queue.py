@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Work Queue - очереди запросов курсора с поддержкой work stealing
+Свободный поток может забрать запрос из очереди загруженного соседа
+"""
+
+import asyncio
+from queue import Queue
+from typing import Callable, List, Optional
+
+from cursor_request import CursorRequest
+
+
+def can_steal(request: CursorRequest, thief) -> bool:
+    """
+    Может ли поток thief забрать запрос из чужой очереди
+
+    Запрос, отправленный в конкретный поток, не переносится. Запрос с указанным
+    языком переносится только в поток того же языка.
+    """
+    if request.thread_id is not None:
+        return False
+    return request.language is None or request.language == thief.language
+
+
+class StealableQueue(Queue):
+    """queue.Queue, из которой можно забрать самый старый подходящий запрос"""
+
+    def steal(self, predicate: Callable[[CursorRequest], bool]) -> Optional[CursorRequest]:
+        """Забирает самый старый запрос, для которого predicate истинен"""
+        with self.mutex:
+            for request in self.queue:
+                if predicate(request):
+                    self.queue.remove(request)
+                    self.not_full.notify()
+                    return request
+        return None
+
+
+class AsyncStealableQueue(asyncio.Queue):
+    """asyncio.Queue с той же операцией steal (вызывается внутри event loop)"""
+
+    def steal(self, predicate: Callable[[CursorRequest], bool]) -> Optional[CursorRequest]:
+        """Забирает самый старый запрос, для которого predicate истинен"""
+        for request in self._queue:
+            if predicate(request):
+                self._queue.remove(request)
+                return request
+        return None
+
+
+def find_victims(thief, peers) -> List:
+    """
+    Соседние потоки, у которых можно забрать работу, от самого загруженного
+
+    Сосед считается перегруженным, если он занят запросом курсора и в очереди
+    что-то ждет, либо в очереди больше одного запроса.
+    """
+    candidates = []
+    for peer in peers:
+        if peer is thief:
+            continue
+        depth = peer.request_queue.qsize()
+        if depth >= 2 or (depth >= 1 and peer.cursor_in_flight):
+            candidates.append((depth, peer))
+    candidates.sort(key=lambda item: item[0], reverse=True)
+    return [peer for _, peer in candidates]
+
+
+def steal_request(thief, peers) -> Optional[CursorRequest]:
+    """Забирает подходящий запрос у самого загруженного соседа"""
+    for victim in find_victims(thief, peers):
+        request = victim.request_queue.steal(lambda r: can_steal(r, thief))
+        if request is not None:
+            return request
+    return None
@@ -1,2 +1,3 @@
-pip install torch==1.4.0
-pip3 install transformers==3.5.0
\ No newline at end of file
+pip install "torch>=2.1"
+pip3 install "transformers>=4.36,<5"
+pip3 install "safetensors>=0.4"